@@ -0,0 +1,459 @@
+import argparse
+import itertools
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import columnar_archive
+import ndjson_log
+import turbidity_db
+from ingest_pipeline import SensorAnalytics
+
+# Backtest luật cảnh báo: phát lại ngữ nghĩa của SensorAnalytics.process (cảnh báo
+# tốc độ, đổi trạng thái, mức cảnh báo, xu hướng) cùng hàng đợi Telegram (gộp đợt, cooldown,
+# giới hạn tốc độ) và cooldown lệnh serial của GUI, nhưng tính bằng mảng NumPy trên toàn bộ
+# lịch sử thay vì từng mẫu.
+
+_LIVE = SensorAnalytics()
+DEFAULT_PARAMS = {
+    "rate_window": _LIVE.RATE_WINDOW_SEC,
+    "rate_slope": _LIVE.RATE_ALERT_SLOPE,
+    "rate_min_delta": _LIVE.RATE_MIN_DELTA,
+    "rate_min_points": _LIVE.RATE_MIN_POINTS,
+    "rate_cooldown": _LIVE.RATE_ALERT_COOLDOWN_SEC,
+    "trend_window": _LIVE.TREND_WINDOW_SEC,
+    "trend_slope": _LIVE.TREND_ALERT_SLOPE,
+    "thresholds": (10.0, 50.0, 100.0),  # ngưỡng mức cảnh báo 1/2/3 (cũng là ranh giới trạng thái)
+    "telegram_interval": 60,            # TurbiditySensorGUI.TELEGRAM_MIN_INTERVAL_SEC
+    "telegram_coalesce": 2.0,           # NotificationDispatcher: coalesce_sec
+    "telegram_rate_per_min": 20,        # NotificationDispatcher: rate_per_min / burst
+    "telegram_burst": 5,
+}
+COMMAND_COOLDOWN_SEC = 10  # TurbiditySensorGUI.send_serial_command: cùng một lệnh tối đa 1 lần/10 s
+
+
+# ====== Nạp dữ liệu ======
+def load_db(db_path=turbidity_db.DEFAULT_DB_PATH, archive_dir=columnar_archive.DEFAULT_ARCHIVE_DIR,
+            start_ms=0, end_ms=2 ** 62, chunk_size=200000):
+    """Trả về (t: giây float64, y: NTU float64) từ kho dạng cột + CSDL, tăng dần theo t."""
+    parts_t, parts_y = [], []
+    db_first = None
+    if os.path.exists(db_path):
+        conn = sqlite3.connect(db_path)
+        try:
+            db_first = turbidity_db.first_ts_ms(conn)
+            rows = turbidity_db.iter_samples(conn, start_ms, end_ms)
+            while True:
+                chunk = list(itertools.islice(rows, chunk_size))
+                if not chunk:
+                    break
+                arr = np.array([(r[0], r[2]) for r in chunk], dtype=np.float64)
+                parts_t.append(arr[:, 0] / 1000.0)
+                parts_y.append(arr[:, 1])
+        finally:
+            conn.close()
+    # Phần cũ hơn dữ liệu thô còn trong CSDL lấy từ kho lưu trữ
+    archive_end = end_ms if db_first is None else min(end_ms, db_first - 1)
+    if archive_end >= start_ms:
+        cold = list(columnar_archive.iter_range(start_ms, archive_end, archive_dir))
+        parts_t = [c["ts"] / 1000.0 for c in cold] + parts_t
+        parts_y = [c["turbidity"].astype(np.float64) for c in cold] + parts_y
+    return _finish(parts_t, parts_y)
+
+
+def load_json(path):
+    """Nạp turbidity_log.ndjson (mỗi dòng một bản ghi) hoặc turbidity_log.json (mảng)."""
+    with open(path, "r", encoding="utf-8") as f:
+        is_array = f.read(1) == "["
+    records = ndjson_log.iter_json_array(path) if is_array else ndjson_log.iter_records(path)
+    t, y = [], []
+    for rec in records:
+        try:
+            ts = turbidity_db.ts_to_ms(rec["timestamp"]) / 1000.0
+            turbidity = float(rec["turbidity"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        t.append(ts)
+        y.append(turbidity)
+    return _finish([np.array(t, dtype=np.float64)], [np.array(y, dtype=np.float64)])
+
+
+def _finish(parts_t, parts_y):
+    if not parts_t:
+        return np.empty(0), np.empty(0)
+    t = np.concatenate(parts_t)
+    y = np.concatenate(parts_y)
+    ok = np.isfinite(t) & np.isfinite(y)
+    t, y = t[ok], y[ok]
+    order = np.argsort(t, kind="stable")
+    return t[order], y[order]
+
+
+# ====== Hồi quy cửa sổ trượt cho mọi mẫu ======
+def window_regression(t, y, window_sec, chunk_size=4096):
+    """Với mỗi i: cửa sổ [t_i - window_sec, t_i] như SlidingRegression.
+
+    Trả về (left, slope) với left là chỉ số mẫu đầu cửa sổ, slope tính theo y/giây
+    (NaN khi cửa sổ < 2 mẫu). Tổng tiền tố Σt, Σy, Σt², Σty tính theo từng đoạn nhỏ
+    với t tương đối so với đầu đoạn: t² không bao giờ lớn nên hiệu hai tổng tiền tố
+    không mất chính xác như khi dùng timestamp epoch, và mảng tạm nằm gọn trong cache.
+    """
+    n_total = len(t)
+    left = np.searchsorted(t, t - window_sec, side="left")
+    slope = np.empty(n_total)
+    for start in range(0, n_total, chunk_size):
+        end = min(n_total, start + chunk_size)
+        lo = int(left[start])
+        x = t[lo:end] - t[lo]
+        yc = y[lo:end]
+        prefix = np.zeros((4, len(x) + 1))
+        np.cumsum(x, out=prefix[0, 1:])
+        np.cumsum(yc, out=prefix[1, 1:])
+        np.cumsum(x * x, out=prefix[2, 1:])
+        np.cumsum(x * yc, out=prefix[3, 1:])
+        win_left = left[start:end] - lo
+        win_end = np.arange(start - lo + 1, len(x) + 1)
+        sx, sy, sxx, sxy = prefix[:, win_end] - prefix[:, win_left]
+        n = (win_end - win_left).astype(np.float64)
+        mean_x = sx / n
+        den = np.maximum(sxx - sx * mean_x, 1e-9)
+        chunk_slope = (sxy - mean_x * sy) / den
+        chunk_slope[n < 2] = np.nan
+        slope[start:end] = chunk_slope
+    return left, slope
+
+
+# ====== Cooldown (phần tuần tự, chỉ chạy trên các sự kiện thưa) ======
+def apply_cooldown(times, cooldown, last=float("-inf")):
+    """Chỉ số các sự kiện được giữ: cách sự kiện được giữ trước đó >= cooldown (như code sống)."""
+    n = len(times)
+    j = int(np.searchsorted(times, last + cooldown, side="left"))
+    if j >= n:
+        return np.empty(0, dtype=np.int64)
+    # Con trỏ "sự kiện kế tiếp được phép" tính vector hóa; vòng lặp chỉ đi theo chuỗi con trỏ
+    nxt = np.maximum(np.searchsorted(times, times + cooldown, side="left"), np.arange(1, n + 1)).tolist()
+    kept = []
+    while j < n:
+        kept.append(j)
+        j = nxt[j]
+    return np.asarray(kept, dtype=np.int64)
+
+
+def telegram_delivered(skip_times, normal_times, p):
+    """Mô phỏng NotificationDispatcher trên một kênh (mã thiết bị).
+
+    - Tin thường bị bỏ ngay khi submit nếu kênh vừa *gửi* trong `telegram_interval` giây;
+      tin skip_cooldown luôn vào hàng chờ.
+    - Tin đầu tiên mở một đợt; đợt được gửi sau `telegram_coalesce` giây, hoặc muộn hơn khi
+      TokenBucket (`telegram_rate_per_min`/phút, dồn tối đa `telegram_burst`) chưa có lượt.
+      Mọi tin được nhận trước lúc gửi gộp chung thành một POST.
+    - Gửi coi như thành công ngay (không mô phỏng lỗi mạng/429).
+
+    `skip_times`/`normal_times` là thời điểm đã sắp xếp. Trả về (số POST, chỉ số các tin
+    thường được nhận vào một đợt đã gửi).
+    """
+    interval, coalesce = p["telegram_interval"], p["telegram_coalesce"]
+    refill = p["telegram_rate_per_min"] / 60.0
+    capacity = float(p["telegram_burst"])
+    tokens, filled_at = capacity, None  # bucket tạo đầy khi kênh có đợt đầu tiên
+    last_sent = float("-inf")
+    n_skip, n_normal = len(skip_times), len(normal_times)
+    i = j = 0  # con trỏ tin skip/thường chưa xét
+    posts = 0
+    accepted = []
+    while True:
+        # Tin mở đợt kế tiếp: tin skip sớm nhất hoặc tin thường đầu tiên đã qua cooldown
+        j = max(j, int(np.searchsorted(normal_times, last_sent + interval, side="left")))
+        if i >= n_skip and j >= n_normal:
+            break
+        first_at = min(skip_times[i] if i < n_skip else np.inf, normal_times[j] if j < n_normal else np.inf)
+        flush_at = first_at + coalesce
+        if filled_at is not None:
+            tokens = min(capacity, tokens + (flush_at - filled_at) * refill)
+        filled_at = flush_at
+        if tokens < 1.0:
+            flush_at += (1.0 - tokens) / refill
+            filled_at, tokens = flush_at, 1.0
+        tokens -= 1.0
+        # Cooldown chỉ tính từ lần gửi trước nên mọi tin tới trước flush_at đều vào đợt này
+        i = int(np.searchsorted(skip_times, flush_at, side="right"))
+        j_end = int(np.searchsorted(normal_times, flush_at, side="right"))
+        accepted.append(np.arange(j, j_end))
+        j = j_end
+        last_sent = flush_at
+        posts += 1
+    kept = np.concatenate(accepted) if accepted else np.empty(0, dtype=np.int64)
+    return posts, kept
+
+
+def commands_sent(times, kinds, cooldown=COMMAND_COOLDOWN_SEC):
+    """Lệnh serial sau khi lọc trùng: lệnh khác loại lệnh trước luôn gửi, cùng loại cách >= cooldown."""
+    sent = {}
+    if len(times) == 0:
+        return sent
+    change = np.flatnonzero(np.r_[True, kinds[1:] != kinds[:-1], True])
+    for a, b in zip(change[:-1], change[1:]):
+        kept = apply_cooldown(times[a:b], cooldown)
+        sent[kinds[a]] = sent.get(kinds[a], 0) + len(kept)
+    return sent
+
+
+# ====== Phát lại một bộ tham số ======
+def level_events(y, thresholds):
+    """(đổi trạng thái, cảnh báo rất đục, reset) theo ngưỡng mức 1/2/3 như SensorAnalytics.process."""
+    # Đổi trạng thái (skip_cooldown); mẫu đầu tiên luôn là "đổi" vì last_status_sent=None
+    l1, l2, l3 = thresholds
+    level = (y > l1).astype(np.int8) + (y > l2) + (y > l3)
+    status = level + (y >= 1)
+    status_change_idx = np.flatnonzero(np.r_[True, status[1:] != status[:-1]])
+
+    # Mức cảnh báo chỉ tăng, reset khi về 0 => trong mỗi đoạn giữa hai mẫu mức 0,
+    # "rất đục" (+ lệnh A) phát ở mẫu mức 3 đầu tiên; lệnh S ở mẫu 0 kết thúc đoạn có mức > 0
+    is_zero = level == 0
+    zero_idx = np.flatnonzero(is_zero)
+    lvl3_idx = np.flatnonzero(level == 3)
+    _, first = np.unique(np.cumsum(is_zero)[lvl3_idx], return_index=True)
+    very_high_idx = lvl3_idx[first]
+    reset_idx = zero_idx[np.diff(np.r_[-1, zero_idx]) > 1]
+    return status_change_idx, very_high_idx, reset_idx
+
+
+def serial_commands(t, very_high_idx, reset_idx, trend_idx):
+    # Thứ tự trong process(): lệnh theo mức cảnh báo (A/S) trước, lệnh xu hướng (A) sau
+    cmd_idx = np.concatenate([very_high_idx, reset_idx, trend_idx])
+    cmd_kind = np.concatenate([np.full(len(very_high_idx), "A"), np.full(len(reset_idx), "S"),
+                               np.full(len(trend_idx), "A")])
+    cmd_sub = np.concatenate([np.zeros(len(very_high_idx) + len(reset_idx)), np.ones(len(trend_idx))])
+    order = np.lexsort((cmd_sub, cmd_idx))
+    return commands_sent(t[cmd_idx[order]], cmd_kind[order])
+
+
+def _cached(cache, key, compute):
+    if cache is None:
+        return compute()
+    if key not in cache:
+        if len(cache) >= 16:
+            cache.clear()
+        cache[key] = compute()
+    return cache[key]
+
+
+def replay(t, y, params, rate=None, trend=None, cache=None):
+    """Đếm/ghi thời điểm các cảnh báo mà `params` sẽ phát ra trên chuỗi (t, y).
+
+    `rate`/`trend` là kết quả window_regression và `cache` là dict kết quả trung gian,
+    cả hai dùng chung được giữa nhiều bộ tham số trên cùng dữ liệu.
+    """
+    p = dict(DEFAULT_PARAMS, **params)
+    if rate is None:
+        rate = window_regression(t, y, p["rate_window"])
+    if trend is None:
+        trend = rate if p["trend_window"] == p["rate_window"] else window_regression(t, y, p["trend_window"])
+    n_samples = len(t)
+    if n_samples == 0:
+        return {"params": p, "samples": 0}
+
+    # Cảnh báo tốc độ ngắn hạn (skip_cooldown) + RATE_ALERT_COOLDOWN_SEC.
+    # Điều kiện số điểm và Δ cho tập ứng viên thưa, dùng lại cho mọi ngưỡng độ dốc.
+    left, slope = rate
+
+    def rate_candidates():
+        n_win = np.arange(1, n_samples + 1) - left
+        return np.flatnonzero((n_win >= max(2, p["rate_min_points"])) & ((y - y[left]) >= p["rate_min_delta"]))
+
+    cand_idx = _cached(cache, ("rate", p["rate_window"], p["rate_min_points"], p["rate_min_delta"]), rate_candidates)
+    cand_idx = cand_idx[slope[cand_idx] * 60.0 >= p["rate_slope"]]
+    # last_rate_alert_at khởi tạo 0.0 (epoch) trong code sống
+    rate_idx = cand_idx[apply_cooldown(t[cand_idx], p["rate_cooldown"], last=0.0)]
+
+    # Trạng thái/mức cảnh báo chỉ phụ thuộc ngưỡng, xu hướng chỉ phụ thuộc cửa sổ + độ dốc:
+    # dùng lại giữa các bộ tham số. Xu hướng: mỗi mẫu thỏa điều kiện => thông báo thường + lệnh A
+    status_change_idx, very_high_idx, reset_idx = _cached(
+        cache, ("levels", tuple(p["thresholds"])), lambda: level_events(y, p["thresholds"]))
+    with np.errstate(invalid="ignore"):
+        trend_idx = _cached(
+            cache, ("trend", p["trend_window"], p["trend_slope"]),
+            lambda: np.flatnonzero(trend[1] * 60.0 >= p["trend_slope"]))
+
+    # Telegram: tin skip (tốc độ, đổi trạng thái) và tin thường vào chung hàng chờ của kênh
+    skip_times = np.sort(np.concatenate([t[rate_idx], t[status_change_idx]]))
+    # (trong process(): "rất đục" trước "xu hướng")
+    normal_idx = np.concatenate([very_high_idx, trend_idx])
+    normal_is_trend = np.r_[np.zeros(len(very_high_idx), dtype=bool), np.ones(len(trend_idx), dtype=bool)]
+    order = np.lexsort((normal_is_trend, normal_idx))
+    normal_idx, normal_is_trend = normal_idx[order], normal_is_trend[order]
+    telegram_sent, sent = telegram_delivered(skip_times, t[normal_idx], p)
+
+    # Lệnh serial không phụ thuộc tham số cảnh báo tốc độ
+    commands = _cached(
+        cache, ("commands", tuple(p["thresholds"]), p["trend_window"], p["trend_slope"]),
+        lambda: serial_commands(t, very_high_idx, reset_idx, trend_idx))
+
+    return {
+        "params": p,
+        "samples": n_samples,
+        "rate_alerts": t[rate_idx],
+        "status_changes": len(status_change_idx),
+        "very_high_alerts": t[very_high_idx],
+        "trend_alerts": t[trend_idx],
+        "telegram_sent": telegram_sent,
+        "trend_alerts_sent": t[normal_idx[sent][normal_is_trend[sent]]],
+        "commands": commands,
+    }
+
+
+# ====== Lưới tham số trên nhiều lõi ======
+_worker_data = {}
+
+
+def _worker_init(data_dir):
+    # Mỗi tiến trình mở các mảng bằng memmap: không sao chép dữ liệu qua pickle
+    _worker_data["dir"] = data_dir
+    _worker_data["t"] = np.load(os.path.join(data_dir, "t.npy"), mmap_mode="r")
+    _worker_data["y"] = np.load(os.path.join(data_dir, "y.npy"), mmap_mode="r")
+
+
+def _regression_path(data_dir, window):
+    return os.path.join(data_dir, f"w{float(window):g}")
+
+
+def _worker_regression(window):
+    left, slope = window_regression(_worker_data["t"], _worker_data["y"], window)
+    base = _regression_path(_worker_data["dir"], window)
+    np.save(base + "_left.npy", left)
+    np.save(base + "_slope.npy", slope)
+    return window
+
+
+def _load_regression(window):
+    # Nạp hẳn vào bộ nhớ tiến trình (các phép so sánh chạy lại trên chúng cho mỗi bộ tham số)
+    loaded = _worker_data.setdefault("regressions", {})
+    if window not in loaded:
+        base = _regression_path(_worker_data["dir"], window)
+        loaded[window] = (np.load(base + "_left.npy"), np.load(base + "_slope.npy"))
+    return loaded[window]
+
+
+def _worker_replay(params):
+    result = replay(
+        _worker_data["t"], _worker_data["y"], params,
+        rate=_load_regression(params["rate_window"]),
+        trend=_load_regression(params["trend_window"]),
+        cache=_worker_data.setdefault("cache", {}),
+    )
+    return summarize(result, keep_times=True)
+
+
+def expand_grid(grid):
+    """{"rate_slope": [10, 20], ...} => danh sách dict tham số (tích Descartes)."""
+    keys = list(grid)
+    return [dict(DEFAULT_PARAMS, **dict(zip(keys, values))) for values in itertools.product(*(grid[k] for k in keys))]
+
+
+def run_grid(t, y, grid, workers=None):
+    """Chạy mọi bộ tham số của `grid` song song; mỗi cửa sổ hồi quy chỉ tính một lần."""
+    param_sets = expand_grid(grid)
+    workers = workers or os.cpu_count() or 1
+    with tempfile.TemporaryDirectory() as data_dir:
+        np.save(os.path.join(data_dir, "t.npy"), np.ascontiguousarray(t, dtype=np.float64))
+        np.save(os.path.join(data_dir, "y.npy"), np.ascontiguousarray(y, dtype=np.float64))
+        windows = sorted({p["rate_window"] for p in param_sets} | {p["trend_window"] for p in param_sets})
+        with ProcessPoolExecutor(max_workers=workers, initializer=_worker_init, initargs=(data_dir,)) as pool:
+            list(pool.map(_worker_regression, windows))
+            # Gom các bộ cùng ngưỡng/xu hướng vào cùng lô để cache trong tiến trình được dùng lại
+            cache_keys = ("trend_window", "trend_slope", "rate_window", "rate_min_points", "rate_min_delta")
+            order = sorted(range(len(param_sets)), key=lambda i: (
+                tuple(param_sets[i]["thresholds"]),) + tuple(param_sets[i][k] for k in cache_keys))
+            chunk = max(1, len(param_sets) // (workers * 4))
+            results = list(pool.map(_worker_replay, [param_sets[i] for i in order], chunksize=chunk))
+    out = [None] * len(param_sets)
+    for i, result in zip(order, results):
+        out[i] = result
+    return out
+
+
+def summarize(result, keep_times=False):
+    summary = {"params": result["params"], "samples": result["samples"]}
+    if not result["samples"]:
+        return summary
+    for key in ("rate_alerts", "very_high_alerts", "trend_alerts", "trend_alerts_sent"):
+        summary[key] = len(result[key])
+        if keep_times:
+            summary[key + "_ms"] = (result[key] * 1000).astype(np.int64).tolist()
+    summary["status_changes"] = result["status_changes"]
+    summary["telegram_sent"] = result["telegram_sent"]
+    summary["commands"] = {str(k): int(v) for k, v in result["commands"].items()}
+    return summary
+
+
+# ====== CLI ======
+def _parse_list(text, cast=float):
+    return [cast(v) for v in text.split(",") if v.strip()]
+
+
+def _parse_thresholds(text):
+    # "10/50/100,15/60/120"
+    return [tuple(float(x) for x in item.split("/")) for item in text.split(",") if item.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backtest luật cảnh báo trên dữ liệu lịch sử")
+    parser.add_argument("--db", default=turbidity_db.DEFAULT_DB_PATH)
+    parser.add_argument("--archive", default=columnar_archive.DEFAULT_ARCHIVE_DIR)
+    parser.add_argument("--json", help="đọc turbidity_log.json/.ndjson thay cho CSDL")
+    parser.add_argument("--start", help="YYYY-MM-DD HH:MM:SS")
+    parser.add_argument("--end", help="YYYY-MM-DD HH:MM:SS")
+    parser.add_argument("--rate-slope", type=_parse_list)
+    parser.add_argument("--rate-min-delta", type=_parse_list)
+    parser.add_argument("--rate-window", type=_parse_list)
+    parser.add_argument("--rate-cooldown", type=_parse_list)
+    parser.add_argument("--trend-slope", type=_parse_list)
+    parser.add_argument("--trend-window", type=_parse_list)
+    parser.add_argument("--thresholds", type=_parse_thresholds, help="ví dụ 10/50/100,15/60/120")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--out", help="ghi kết quả (kèm thời điểm từng cảnh báo) ra file JSON")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    if args.json:
+        t, y = load_json(args.json)
+    else:
+        start_ms = turbidity_db.ts_to_ms(args.start) if args.start else 0
+        end_ms = turbidity_db.ts_to_ms(args.end) if args.end else 2 ** 62
+        t, y = load_db(args.db, args.archive, start_ms, end_ms)
+    load_s = time.perf_counter() - t0
+    print(f"Đã nạp {len(t):,} mẫu trong {load_s:.2f} s")
+    if not len(t):
+        return
+
+    grid = {}
+    for key in ("rate_slope", "rate_min_delta", "rate_window", "rate_cooldown", "trend_slope", "trend_window", "thresholds"):
+        values = getattr(args, key)
+        if values:
+            grid[key] = values
+    t0 = time.perf_counter()
+    results = run_grid(t, y, grid, workers=args.workers)
+    print(f"{len(results)} bộ tham số trong {time.perf_counter() - t0:.2f} s")
+
+    varied = list(grid) or ["rate_slope"]
+    header = " ".join(f"{k:>14}" for k in varied)
+    print(f"{header} {'tốc độ':>8} {'rất đục':>8} {'xu hướng':>9} {'đổi TT':>7} {'Telegram':>9} {'lệnh A/S':>9}")
+    for r in results:
+        p = r["params"]
+        values = " ".join(f"{'/'.join(f'{v:g}' for v in p[k]) if isinstance(p[k], tuple) else f'{p[k]:g}':>14}" for k in varied)
+        cmds = r["commands"]
+        print(f"{values} {r['rate_alerts']:>8} {r['very_high_alerts']:>8} {r['trend_alerts']:>9} "
+              f"{r['status_changes']:>7} {r['telegram_sent']:>9} {cmds.get('A', 0):>4}/{cmds.get('S', 0):<4}")
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False)
+        print(f"Đã ghi {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,9 @@
 import streamlit as st
 import json
-import sqlite3
-import pandas as pd
+import os
+import re
 from datetime import datetime
 from pathlib import Path
-import plotly.graph_objects as go
 
 # --- Config và Tiêu đề (Chỉ chạy 1 lần) ---
 st.set_page_config(
@@ -14,7 +13,7 @@ st.set_page_config(
 )
 
 # === CSS CỰC KỲ ĐỠN GIẢN ===
-st.markdown("""
+PAGE_CSS = """
 <style>
     @import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap');
     
@@ -100,20 +99,104 @@ st.markdown("""
     footer {visibility: hidden;}
     .stDeployButton {display: none;}
 </style>
-""", unsafe_allow_html=True)
+"""
 
 # Header siêu đơn giản
-st.markdown("""
+PAGE_HEADER = """
 <div class="simple-header">
     <h1>💧 Giám Sát Chất Lượng Nước</h1>
     <p>Hệ thống đo độ đục thời gian thực</p>
 </div>
-""", unsafe_allow_html=True)
+"""
+
+
+@st.cache_resource
+def page_head():
+    """CSS (bỏ chú thích và khoảng trắng thừa) + tiêu đề thành một khối markdown, dựng một lần cho cả tiến trình."""
+    css = re.sub(r"/\*.*?\*/", "", PAGE_CSS, flags=re.S)
+    css = re.sub(r"\s*([{};,])\s*", r"\1", re.sub(r"\s+", " ", css))
+    header = "".join(line.strip() for line in PAGE_HEADER.splitlines())
+    return css.strip() + "\n" + header
+
+
+st.markdown(page_head(), unsafe_allow_html=True)
+
+# Module của dự án được nhập sau khi đã gửi CSS + tiêu đề. Thư viện nặng không nạp lúc nhập module:
+# pandas chỉ được nhập trong chỗ dựng DataFrame (ở đây và trong dashboard_data), plotly khi vẽ đồng hồ,
+# nên lần mở đầu tiên trình duyệt có khung trang trong lúc server còn nạp thư viện.
+# Các lần chạy lại lấy từ sys.modules nên không tốn gì.
+import turbidity_db  # noqa: E402
+import ndjson_log  # noqa: E402
+import columnar_archive  # noqa: E402
+import dashboard_data  # noqa: E402
+import live_feed  # noqa: E402
 
 # Cấu hình cập nhật thời gian thực (điều chỉnh chu kỳ theo thay đổi trạng thái)
 FAST_REFRESH_MS = 1000     # làm mới nhanh khi vừa có thay đổi trạng thái
 SLOW_REFRESH_MS = 10000    # làm mới chậm khi trạng thái ổn định
 BOOST_DURATION_SEC = 30    # khoảng thời gian duy trì làm mới nhanh
+LIVE_REFRESH_MS = 500      # khi nhận dữ liệu đẩy từ chương trình desktop: vẽ lại từ bộ nhớ, không hỏi DB
+# Cổng kênh đẩy của chương trình desktop (cùng biến môi trường); để trống để chỉ đọc DB
+LIVE_FEED_PORT = os.environ.get("LIVE_FEED_PORT", str(live_feed.DEFAULT_PORT)).strip()
+REALTIME_BUFFER_SIZE = 50  # số dòng mới nhất giữ trong bộ đệm (đủ cho biểu đồ tail(50))
+# Độ phân giải cho phần tra cứu lịch sử: None = dữ liệu thô, còn lại đọc bảng tổng hợp
+RESOLUTION_OPTIONS = {"Thô": None, "1 phút": "1m", "1 giờ": "1h", "1 ngày": "1d"}
+# Biểu đồ: 50 mẫu gần nhất hoặc cả một khoảng thời gian rút gọn còn ~CHART_POINTS điểm
+CHART_WINDOWS = {"50 mẫu gần nhất": None, "1 giờ": 3600, "24 giờ": 86400, "7 ngày": 7 * 86400}
+CHART_POINTS = 800
+HISTORY_PAGE_SIZE = 200    # số dòng thô mỗi trang tra cứu lịch sử
+HISTORY_COUNT_CAP = 10000  # đếm tới đây thì dừng (chỉ hiện "hơn ...")
+
+
+# TURBIDITY_DB: dùng CSDL khác (vd. benchmarks/bench_app_mobile.py chạy trên CSDL tạm)
+DB_PATH = Path(os.environ.get("TURBIDITY_DB") or Path(__file__).parent / "turbidity.db")
+
+
+@st.cache_resource
+def shared_data(db_path):
+    """Một lớp dữ liệu cho cả tiến trình: mọi phiên dùng chung kết nối chỉ đọc, các DataFrame đã nạp
+    và một kết nối nghe kênh đẩy (phần thời gian thực không còn hỏi DB khi chương trình desktop đang chạy)."""
+    return dashboard_data.DashboardData(db_path, tail_rows=REALTIME_BUFFER_SIZE,
+                                        feed_port=int(LIVE_FEED_PORT) if LIVE_FEED_PORT else None)
+
+
+@st.cache_resource
+def gauge_template():
+    """Đồng hồ đo dựng một lần cho cả tiến trình; plotly chỉ được nạp ở lần vẽ đầu tiên."""
+    import plotly.graph_objects as go
+    fig = go.Figure(go.Indicator(
+        mode="gauge+number",
+        value=0.0,
+        number={'font': {'size': 40}},
+        gauge={
+            'axis': {'range': [0, 200]},
+            'bar': {'color': "#3b82f6"},
+            'steps': [
+                {'range': [0, 10], 'color': 'rgba(16,185,129,0.2)'},
+                {'range': [10, 50], 'color': 'rgba(245,158,11,0.2)'},
+                {'range': [50, 200], 'color': 'rgba(239,68,68,0.2)'}
+            ],
+            'threshold': {'line': {'color': "red", 'width': 3}, 'value': 100}
+        }
+    ))
+    fig.update_layout(
+        height=250,
+        margin=dict(l=20, r=20, t=20, b=20),
+        paper_bgcolor="rgba(0,0,0,0)",
+        font={'color': "white"}
+    )
+    return fig
+
+
+def gauge_figure(value):
+    # Mỗi phiên giữ một bản sao (các phiên chạy song song), mỗi lần vẽ chỉ đổi giá trị kim
+    fig = st.session_state.get('gauge_fig')
+    if fig is None:
+        import plotly.graph_objects as go
+        fig = st.session_state['gauge_fig'] = go.Figure(gauge_template())
+    fig.data[0].value = value
+    return fig
+
 
 # Settings row
 col_set1, col_set2 = st.columns(2)
@@ -148,25 +231,25 @@ def realtime_data_display():
     now_ts = datetime.now().timestamp()
     
     try:
-        db_path = Path(__file__).parent / "turbidity.db"
-        if db_path.exists():
-            # Đọc từ SQLite
-            conn = sqlite3.connect(str(db_path))
-            cur = conn.cursor()
-            rows = cur.execute("SELECT ts, turbidity, voltage, status FROM readings ORDER BY ts ASC").fetchall()
-            conn.close()
-            if not rows:
+        if DB_PATH.exists():
+            # Đọc từ SQLite qua bộ đệm dùng chung (chỉ phần đuôi mới, tăng dần theo id)
+            df = shared_data(str(DB_PATH)).latest()
+            if df.empty:
                 raise json.JSONDecodeError("empty", "", 0)
-            df = pd.DataFrame(rows, columns=["timestamp", "turbidity", "voltage", "status"])
-            df['timestamp'] = pd.to_datetime(df['timestamp'])
-            df.set_index('timestamp', inplace=True)
         else:
-            # Fallback: Đọc từ JSON nếu DB chưa sẵn sàng
-            log_path = Path(__file__).parent / "turbidity_log.json"
-            with open(log_path, "r", encoding='utf-8') as f:
-                logs = json.load(f)
+            # Fallback: Đọc phần đuôi log NDJSON nếu DB chưa sẵn sàng (không phân tích cả file)
+            ndjson_path = Path(__file__).parent / "turbidity_log.ndjson"
+            if ndjson_path.exists():
+                logs = ndjson_log.tail_records(str(ndjson_path), REALTIME_BUFFER_SIZE)
+            else:
+                # Định dạng cũ: mảng JSON (chuyển đổi bằng `python ndjson_log.py to-ndjson`)
+                log_path = Path(__file__).parent / "turbidity_log.json"
+                with open(log_path, "r", encoding='utf-8') as f:
+                    logs = json.load(f)
             if not logs:
                 raise json.JSONDecodeError("empty", "", 0)
+            import pandas as pd
+
             df = pd.DataFrame(logs)
             df['timestamp'] = pd.to_datetime(df['timestamp'])
             df.set_index('timestamp', inplace=True)
@@ -234,30 +317,7 @@ def realtime_data_display():
         # === ĐỒNG HỒ ===
         st.markdown("### 📊 Đồng Hồ Đo", unsafe_allow_html=True)
         
-        fig = go.Figure(go.Indicator(
-            mode="gauge+number",
-            value=turbidity,
-            number={'font': {'size': 40}},
-            gauge={
-                'axis': {'range': [0, 200]},
-                'bar': {'color': "#3b82f6"},
-                'steps': [
-                    {'range': [0, 10], 'color': 'rgba(16,185,129,0.2)'},
-                    {'range': [10, 50], 'color': 'rgba(245,158,11,0.2)'},
-                    {'range': [50, 200], 'color': 'rgba(239,68,68,0.2)'}
-                ],
-                'threshold': {'line': {'color': "red", 'width': 3}, 'value': 100}
-            }
-        ))
-        
-        fig.update_layout(
-            height=250,
-            margin=dict(l=20, r=20, t=20, b=20),
-            paper_bgcolor="rgba(0,0,0,0)",
-            font={'color': "white"}
-        )
-        
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(gauge_figure(turbidity), use_container_width=True)
 
         # === DỮ LIỆU & BIỂU ĐỒ - Tabs đơn giản ===
         st.markdown("### 📈 Lịch Sử")
@@ -265,7 +325,14 @@ def realtime_data_display():
         tab1, tab2 = st.tabs(['Biểu đồ', 'Dữ liệu'])
         
         with tab1:
-            st.line_chart(df.tail(50)['turbidity'], height=300)
+            window_label = st.selectbox("Khoảng thời gian:", options=list(CHART_WINDOWS), key="chart_window_key")
+            window_sec = CHART_WINDOWS[window_label]
+            if window_sec is None or not DB_PATH.exists():
+                st.line_chart(df.tail(50)['turbidity'], height=300)
+            else:
+                # Khoảng dài: rút gọn min-max (giữ nguyên gai) từ bộ đệm dùng chung giữa các phiên
+                chart_df = shared_data(str(DB_PATH)).series(window_sec, CHART_POINTS)
+                st.line_chart(chart_df['turbidity'], height=300)
         
         with tab2:
             st.dataframe(
@@ -319,6 +386,9 @@ if realtime:
     # Tính interval động
     active_boost = datetime.now().timestamp() <= st.session_state.get('boost_until', 0.0)
     refresh_interval = FAST_REFRESH_MS / 1000.0 if active_boost else SLOW_REFRESH_MS / 1000.0
+    if DB_PATH.exists() and shared_data(str(DB_PATH)).live():
+        # Dữ liệu được đẩy tới bộ nhớ dùng chung: làm mới dưới 1 giây mà không tốn truy vấn DB
+        refresh_interval = LIVE_REFRESH_MS / 1000.0
     
     # Fragment tự động rerun theo interval
     @st.fragment(run_every=refresh_interval)
@@ -338,25 +408,34 @@ def date_filter_changed():
 def status_filter_changed():
     st.session_state.selected_statuses = st.session_state.status_filter_widget_key
 
-# Đọc dữ liệu cho bộ lọc
+def history_older(cursor):
+    st.session_state.history_cursors.append(cursor)
+
+def history_newer():
+    if len(st.session_state.history_cursors) > 1:
+        st.session_state.history_cursors.pop()
+
+def day_bounds_ms(first_day, last_day):
+    """[00:00:00 ngày đầu, 23:59:59.999 ngày cuối] giờ địa phương, dạng epoch ms."""
+    start = datetime.combine(first_day, datetime.min.time())
+    end = datetime.combine(last_day, datetime.max.time())
+    return int(start.timestamp() * 1000), int(end.timestamp() * 1000)
+
+# Đọc metadata cho bộ lọc (khoảng ngày, trạng thái) từ bộ đệm dùng chung, không nạp cả bảng
 try:
-    db_path = Path(__file__).parent / "turbidity.db"
-    if db_path.exists():
-        conn = sqlite3.connect(str(db_path))
-        cur = conn.cursor()
-        rows = cur.execute("SELECT ts, turbidity, voltage, status FROM readings ORDER BY ts ASC").fetchall()
-        conn.close()
-        if rows:
-            df_filter = pd.DataFrame(rows, columns=["timestamp", "turbidity", "voltage", "status"])
-            df_filter['timestamp'] = pd.to_datetime(df_filter['timestamp'])
-            df_filter.set_index('timestamp', inplace=True)
-            
+    if DB_PATH.exists():
+        data = shared_data(str(DB_PATH))
+        first_ms, last_ms, all_statuses = data.overview()
+        if first_ms is not None:
             with st.expander("🗂️ Tra cứu Lịch sử Đo đầy đủ"):
                 st.subheader("Bộ lọc Dữ liệu")
 
-                min_date = df_filter.index.min().date()
-                max_date = df_filter.index.max().date()
-                all_statuses = df_filter['status'].unique().tolist()
+                min_date = datetime.fromtimestamp(first_ms / 1000).date()
+                max_date = datetime.fromtimestamp(last_ms / 1000).date()
+                # Các ngày cũ hơn dữ liệu thô trong DB vẫn tra cứu được qua kho lưu trữ dạng cột
+                archived_days = data.archived_days()
+                if archived_days:
+                    min_date = min(min_date, datetime.strptime(archived_days[0], columnar_archive.DAY_FORMAT).date())
 
                 # Khởi tạo Session State nếu chưa có
                 if 'date_range' not in st.session_state:
@@ -379,23 +458,81 @@ try:
                 st.multiselect(
                     "Lọc theo trạng thái:",
                     options=all_statuses,
-                    default=st.session_state.selected_statuses,
+                    default=[s for s in st.session_state.selected_statuses if s in all_statuses],
                     key="status_filter_widget_key",
                     on_change=status_filter_changed
                 )
 
-                # Logic lọc
-                filtered_df = df_filter.copy()
+                resolution = st.selectbox(
+                    "Độ phân giải:",
+                    options=list(RESOLUTION_OPTIONS),
+                    key="resolution_widget_key",
+                    help="Khoảng thời gian dài nên xem theo phút/giờ/ngày (đọc từ bảng tổng hợp)."
+                )
+                level = RESOLUTION_OPTIONS[resolution]
 
-                if st.session_state.date_range and len(st.session_state.date_range) == 2:
-                    start_date = pd.to_datetime(st.session_state.date_range[0])
-                    end_date = pd.to_datetime(st.session_state.date_range[1]).replace(hour=23, minute=59, second=59)
-                    filtered_df = filtered_df.loc[start_date:end_date]
+                if level is None:
+                    # Lọc trong SQL (chỉ mục ts/trạng thái), mỗi lần chỉ đọc một trang
+                    if st.session_state.date_range and len(st.session_state.date_range) == 2:
+                        start_ms, end_ms = day_bounds_ms(*st.session_state.date_range)
+                    else:
+                        start_ms, end_ms = day_bounds_ms(min_date, max_date)
+                    selected = st.session_state.selected_statuses
+                    # Không chọn gì hoặc chọn tất cả = không lọc trạng thái
+                    statuses = None if not selected or set(all_statuses) <= set(selected) else list(selected)
 
-                if st.session_state.selected_statuses:
-                    filtered_df = filtered_df[filtered_df['status'].isin(st.session_state.selected_statuses)]
+                    # Bộ lọc đổi => quay về trang đầu (mới nhất)
+                    query = (start_ms, end_ms, tuple(statuses) if statuses else None)
+                    if st.session_state.get('history_query') != query:
+                        st.session_state.history_query = query
+                        st.session_state.history_cursors = [("raw", None)]
+                    cursors = st.session_state.history_cursors
+
+                    page_df, next_cursor = data.history_page(cursors[-1], start_ms, end_ms, statuses,
+                                                             HISTORY_PAGE_SIZE)
+                    total = data.history_count(start_ms, end_ms, statuses, cap=HISTORY_COUNT_CAP)
+                    total_text = f"hơn {HISTORY_COUNT_CAP}" if total > HISTORY_COUNT_CAP else str(total)
+
+                    st.subheader(f"Kết quả lọc ({total_text} bản ghi)")
+                    st.dataframe(page_df, use_container_width=True)
+                    col_newer, col_page, col_older = st.columns([1, 2, 1])
+                    with col_newer:
+                        st.button("◀ Mới hơn", key="history_newer_key", disabled=len(cursors) == 1,
+                                  on_click=history_newer)
+                    with col_page:
+                        st.caption(f"Trang {len(cursors)} • {HISTORY_PAGE_SIZE} bản ghi/trang")
+                    with col_older:
+                        st.button("Cũ hơn ▶", key="history_older_key", disabled=next_cursor is None,
+                                  on_click=history_older, args=(next_cursor,))
+                else:
+                    # Đọc bucket đã tổng hợp thay vì quét dữ liệu thô 1 Hz
+                    start_ts = end_ts = None
+                    if st.session_state.date_range and len(st.session_state.date_range) == 2:
+                        start_ts = f"{st.session_state.date_range[0]:%Y-%m-%d} 00:00:00"
+                        end_ts = f"{st.session_state.date_range[1]:%Y-%m-%d} 23:59:59"
+                    rollups = data.rollups(level, start_ts, end_ts)
+                    selected = set(st.session_state.selected_statuses or all_statuses)
+                    records = [
+                        {
+                            "timestamp": bucket,
+                            "turbidity_avg": t_avg,
+                            "turbidity_min": t_min,
+                            "turbidity_max": t_max,
+                            "voltage_avg": v_avg,
+                            "count": n,
+                            "status": turbidity_db.dominant_status(counts),
+                        }
+                        for bucket, n, t_avg, t_min, t_max, v_avg, counts in rollups
+                        if any(counts.get(s, 0) for s in selected)
+                    ]
+                    import pandas as pd
 
-                st.subheader(f"Kết quả lọc ({len(filtered_df)} bản ghi)")
-                st.dataframe(filtered_df.iloc[::-1], use_container_width=True)
+                    rollup_df = pd.DataFrame(records)
+                    st.subheader(f"Kết quả lọc ({len(rollup_df)} nhóm {resolution})")
+                    if not rollup_df.empty:
+                        rollup_df['timestamp'] = pd.to_datetime(rollup_df['timestamp'])
+                        rollup_df.set_index('timestamp', inplace=True)
+                        st.line_chart(rollup_df[['turbidity_avg', 'turbidity_min', 'turbidity_max']], height=300)
+                        st.dataframe(rollup_df.iloc[::-1], use_container_width=True)
 except Exception:
     pass
\ No newline at end of file
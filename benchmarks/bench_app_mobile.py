@@ -0,0 +1,146 @@
+"""Thời gian khởi động và chạy lại của app_mobile, đo lặp lại được mà không cần trình duyệt.
+
+  1. Nhập thư viện trong một tiến trình mới (cộng dồn theo thứ tự app_mobile nhập):
+     streamlit (đủ để gửi CSS + tiêu đề) -> dashboard_data -> pandas (DataFrame đầu tiên)
+     -> plotly.graph_objects (đồng hồ đo)
+  2. Lần chạy đầu của script trong tiến trình mới (streamlit.testing AppTest): nhập thư viện,
+     dựng đồng hồ đo, nạp dữ liệu — gần với lần mở trang đầu tiên sau khi khởi động server
+  3. Chạy lại toàn trang (mỗi lần người dùng bấm/chọn): trung vị và p90 của K lần
+Chạy trên CSDL tạm N dòng (TURBIDITY_DB), tắt kênh đẩy (LIVE_FEED_PORT="").
+--record FILE ghi thêm một dòng NDJSON (kèm commit git) để so sánh qua các phiên bản.
+
+Chạy: python benchmarks/bench_app_mobile.py [số_dòng] [số_lần_chạy_lại] [--record FILE]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import ndjson_log
+import turbidity_db
+
+APP = os.path.join(ROOT, "app_mobile.py")
+IMPORT_STEPS = [
+    ("streamlit", "import streamlit"),
+    ("+ dashboard_data", "import dashboard_data"),
+    ("+ pandas", "import pandas"),
+    ("+ plotly.graph_objects", "import plotly.graph_objects"),
+]
+IMPORT_CHILD = """
+import sys, time, json
+sys.path.insert(0, {root!r})
+out = []
+for name, stmt in {steps!r}:
+    t0 = time.perf_counter()
+    try:
+        exec(stmt)
+    except ImportError as e:
+        out.append((name, None, str(e)))
+        continue
+    out.append((name, time.perf_counter() - t0, None))
+print(json.dumps(out))
+"""
+
+
+def build(db_path, n):
+    turbidity_db.init_db(db_path)
+    conn = turbidity_db.connect(db_path)
+    now_ms = int(time.time() * 1000)
+    rows = [(None, 3600.0, 5.0 + i % 40, "Nước trong", "Arduino Uno", now_ms - (n - i) * 1000) for i in range(n)]
+    turbidity_db.insert_rows(conn, rows)
+    conn.commit()
+    conn.close()
+
+
+def import_times(repeat=3):
+    runs = []
+    for _ in range(repeat):
+        child = IMPORT_CHILD.format(root=ROOT, steps=IMPORT_STEPS)
+        runs.append(json.loads(subprocess.run([sys.executable, "-c", child], capture_output=True, text=True,
+                                              check=True).stdout))
+    result = {}
+    total = 0.0
+    for i, (name, _) in enumerate(IMPORT_STEPS):
+        times = [run[i][1] for run in runs]
+        if None in times:
+            print(f"  {name:<28} không có ({runs[0][i][2]})")
+            continue
+        ms = statistics.median(times) * 1000
+        total += ms
+        result[name] = round(ms, 1)
+        print(f"  {name:<28} {ms:>7.0f} ms  (cộng dồn {total:.0f} ms)")
+    return result
+
+
+def child(reruns):
+    # Chạy trong tiến trình mới để lần chạy đầu gồm cả chi phí nhập thư viện
+    from streamlit.testing.v1 import AppTest
+
+    t0 = time.perf_counter()
+    at = AppTest.from_file(APP, default_timeout=120)
+    at.run()
+    first = time.perf_counter() - t0
+    times = []
+    for _ in range(reruns):
+        t0 = time.perf_counter()
+        at.run()
+        times.append(time.perf_counter() - t0)
+    errors = len(at.exception) + sum("lỗi" in c.value for c in at.caption)
+    print(json.dumps({"first_run_ms": first * 1000, "rerun_ms": [t * 1000 for t in times], "errors": errors}))
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("rows", nargs="?", type=int, default=100_000)
+    parser.add_argument("reruns", nargs="?", type=int, default=20)
+    parser.add_argument("--record", help="ghi thêm kết quả (NDJSON) vào file này")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.reruns)
+        return
+
+    record = {"revision": git_revision(), "time": time.strftime(turbidity_db.TS_FORMAT), "rows": args.rows}
+    print("Nhập thư viện (tiến trình mới, trung vị 3 lần):")
+    record["import_ms"] = import_times()
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "turbidity.db")
+        build(db_path, args.rows)
+        env = dict(os.environ, TURBIDITY_DB=db_path, LIVE_FEED_PORT="")
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), str(args.rows), str(args.reruns),
+                               "--child"], env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        # Thiếu streamlit (pip install streamlit plotly) hoặc script lỗi
+        print(f"Không chạy được AppTest:\n{proc.stderr.strip().splitlines()[-1] if proc.stderr else ''}")
+    else:
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        reruns = sorted(result["rerun_ms"])
+        record.update(first_run_ms=round(result["first_run_ms"], 1),
+                      rerun_median_ms=round(statistics.median(reruns), 1),
+                      rerun_p90_ms=round(reruns[int(0.9 * (len(reruns) - 1))], 1),
+                      errors=result["errors"])
+        print(f"Lần chạy đầu (tiến trình mới): {record['first_run_ms']:.0f} ms")
+        print(f"Chạy lại toàn trang ({len(reruns)} lần): trung vị {record['rerun_median_ms']:.1f} ms, "
+              f"p90 {record['rerun_p90_ms']:.1f} ms, lỗi hiển thị: {record['errors']}")
+    if args.record:
+        ndjson_log.append_records(args.record, [record])
+        print(f"Đã ghi vào {args.record}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Đo tốc độ đọc kho lưu trữ dạng cột và so sánh dung lượng với SQLite.
+
+Chạy: python benchmarks/bench_archive.py [số_ngày]   (mặc định 365 ngày dữ liệu 1 Hz)
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import columnar_archive
+import turbidity_db
+
+
+def dir_size(path):
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def main():
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 365
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        archive_dir = os.path.join(tmp, "archive")
+        first_day = "2025-01-01"
+        base = columnar_archive.day_start_ms(first_day)
+        t0 = time.perf_counter()
+        for d in range(days):
+            start = base + d * 86400 * 1000
+            turb = rng.gamma(2.0, 5.0, 86400).astype(np.float32)
+            columnar_archive.write_day(
+                time.strftime(columnar_archive.DAY_FORMAT, time.localtime(start / 1000)),
+                {
+                    "ts": start + np.arange(86400, dtype=np.int64) * 1000,
+                    "turbidity": turb,
+                    "voltage": (3600 - turb * 3.6).astype(np.float32),
+                    "status": np.ones(86400, dtype=np.uint8),
+                },
+                archive_dir,
+            )
+        write_s = time.perf_counter() - t0
+        rows = days * 86400
+        archive_bytes = dir_size(archive_dir)
+
+        # Ước lượng dung lượng SQLite cho cùng số dòng từ một mẫu 200k dòng
+        db_path = os.path.join(tmp, "sample.db")
+        turbidity_db.init_db(db_path)
+        conn = turbidity_db.connect(db_path)
+        sample = 200000
+        conn.executemany(
+            "INSERT INTO readings (ts, voltage, turbidity, status, source) VALUES (?, ?, ?, ?, ?)",
+            (("2025-01-01 00:00:00", 3590.0, 12.34, "Nước hơi đục", "Arduino Uno") for _ in range(sample)),
+        )
+        conn.commit()
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        conn.close()
+        sqlite_bytes_per_row = os.path.getsize(db_path) / sample
+
+        end = base + days * 86400 * 1000 - 1
+        columnar_archive.read_range(base, end, archive_dir)  # làm nóng page cache
+        t0 = time.perf_counter()
+        cols = columnar_archive.read_range(base, end, archive_dir)
+        read_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        mean = float(cols["turbidity"].mean())
+        scan_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        views = list(columnar_archive.iter_range(base, end, archive_dir))
+        peak = max(float(v["turbidity"].max()) for v in views)
+        views_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        one_day = columnar_archive.read_range(base + 86400 * 1000 * (days // 2), base + 86400 * 1000 * (days // 2 + 1) - 1, archive_dir)
+        day_s = time.perf_counter() - t0
+
+    print(f"Số dòng: {rows:,} ({days} ngày, 1 Hz)")
+    print(f"Ghi kho: {write_s:.2f} s")
+    print(f"Dung lượng kho: {archive_bytes / 1e6:.1f} MB ({archive_bytes / rows:.1f} B/dòng); "
+          f"SQLite ước tính: {sqlite_bytes_per_row * rows / 1e6:.1f} MB ({sqlite_bytes_per_row:.1f} B/dòng, chưa tính chỉ mục tổng hợp)")
+    print(f"Đọc toàn bộ khoảng: {read_s * 1000:.1f} ms (gồm nối các ngày); duyệt tính trung bình: {scan_s * 1000:.1f} ms (mean={mean:.2f})")
+    print(f"Duyệt theo ngày bằng view (iter_range, không nối) + tìm max: {views_s * 1000:.1f} ms (max={peak:.1f})")
+    print(f"Đọc 1 ngày (view memmap, không sao chép): {day_s * 1000:.3f} ms, {len(one_day['ts'])} dòng")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""Đo thời gian backtest một lưới tham số trên dữ liệu 1 Hz tổng hợp.
+
+Chạy: python benchmarks/bench_backtest.py [số_ngày] [số_tiến_trình]   (mặc định 365 ngày)
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import alert_backtest
+
+
+def synthetic(days, seed=0):
+    # Nền ổn định + các đợt đục lên rồi lắng dần, nhiễu đo
+    rng = np.random.default_rng(seed)
+    n = days * 86400
+    t = 1.735e9 + np.arange(n, dtype=np.float64) + rng.uniform(-0.05, 0.05, n)
+    # Nền ~5 NTU trôi chậm theo ngày; nhiễu đo ±0.5 NTU
+    y = 5.0 + 1.5 * np.sin(np.arange(n) * (2 * np.pi / 86400)) + rng.normal(0.0, 0.5, n)
+    events = rng.choice(n - 3600, size=days * 3, replace=False)
+    bump = np.r_[np.linspace(0, 1, 300), np.exp(-np.arange(3300) / 900.0)]
+    amp = rng.uniform(20, 200, len(events))
+    for start, a in zip(events, amp):
+        y[start:start + len(bump)] += a * bump
+    return t, y
+
+
+def main():
+    days = int(sys.argv[1]) if len(sys.argv) > 1 else 365
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    t0 = time.perf_counter()
+    t, y = synthetic(days)
+    print(f"Sinh {len(t):,} mẫu trong {time.perf_counter() - t0:.1f} s")
+
+    t0 = time.perf_counter()
+    alert_backtest.replay(t, y, {})
+    print(f"Một bộ tham số (gồm hồi quy cửa sổ): {time.perf_counter() - t0:.2f} s")
+
+    grid = {
+        "rate_slope": [10.0, 20.0, 30.0],
+        "rate_min_delta": [5.0, 10.0],
+        "trend_slope": [20.0, 30.0, 40.0],
+        "thresholds": [(10.0, 50.0, 100.0), (15.0, 60.0, 120.0)],
+    }
+    t0 = time.perf_counter()
+    results = alert_backtest.run_grid(t, y, grid, workers=workers)
+    elapsed = time.perf_counter() - t0
+    print(f"Lưới {len(results)} bộ tham số trên {workers or os.cpu_count()} tiến trình: {elapsed:.1f} s "
+          f"({elapsed / len(results):.2f} s/bộ)")
+    best = min(results, key=lambda r: r["telegram_sent"])
+    print(f"Ít tin Telegram nhất: {best['telegram_sent']} tin với "
+          f"rate_slope={best['params']['rate_slope']:g}, trend_slope={best['params']['trend_slope']:g}")
+
+
+if __name__ == "__main__":
+    main()
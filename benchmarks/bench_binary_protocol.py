@@ -0,0 +1,84 @@
+"""Đo tốc độ giải mã khung nhị phân so với parser văn bản, kèm kiểm tra phát hiện lỗi.
+
+Chạy: python benchmarks/bench_binary_protocol.py [số_khung]
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import binary_protocol
+import serial_parser
+
+
+def make_stream(n, seed=0):
+    rng = random.Random(seed)
+    frames = [binary_protocol.encode_frame(i, i * 1000, 500 + i % 200, (i * 7) % 1000 / 10) for i in range(n)]
+    return frames, rng
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    frames, rng = make_stream(n)
+    stream = b"".join(frames)
+    chunks = [stream[i:i + 64] for i in range(0, len(stream), 64)]  # giống read(in_waiting)
+
+    decoder = binary_protocol.FrameDecoder()
+    t0 = time.perf_counter()
+    total = 0
+    for chunk in chunks:
+        total += len(decoder.feed(chunk))
+    bin_s = time.perf_counter() - t0
+    assert total == n and decoder.dropped == 0 and decoder.crc_errors == 0
+
+    lines = [f"Vôn:{binary_protocol.adc_to_millivolts(500 + i % 200):.0f},Độ đục:{(i * 7) % 1000 / 10:.2f}\r\n".encode("utf-8")
+             for i in range(n)]
+    t0 = time.perf_counter()
+    for raw in lines:
+        serial_parser.parse_serial_line(raw.decode("utf-8", errors="ignore").strip())
+    text_s = time.perf_counter() - t0
+
+    # Luồng lỗi: bỏ khung, đảo thứ tự, hỏng 1 byte, chèn rác văn bản
+    damaged = []
+    lost = corrupt = swapped = 0
+    i = 0
+    while i < len(frames):
+        r = rng.random()
+        if r < 0.01:
+            lost += 1
+        elif r < 0.02:
+            f = bytearray(frames[i])
+            f[rng.randrange(2, binary_protocol.FRAME_SIZE)] ^= 0xFF
+            damaged.append(bytes(f))
+            corrupt += 1
+        elif r < 0.025 and i + 1 < len(frames):
+            damaged += [frames[i + 1], frames[i]]
+            swapped += 1
+            i += 1
+        elif r < 0.03:
+            damaged += [b"ACK:A\r\n", frames[i]]
+        else:
+            damaged.append(frames[i])
+        i += 1
+    decoder = binary_protocol.FrameDecoder()
+    data = b"".join(damaged)
+    for k in range(0, len(data), 64):
+        decoder.feed(data[k:k + 64])
+    stats = decoder.stats()
+
+    print(f"Số khung: {n} ({binary_protocol.FRAME_SIZE} byte/khung, văn bản ~{sum(map(len, lines)) / n:.0f} byte/dòng)")
+    print(f"Giải mã nhị phân : {n / bin_s:12,.0f} khung/s")
+    print(f"Văn bản (decode+parse): {n / text_s:12,.0f} dòng/s")
+    print(f"Dung lượng tối đa ở 115200 baud: {11520 // binary_protocol.FRAME_SIZE} khung/s; "
+          f"văn bản ở 9600 baud: {960 // round(sum(map(len, lines)) / n)} dòng/s")
+    print(f"Luồng lỗi: mất {lost}, hỏng {corrupt}, đảo {swapped} -> {stats}")
+    # Khung hỏng cũng là khung mất; mỗi cặp đảo thứ tự bỏ một khung đến muộn
+    assert stats["crc_errors"] >= corrupt
+    assert stats["out_of_order"] == swapped
+    assert stats["dropped"] == lost + corrupt + swapped
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Đo thời gian vẽ mỗi khung của biểu đồ GUI: cách cũ (vẽ lại toàn bộ mỗi mẫu) và BlitChartRenderer.
+
+Dùng backend Agg (không cần màn hình) với figure giống TurbiditySensorGUI. Với TkAgg,
+mỗi khung còn thêm chi phí chép vùng ảnh sang Tk: toàn bộ figure ở cách cũ, chỉ vùng trục khi blit.
+
+Chạy: python benchmarks/bench_chart_render.py [số_khung]
+"""
+import math
+import os
+import statistics
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from chart_renderer import BlitChartRenderer
+
+POINTS = 50
+
+
+def make_figure():
+    # Cùng cấu hình với TurbiditySensorGUI.create_widgets
+    figure = Figure(figsize=(6, 4), dpi=100, facecolor="#2b3e50")
+    canvas = FigureCanvasAgg(figure)
+    ax = figure.add_subplot(111)
+    ax.set_title("Lịch sử Độ đục (50 điểm gần nhất)", color="#ffffff")
+    ax.set_xlabel("Thời gian", color="#ffffff")
+    ax.set_ylabel("NTU", color="#ffffff")
+    ax.tick_params(axis='x', colors="#ffffff")
+    ax.tick_params(axis='y', colors="#ffffff")
+    ax.grid(True, linestyle='--', alpha=0.3, color="#52667a")
+    ax.set_facecolor("#1e2d3d")
+    for spine in ax.spines.values():
+        spine.set_edgecolor("#52667a")
+    line, = ax.plot([], [], color='#3b8fd6', marker='o', markersize=3, linewidth=2)
+    trend_line, = ax.plot([], [], color='#f39c12', linestyle='--', linewidth=2, alpha=0.9)
+    return figure, canvas, ax, line, trend_line
+
+
+def samples(n_frames, t0=1_700_000_000.0):
+    # ~20 NTU dao động nhẹ, thỉnh thoảng có đợt đục lên tới ~80 NTU
+    for i in range(n_frames + POINTS):
+        bump = 60.0 if (i // 200) % 5 == 4 else 0.0
+        yield t0 + i, 20.0 + 3.0 * math.sin(i / 7.0) + bump
+
+
+def windows(n_frames):
+    xs, ys = [], []
+    for t, y in samples(n_frames):
+        xs.append(t)
+        ys.append(y)
+        if len(xs) > POINTS:
+            del xs[0], ys[0]
+        trend = [sum(ys[max(0, k - 9):k + 1]) / len(ys[max(0, k - 9):k + 1]) for k in range(len(ys))]
+        yield list(xs), list(ys), trend
+
+
+def legacy_frame(figure, canvas, ax, line, trend_line, xs, ys, trend):
+    # Bản sao phần vẽ biểu đồ của render_snapshot trước khi tối ưu
+    labels = [datetime.fromtimestamp(t).strftime("%H:%M:%S") for t in xs]
+    line.set_data(range(len(ys)), ys)
+    tail_n = min(len(trend), len(ys))
+    trend_line.set_data(list(range(len(ys) - tail_n, len(ys))), trend[-tail_n:])
+    if len(ys) > 1:
+        tick_skip = max(1, len(ys) // 5)
+        ax.set_xticks(range(0, len(ys), tick_skip))
+        ax.set_xticklabels(labels[::tick_skip], rotation=30, ha='right')
+    ax.relim()
+    ax.autoscale_view(True, True)
+    figure.tight_layout()
+    canvas.draw()
+
+
+def run(n_frames, blit):
+    figure, canvas, ax, line, trend_line = make_figure()
+    renderer = BlitChartRenderer(figure, canvas, ax, line, trend_line) if blit else None
+    times = []
+    for xs, ys, trend in windows(n_frames):
+        t0 = time.perf_counter()
+        if blit:
+            renderer.update(xs, ys, xs[len(xs) - len(trend):], trend)
+        else:
+            legacy_frame(figure, canvas, ax, line, trend_line, xs, ys, trend)
+        times.append(time.perf_counter() - t0)
+    times = times[POINTS:]  # bỏ giai đoạn biểu đồ chưa đầy
+    return times, renderer
+
+
+def report(name, times):
+    ms = sorted(x * 1000.0 for x in times)
+    print(f"{name:<18} {statistics.mean(ms):8.2f} ms/khung  p50 {statistics.median(ms):7.2f}  "
+          f"p99 {ms[int(len(ms) * 0.99) - 1]:7.2f}  (~{1000.0 / statistics.mean(ms):5.0f} khung/s)")
+
+
+def main():
+    n_frames = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    legacy, _ = run(n_frames, blit=False)
+    report("Vẽ lại toàn bộ", legacy)
+    blitted, renderer = run(n_frames, blit=True)
+    report("BlitChartRenderer", blitted)
+    print(f"Số lần vẽ đầy đủ: {renderer.full_draws}/{renderer.frames} khung")
+    print(f"Nhanh hơn: {statistics.mean(legacy) / statistics.mean(blitted):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""Nhiều người xem app_mobile cùng lúc: đọc riêng từng phiên (cách cũ) so với DashboardData dùng chung.
+
+Tạo CSDL tạm N dòng thô, một luồng ghi thêm 10 dòng/giây; mỗi "người xem" là một luồng
+làm mới phần thời gian thực mỗi giây và thỉnh thoảng chạy lại phần tra cứu lịch sử.
+  - Cách cũ: mỗi lần làm mới mở kết nối mới, phần lịch sử đọc lại cả bảng và dựng lại DataFrame
+  - DashboardData: một kết nối chỉ đọc, frame nối thêm dòng mới, lịch sử từng trang lọc trong SQL;
+    kết quả dùng chung cho mọi phiên
+Đo độ trễ mỗi lần làm mới, số truy vấn xuống DB và bộ nhớ cấp phát thêm (chạy dưới tracemalloc
+nên độ trễ tuyệt đối cao hơn khi chạy thật; so sánh tương đối vẫn đúng).
+
+Chạy: python benchmarks/bench_dashboard_data.py [số_dòng] [số_người_xem] [số_giây]
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import turbidity_db
+from dashboard_data import DashboardData, to_local_datetime
+
+T0_MS = 1_700_000_000_000
+TAIL = 50
+HISTORY_EVERY = 10  # mỗi người xem chạy lại phần lịch sử sau mỗi 10 lần làm mới
+
+
+def build(db_path, n):
+    turbidity_db.init_db(db_path)
+    conn = turbidity_db.connect(db_path)
+    chunk = 100_000
+    for base in range(0, n, chunk):
+        rows = [(None, 3600.0, 5.0 + i % 40, "Nước trong", "Arduino Uno", T0_MS + i * 1000)
+                for i in range(base, min(n, base + chunk))]
+        turbidity_db.insert_rows(conn, rows)
+        conn.commit()
+    conn.close()
+
+
+def writer(db_path, n, stop):
+    conn = turbidity_db.connect(db_path)
+    i = n
+    while not stop.wait(0.1):
+        turbidity_db.insert_rows(conn, [(None, 3600.0, 12.0, "Nước hơi đục", "Arduino Uno", T0_MS + i * 1000)])
+        conn.commit()
+        i += 1
+    conn.close()
+
+
+class Legacy:
+    """Như app_mobile trước đây: mỗi phiên tự mở kết nối và dựng DataFrame."""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.queries = 0
+
+    def session(self):
+        return {"last_id": 0, "rows": []}
+
+    def latest(self, state):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            rows = conn.execute(
+                "SELECT s.id, s.ts_ms, s.turbidity, s.voltage, st.name FROM samples s "
+                "LEFT JOIN statuses st ON st.id = s.status_id WHERE s.id > ? ORDER BY s.id DESC LIMIT ?",
+                (state["last_id"], TAIL)).fetchall()
+        finally:
+            conn.close()
+        self.queries += 1
+        if rows:
+            state["last_id"] = rows[0][0]
+            state["rows"] = (state["rows"] + [r[1:] for r in reversed(rows)])[-TAIL:]
+        df = pd.DataFrame(state["rows"], columns=["timestamp", "turbidity", "voltage", "status"])
+        df["timestamp"] = to_local_datetime(df["timestamp"])
+        return df.set_index("timestamp")
+
+    def history(self, state):
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute("SELECT ts, turbidity, voltage, status FROM readings ORDER BY ts ASC").fetchall()
+        conn.close()
+        self.queries += 1
+        df = pd.DataFrame(rows, columns=["timestamp", "turbidity", "voltage", "status"])
+        df["timestamp"] = pd.to_datetime(df["timestamp"])
+        return df.set_index("timestamp")
+
+
+class Shared:
+    def __init__(self, db_path):
+        self.data = DashboardData(db_path, tail_rows=TAIL)
+
+    @property
+    def queries(self):
+        return self.data.queries
+
+    def session(self):
+        return None
+
+    def latest(self, state):
+        return self.data.latest()
+
+    def history(self, state):
+        # Như app_mobile hiện nay: metadata + trang đầu + tổng số (có giới hạn), lọc trong SQL
+        first_ms, last_ms, _ = self.data.overview()
+        df, _ = self.data.history_page(("raw", None), first_ms, last_ms)
+        self.data.history_count(first_ms, last_ms)
+        return df
+
+
+def run(name, source, viewers, seconds):
+    latencies = {"latest": [], "history": []}
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def viewer(offset):
+        state = source.session()
+        time.sleep(offset)  # các phiên không làm mới cùng một lúc
+        k = 0
+        while not stop.is_set():
+            kind = "history" if k % HISTORY_EVERY == 0 else "latest"
+            t0 = time.perf_counter()
+            df = getattr(source, kind)(state)
+            elapsed = time.perf_counter() - t0
+            assert len(df)
+            with lock:
+                latencies[kind].append(elapsed)
+            k += 1
+            stop.wait(1.0)
+
+    tracemalloc.start()
+    threads = [threading.Thread(target=viewer, args=(i / viewers,), daemon=True) for i in range(viewers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    parts = []
+    for kind, values in latencies.items():
+        ms = sorted(v * 1000.0 for v in values)
+        if ms:
+            parts.append(f"{kind}: {len(ms)} lần, p50 {ms[len(ms) // 2]:.1f} ms, p95 {ms[int(len(ms) * 0.95)]:.1f} ms")
+    print(f"{name} ({viewers} người xem): {'; '.join(parts)}; {source.queries} truy vấn DB, "
+          f"bộ nhớ đỉnh {peak / 1e6:.0f} MB")
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    viewer_counts = [int(sys.argv[2])] if len(sys.argv) > 2 else [1, 8, 32]
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 10.0
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "turbidity.db")
+        build(db_path, n)
+        stop = threading.Event()
+        threading.Thread(target=writer, args=(db_path, n, stop), daemon=True).start()
+        for viewers in viewer_counts:
+            run("Cách cũ", Legacy(db_path), viewers, seconds)
+            shared = Shared(db_path)
+            run("DashboardData", shared, viewers, seconds)
+            shared.data.close()
+        stop.set()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""So sánh thông lượng ghi: commit từng dòng (cách cũ) và BatchedDBWriter.
+
+Chạy: python benchmarks/bench_db_writer.py [số_dòng]
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import turbidity_db
+
+
+def sample_rows(n):
+    for i in range(n):
+        yield ("2025-10-10 20:25:%02d" % (i % 60), 3600.0, float(i % 700), "Nước trong", "Arduino Uno")
+
+
+def bench_per_row(db_path, n):
+    # Tái hiện log_to_db cũ: connect → insert → commit → close cho từng mẫu
+    start = time.perf_counter()
+    worst = 0.0
+    for row in sample_rows(n):
+        t0 = time.perf_counter()
+        conn = sqlite3.connect(db_path)
+        conn.execute(turbidity_db.BatchedDBWriter.INSERT_SQL, row)
+        conn.commit()
+        conn.close()
+        worst = max(worst, time.perf_counter() - t0)
+    return time.perf_counter() - start, worst
+
+
+def bench_batched(db_path, n):
+    writer = turbidity_db.BatchedDBWriter(db_path).start()
+    start = time.perf_counter()
+    worst = 0.0
+    base_ms = int(time.time() * 1000)
+    for i, row in enumerate(sample_rows(n)):
+        t0 = time.perf_counter()
+        writer.write(base_ms + i, *row[1:])
+        worst = max(worst, time.perf_counter() - t0)
+    enqueue = time.perf_counter() - start
+    writer.close()
+    return time.perf_counter() - start, worst, enqueue, writer
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with tempfile.TemporaryDirectory() as tmp:
+        old_db = os.path.join(tmp, "per_row.db")
+        new_db = os.path.join(tmp, "batched.db")
+        # Cách cũ dùng journal mặc định (DELETE), đúng như trước khi có WAL
+        conn = sqlite3.connect(old_db)
+        conn.execute("CREATE TABLE readings (id INTEGER PRIMARY KEY AUTOINCREMENT, ts TEXT NOT NULL, "
+                     "voltage REAL, turbidity REAL, status TEXT, source TEXT)")
+        conn.commit()
+        conn.close()
+        turbidity_db.init_db(new_db)
+
+        total_old, worst_old = bench_per_row(old_db, n)
+        total_new, worst_new, enqueue_new, writer = bench_batched(new_db, n)
+
+    print(f"Số dòng: {n}")
+    print(f"Commit từng dòng : {n / total_old:10.0f} dòng/s, chặn luồng gọi tối đa {worst_old * 1000:.2f} ms/dòng")
+    print(f"BatchedDBWriter  : {n / total_new:10.0f} dòng/s ({writer.commits} commit), "
+          f"chặn luồng gọi tối đa {worst_new * 1000:.3f} ms/dòng, enqueue {enqueue_new * 1000:.1f} ms tổng")
+
+
+if __name__ == "__main__":
+    main()
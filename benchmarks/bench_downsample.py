@@ -0,0 +1,107 @@
+"""Rút gọn chuỗi cho biểu đồ: tốc độ trên 10M điểm, số gai được giữ lại, và chi phí vẽ.
+
+  1. minmax / lttb / lấy mẫu cách đều (x[::k]) từ N điểm xuống cỡ số pixel
+     - thời gian rút gọn, số gai đơn lẻ (1 mẫu) còn thấy được sau khi rút gọn
+  2. Vẽ 24 giờ dữ liệu 1 Hz (86 400 điểm) bằng BlitChartRenderer: vẽ thô so với rút gọn trước
+  3. SeriesBuffer: chi phí append mỗi mẫu và lấy cửa sổ + rút gọn cho một khung
+
+Chạy: python benchmarks/bench_downsample.py [số_điểm] [số_pixel]
+"""
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from chart_renderer import BlitChartRenderer
+from downsample import SeriesBuffer, downsample, lttb, minmax
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_chart_render import make_figure  # noqa: E402
+
+SPIKES = 50
+T0 = 1_700_000_000.0
+
+
+def make_series(n, seed=7):
+    rng = np.random.default_rng(seed)
+    x = T0 + np.arange(n, dtype=np.float64)
+    y = 20.0 + np.cumsum(rng.normal(0, 0.05, n)) + rng.normal(0, 0.5, n)
+    spikes = np.sort(rng.choice(n, SPIKES, replace=False))
+    y[spikes] += 150.0  # gai một mẫu (vd. bọt khí) — phải còn thấy trên biểu đồ
+    return x, y, spikes
+
+
+def timed(fn, repeat=3):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times) * 1000.0, result
+
+
+def reduction(n, px):
+    x, y, spikes = make_series(n)
+    print(f"Rút gọn {n} điểm xuống ~{px} điểm:")
+    stride = max(1, n // px)
+    cases = [
+        ("cách đều x[::k]", lambda: np.arange(0, n, stride)),
+        ("minmax", lambda: minmax(x, y, px)),
+        ("minmax (bucket cố định)", lambda: minmax(x, y, px, bucket_width=(x[-1] - x[0]) / (px / 2))),
+        ("lttb (lọc trước minmax)", lambda: lttb(x, y, px)),
+    ]
+    for name, fn in cases:
+        ms, idx = timed(fn)
+        kept = np.isin(spikes, idx).sum()
+        print(f"  {name:<26} {ms:>8.1f} ms  {len(idx):>5} điểm  giữ {kept}/{SPIKES} gai")
+
+
+def render(px):
+    n = 24 * 3600
+    x, y, _ = make_series(n)
+    trend = list(y[-60:])
+    results = {}
+    for name, (xs, ys) in (("thô", (x, y)), ("minmax", downsample(x, y, px))):
+        figure, canvas, ax, line, trend_line = make_figure()
+        line.set_marker("None")
+        renderer = BlitChartRenderer(figure, canvas, ax, line, trend_line, max_fps=0, x_margin=0.02)
+        renderer.update(xs, ys, x[-60:], trend)  # khung đầu: vẽ đầy đủ
+        times = []
+        for _ in range(20):
+            t0 = time.perf_counter()
+            renderer.update(xs, ys, x[-60:], trend)
+            times.append(time.perf_counter() - t0)
+        results[name] = statistics.median(times) * 1000.0
+        print(f"Vẽ 24 giờ 1 Hz, {name:<7}: {len(xs):>6} điểm, {results[name]:.1f} ms/khung")
+    print(f"  nhanh hơn {results['thô'] / results['minmax']:.0f} lần")
+
+
+def buffer_frame(px):
+    buffer = SeriesBuffer(200_000)
+    x, y, _ = make_series(200_000)
+    t0 = time.perf_counter()
+    for t, v in zip(x.tolist(), y.tolist()):
+        buffer.append(t, v)
+    append_us = (time.perf_counter() - t0) / len(x) * 1e6
+    window = 24 * 3600.0
+    ms, (xs, _) = timed(lambda: downsample(*buffer.since(x[-1] - window), px,
+                                           bucket_width=window / (px / 2)), repeat=20)
+    print(f"SeriesBuffer: append {append_us:.2f} µs/mẫu; cửa sổ 24 giờ + rút gọn: {ms:.2f} ms/khung ({len(xs)} điểm)")
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000
+    px = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    reduction(n, px)
+    render(px)
+    buffer_frame(px)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Chi phí mở phần "Tra cứu Lịch sử Đo đầy đủ" của app_mobile: nạp cả bảng rồi lọc bằng pandas
+(cách cũ) so với metadata dùng chung + lọc trong SQL từng trang (DashboardData).
+
+Tạo CSDL tạm N dòng thô 1 Hz (~1% "Nước rất đục"), rồi đo:
+  - mở bộ lọc lần đầu: min/max ngày, danh sách trạng thái, trang đầu, tổng số (có giới hạn)
+  - đổi bộ lọc: một ngày ở giữa, trạng thái hiếm, nhiều trạng thái
+  - lật 20 trang cũ hơn
+
+Chạy: python benchmarks/bench_history_filter.py [số_dòng]
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import turbidity_db
+from dashboard_data import DashboardData
+
+PAGE = 200
+CAP = 10000
+T0_MS = 1_700_000_000_000
+
+
+def status_of(turbidity):
+    if turbidity <= 10: return "Nước trong"
+    if turbidity <= 50: return "Nước hơi đục"
+    if turbidity <= 100: return "Nước đục"
+    return "Nước rất đục"
+
+
+def build(db_path, n):
+    turbidity_db.init_db(db_path)
+    conn = turbidity_db.connect(db_path)
+    chunk = 100_000
+    for base in range(0, n, chunk):
+        rows = []
+        for i in range(base, min(n, base + chunk)):
+            turbidity = 150.0 if i % 97 == 0 else 5.0 + (i % 40)
+            rows.append((None, 3600.0, turbidity, status_of(turbidity), "Arduino Uno", T0_MS + i * 1000))
+        turbidity_db.insert_rows(conn, rows)
+        conn.commit()
+    conn.close()
+
+
+def legacy(db_path, start, end, statuses):
+    # Như app_mobile trước đây: cả bảng -> DataFrame -> min/max/unique -> lọc -> đảo ngược toàn bộ
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("SELECT ts, turbidity, voltage, status FROM readings ORDER BY ts ASC").fetchall()
+    conn.close()
+    df = pd.DataFrame(rows, columns=["timestamp", "turbidity", "voltage", "status"])
+    df["timestamp"] = pd.to_datetime(df["timestamp"])
+    df.set_index("timestamp", inplace=True)
+    df.index.min(), df.index.max(), df["status"].unique().tolist()
+    filtered = df.copy()
+    if start is not None:
+        filtered = filtered.loc[pd.to_datetime(start, unit="ms", utc=True).tz_convert(None):
+                                pd.to_datetime(end, unit="ms", utc=True).tz_convert(None)]
+    if statuses:
+        filtered = filtered[filtered["status"].isin(statuses)]
+    return filtered.iloc[::-1]
+
+
+def paged(data, start, end, statuses, pages=1):
+    first_ms, last_ms, _ = data.overview()
+    start = first_ms if start is None else start
+    end = last_ms if end is None else end
+    cursor = ("raw", None)
+    for _ in range(pages):
+        df, cursor = data.history_page(cursor, start, end, statuses, PAGE)
+        if cursor is None:
+            break
+    total = data.history_count(start, end, statuses, cap=CAP)
+    return df, total
+
+
+def timed(fn):
+    t0 = time.perf_counter()
+    result = fn()
+    return (time.perf_counter() - t0) * 1000.0, result
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "turbidity.db")
+        t0 = time.perf_counter()
+        build(db_path, n)
+        print(f"Tạo {n} dòng: {time.perf_counter() - t0:.1f} s")
+        mid = T0_MS + (n // 2) * 1000
+        cases = [
+            ("mở lần đầu (toàn bộ, mọi trạng thái)", None, None, None, 1),
+            ("một ngày ở giữa", mid, mid + 86_399_999, None, 1),
+            ("trạng thái hiếm (~1%)", None, None, ["Nước rất đục"], 1),
+            ("hai trạng thái", None, None, ["Nước rất đục", "Nước trong"], 1),
+            ("lật tới trang 20", None, None, None, 20),
+        ]
+        data = DashboardData(db_path, archive_dir=os.path.join(tmp, "archive"))
+        print(f"{'trường hợp':<38} {'cách cũ (ms)':>13} {'SQL (ms)':>10}  kết quả")
+        for name, start, end, statuses, pages in cases:
+            legacy_ms, legacy_df = timed(lambda: legacy(db_path, start, end, statuses))
+            sql_ms, (df, total) = timed(lambda: paged(data, start, end, statuses, pages))
+            if pages == 1:
+                # Trang đầu phải trùng với phần đầu kết quả cũ
+                assert df["turbidity"].tolist() == legacy_df["turbidity"].iloc[:PAGE].tolist()
+            shown = f"hơn {CAP}" if total > CAP else str(total)
+            print(f"{name:<38} {legacy_ms:>13.0f} {sql_ms:>10.2f}  {len(legacy_df)} dòng / trang {len(df)}, "
+                  f"tổng {shown}")
+        data.close()
+
+
+if __name__ == "__main__":
+    main()
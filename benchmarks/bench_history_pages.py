@@ -0,0 +1,100 @@
+"""Đo thời gian tải một trang lịch sử trên bảng lớn: OFFSET (cách phân trang thông thường) và keyset theo id.
+
+Tạo CSDL tạm với N dòng thô 1 Hz (~1% "Nước rất đục"), rồi đo:
+  - trang ở các độ sâu khác nhau: LIMIT/OFFSET trên VIEW readings và turbidity_db.samples_page
+  - lọc trạng thái hiếm, lọc khoảng một ngày, nhảy tới một thời điểm
+  - HistoryPager cuộn qua nhiều trang: số dòng giữ trong bộ nhớ không tăng
+
+Chạy: python benchmarks/bench_history_pages.py [số_dòng]
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import turbidity_db
+from history_pager import HistoryPager
+
+PAGE = 200
+T0_MS = 1_700_000_000_000
+
+
+def build(db_path, n):
+    turbidity_db.init_db(db_path)
+    conn = turbidity_db.connect(db_path)
+    chunk = 100_000
+    for base in range(0, n, chunk):
+        rows = []
+        for i in range(base, min(n, base + chunk)):
+            turbidity = 150.0 if i % 97 == 0 else 5.0 + (i % 40)
+            rows.append((None, 3600.0, turbidity, status_of(turbidity), "Arduino Uno", T0_MS + i * 1000))
+        turbidity_db.insert_rows(conn, rows)
+        conn.commit()
+    return conn
+
+
+def status_of(turbidity):
+    if turbidity <= 10: return "Nước trong"
+    if turbidity <= 50: return "Nước hơi đục"
+    if turbidity <= 100: return "Nước đục"
+    return "Nước rất đục"
+
+
+def timed(fn, repeat=5):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - t0)
+    return statistics.median(times) * 1000.0, result
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "history.db")
+        t0 = time.perf_counter()
+        conn = build(db_path, n)
+        print(f"Tạo {n} dòng: {time.perf_counter() - t0:.1f} s")
+        max_id = conn.execute("SELECT MAX(id) FROM samples").fetchone()[0]
+
+        print(f"{'độ sâu':>10} {'OFFSET (ms)':>12} {'keyset (ms)':>12}")
+        for depth in (0, n // 10, n // 2, n - PAGE):
+            offset_ms, _ = timed(lambda: conn.execute(
+                "SELECT id, ts, voltage, turbidity, status FROM readings ORDER BY id DESC LIMIT ? OFFSET ?",
+                (PAGE, depth)).fetchall())
+            keyset_ms, rows = timed(lambda: turbidity_db.samples_page(conn, before=max_id + 1 - depth, limit=PAGE))
+            assert len(rows) == PAGE
+            print(f"{depth:>10} {offset_ms:>12.2f} {keyset_ms:>12.2f}")
+
+        mid_ms = T0_MS + (n // 2) * 1000
+        rare_ms, rows = timed(lambda: turbidity_db.samples_page(conn, before=max_id // 2, limit=PAGE,
+                                                                status="Nước rất đục"))
+        assert len(rows) == PAGE and all(r[4] == "Nước rất đục" for r in rows)
+        print(f"Lọc trạng thái hiếm (~1%), giữa bảng: {rare_ms:.2f} ms/trang")
+        range_ms, rows = timed(lambda: turbidity_db.samples_page(conn, limit=PAGE, start_ms=mid_ms,
+                                                                 end_ms=mid_ms + 86_400_000))
+        assert rows[0][0] - rows[-1][0] == PAGE - 1
+        print(f"Lọc khoảng 1 ngày giữa bảng: {range_ms:.2f} ms/trang")
+        jump_ms, _ = timed(lambda: turbidity_db.samples_page(
+            conn, before=turbidity_db.sample_id_at(conn, mid_ms) + 1, limit=PAGE))
+        print(f"Nhảy tới thời điểm + tải trang: {jump_ms:.2f} ms")
+
+        pager = HistoryPager(lambda before=None, after=None, limit=PAGE: turbidity_db.samples_page(
+            conn, before=before, after=after, limit=limit), page_size=PAGE, max_pages=3)
+        pager.reset()
+        t0 = time.perf_counter()
+        peak = 0
+        for _ in range(500):
+            pager.older()
+            peak = max(peak, len(pager))
+        elapsed = time.perf_counter() - t0
+        print(f"Cuộn 500 trang cũ hơn: {elapsed / 500 * 1000:.2f} ms/trang, tối đa {peak} dòng trong bộ nhớ")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""Kênh đẩy cục bộ (live_feed) so với dashboard tự quét DB.
+
+  1. Độ trễ publish -> FeedSubscriber trên 127.0.0.1 (100 mẫu/giây) và thông lượng khi dồn dập
+  2. Người nghe không đọc: publish() vẫn không chặn, người nghe bị ngắt khi hàng đợi đầy
+  3. Độ cũ dữ liệu người xem thấy: ghi 10 mẫu/giây qua BatchedDBWriter (như chương trình desktop)
+     và mỗi người xem làm mới phần thời gian thực theo chu kỳ của app_mobile:
+       - đọc DB mỗi 1 s (đang tăng tốc) / mỗi 10 s (ổn định)
+       - nhận dữ liệu đẩy, vẽ lại mỗi 0,5 s
+     Độ cũ lúc vẽ = lúc người xem vẽ lại trừ lúc mẫu mới nhất được tạo ra; màn hình giữ nguyên tới
+     lần vẽ sau nên số liệu người xem nhìn thấy cũ tới (độ cũ lúc vẽ + chu kỳ).
+
+Chạy: python benchmarks/bench_live_feed.py [số_người_xem] [số_giây_mỗi_chế_độ]
+"""
+import os
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import turbidity_db
+from dashboard_data import DashboardData
+from live_feed import FeedPublisher, FeedSubscriber
+
+RATE_HZ = 10
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def record(seq):
+    return {"ts_ms": int(time.time() * 1000), "voltage": 3600.0, "turbidity": float(seq),
+            "status": "Nước trong", "source": "Arduino Uno", "raw_turbidity": None, "sent": time.perf_counter()}
+
+
+def wait_subscribed(publisher):
+    # Kết nối TCP xong trước khi luồng accept đăng ký người nghe: chờ để không lệ thuộc phần replay
+    while publisher.stats()["subscribers"] == 0:
+        time.sleep(0.01)
+
+
+def wire_latency(count=1000):
+    publisher = FeedPublisher(port=0).start()
+    latencies = []
+    done = threading.Event()
+
+    def on_record(rec):
+        latencies.append(time.perf_counter() - rec["sent"])
+        if len(latencies) == count:
+            done.set()
+
+    subscriber = FeedSubscriber(port=publisher.port, on_record=on_record).start()
+    wait_subscribed(publisher)
+    for seq in range(count):
+        publisher.publish(record(seq))
+        time.sleep(0.01)
+    done.wait(5.0)
+    ms = [x * 1000 for x in latencies]
+    print(f"Độ trễ publish -> subscriber ({count} mẫu, 100/giây): trung vị {statistics.median(ms):.3f} ms, "
+          f"p99 {percentile(ms, 0.99):.3f} ms")
+
+    subscriber.stop()
+    publisher.stop()
+
+    # Thông lượng: hàng đợi đủ lớn để không ngắt người nghe (mặc định 1000 dòng sẽ ngắt)
+    burst = 200_000
+    publisher = FeedPublisher(port=0, max_pending=burst).start()
+    subscriber = FeedSubscriber(port=publisher.port, on_record=on_record).start()
+    wait_subscribed(publisher)
+    done.clear()
+    latencies.clear()
+    count = burst
+    t0 = time.perf_counter()
+    for seq in range(burst):
+        publisher.publish(record(seq))
+    publish_s = time.perf_counter() - t0
+    done.wait(30.0)
+    total_s = time.perf_counter() - t0
+    print(f"Dồn dập {burst} mẫu: publish {publish_s / burst * 1e6:.2f} µs/mẫu, nhận đủ sau {total_s:.2f} s "
+          f"({len(latencies)} mẫu, bị ngắt vì chậm: {publisher.stats()['dropped_slow']})")
+    subscriber.stop()
+    publisher.stop()
+
+
+def stalled_subscriber():
+    publisher = FeedPublisher(port=0, max_pending=1000).start()
+    sock = socket.create_connection(("127.0.0.1", publisher.port))
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)  # không bao giờ đọc
+    time.sleep(0.1)
+    worst = 0.0
+    for seq in range(50_000):
+        t0 = time.perf_counter()
+        publisher.publish(record(seq))
+        worst = max(worst, time.perf_counter() - t0)
+    print(f"Người nghe không đọc: publish chậm nhất {worst * 1000:.2f} ms, {publisher.stats()}")
+    sock.close()
+    publisher.stop()
+
+
+def staleness(db_path, viewers, seconds, interval, use_feed):
+    writer = turbidity_db.BatchedDBWriter(db_path).start()
+    publisher = FeedPublisher(port=0).start() if use_feed else None
+    produced = {}
+    stop = threading.Event()
+
+    def produce():
+        seq = 0
+        while not stop.wait(1.0 / RATE_HZ):
+            seq += 1
+            produced[seq] = time.monotonic()
+            ts_ms = int(time.time() * 1000)
+            writer.write(ts_ms, 3600.0, float(seq), "Nước trong", "Arduino Uno")
+            if publisher is not None:
+                publisher.publish({"ts_ms": ts_ms, "voltage": 3600.0, "turbidity": float(seq),
+                                   "status": "Nước trong", "source": "Arduino Uno", "raw_turbidity": None})
+
+    threading.Thread(target=produce, daemon=True).start()
+    time.sleep(2.5)  # chờ lô DB đầu tiên để DB có dữ liệu
+    data = DashboardData(db_path, tail_rows=50, feed_port=publisher.port if publisher else None)
+    queries_before = data.queries
+    ages, costs = [], []
+    lock = threading.Lock()
+
+    def view(offset):
+        time.sleep(offset)
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            frame = data.latest()
+            cost = time.perf_counter() - t0
+            if not frame.empty:
+                age = time.monotonic() - produced[int(frame["turbidity"].iloc[-1])]
+                with lock:
+                    ages.append(age)
+                    costs.append(cost)
+            stop.wait(interval)
+
+    threads = [threading.Thread(target=view, args=(interval * i / viewers,), daemon=True) for i in range(viewers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    queries = data.queries - queries_before
+    data.close()
+    writer.close()
+    if publisher is not None:
+        publisher.stop()
+    return ages, costs, queries
+
+
+def main():
+    viewers = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 30.0
+    wire_latency()
+    stalled_subscriber()
+    print(f"\n{viewers} người xem, {RATE_HZ} mẫu/giây, {seconds:.0f} s mỗi chế độ:")
+    print(f"{'chế độ':<28} {'cũ lúc vẽ TB':>13} {'cũ tối đa p95':>14} {'truy vấn DB/phút':>17} "
+          f"{'latest() (ms)':>14}")
+    modes = [
+        ("đọc DB mỗi 10 s", 10.0, False),
+        ("đọc DB mỗi 1 s", 1.0, False),
+        ("kênh đẩy, vẽ lại mỗi 0,5 s", 0.5, True),
+    ]
+    for name, interval, use_feed in modes:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "turbidity.db")
+            turbidity_db.init_db(db_path)
+            ages, costs, queries = staleness(db_path, viewers, seconds, interval, use_feed)
+        print(f"{name:<28} {statistics.mean(ages):>11.2f} s {percentile(ages, 0.95) + interval:>12.2f} s "
+              f"{queries * 60 / seconds:>17.0f} {statistics.median(costs) * 1000:>14.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Kiểm tra NotificationDispatcher với máy chủ HTTP cục bộ đóng vai Telegram API.
+
+  1. Đợt cảnh báo dồn dập: thời gian submit() (phía luồng gọi), số request HTTP, số kết nối TCP
+  2. So với cách cũ: urlopen đồng bộ, mỗi tin một kết nối mới, luồng gọi chờ trọn request
+  3. Máy chủ lỗi 500 / 429 ở vài request đầu: tin vẫn tới nơi nhờ thử lại có backoff
+
+Chạy: python benchmarks/bench_notifier.py [số_tin] [độ_trễ_máy_chủ_ms]
+"""
+import os
+import sys
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from notifier import NotificationDispatcher
+
+
+class FakeTelegram(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    delay = 0.0
+    fail_next = []  # mã lỗi trả về cho các request kế tiếp
+    requests = 0
+    connections = set()
+    messages = []
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        cls = type(self)
+        with cls.lock:
+            cls.requests += 1
+            cls.connections.add(self.client_address)
+            status = cls.fail_next.pop(0) if cls.fail_next else 200
+            if status == 200:
+                cls.messages.append(parse_qs(body.decode())["text"][0])
+        time.sleep(cls.delay)
+        payload = b'{"ok":true}' if status == 200 else (
+            b'{"ok":false,"parameters":{"retry_after":0.2}}' if status == 429 else b'{"ok":false}')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+    @classmethod
+    def reset(cls, delay=0.0, fail_next=()):
+        cls.delay = delay
+        cls.fail_next = list(fail_next)
+        cls.requests = 0
+        cls.connections = set()
+        cls.messages = []
+
+
+def legacy_send(url, message):
+    # Cách cũ: urlopen đồng bộ, kết nối mới cho mỗi tin
+    req = urllib.request.Request(url, data=urlencode({"chat_id": "1", "text": message}).encode("utf-8"))
+    with urllib.request.urlopen(req, timeout=10) as resp:
+        resp.read()
+
+
+def wait_idle(dispatcher, timeout=30.0):
+    deadline = time.perf_counter() + timeout
+    while dispatcher.stats()["queued"] or dispatcher.stats()["pending"] or dispatcher.sent + dispatcher.failed == 0:
+        if time.perf_counter() > deadline:
+            raise TimeoutError("dispatcher chưa gửi xong")
+        time.sleep(0.01)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    delay_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 100.0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeTelegram)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    api_url = f"http://127.0.0.1:{server.server_port}"
+    creds = lambda: ("TEST", "1")  # noqa: E731
+
+    # 1-2. Đợt n cảnh báo từ 4 thiết bị
+    FakeTelegram.reset(delay=delay_ms / 1000.0)
+    t0 = time.perf_counter()
+    for i in range(n):
+        legacy_send(f"{api_url}/botTEST/sendMessage", f"Cảnh báo {i}")
+    legacy = time.perf_counter() - t0
+    print(f"Cách cũ: {n} tin chặn luồng gọi {legacy * 1000:.0f} ms, "
+          f"{FakeTelegram.requests} request, {len(FakeTelegram.connections)} kết nối")
+
+    FakeTelegram.reset(delay=delay_ms / 1000.0)
+    dispatcher = NotificationDispatcher(creds, api_url=api_url, coalesce_sec=0.3, label_channels=True).start()
+    t0 = time.perf_counter()
+    for i in range(n):
+        dispatcher.submit(f"Cảnh báo {i}", channel=f"dev{i % 4}", skip_cooldown=True)
+    submit = time.perf_counter() - t0
+    wait_idle(dispatcher)
+    dispatcher.stop()
+    stats = dispatcher.stats()
+    print(f"NotificationDispatcher: submit() tổng {submit * 1000:.2f} ms ({submit / n * 1e6:.1f} µs/tin), "
+          f"{FakeTelegram.requests} request, {len(FakeTelegram.connections)} kết nối; {stats}")
+    delivered = sum(m.count("Cảnh báo") for m in FakeTelegram.messages)
+    assert delivered == n, (delivered, n)
+
+    # 3. Lỗi tạm thời rồi phục hồi
+    FakeTelegram.reset(fail_next=[500, 429, 503])
+    dispatcher = NotificationDispatcher(creds, api_url=api_url, coalesce_sec=0.0, backoff_sec=0.1).start()
+    t0 = time.perf_counter()
+    dispatcher.submit("Trạng thái thay đổi", skip_cooldown=True)
+    wait_idle(dispatcher)
+    dispatcher.stop()
+    print(f"Sau 500/429/503: gửi được sau {(time.perf_counter() - t0) * 1000:.0f} ms, "
+          f"retries={dispatcher.retries}, failed={dispatcher.failed}, kết nối={dispatcher.connections}")
+    assert FakeTelegram.messages == ["Trạng thái thay đổi"]
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Đo số dòng/giây của parser serial: bản cũ (replace + re.search mỗi dòng) và bản mới.
+
+Chạy: python benchmarks/bench_parser.py [số_dòng]
+"""
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import serial_parser
+
+
+def legacy_parse_serial_line(line):
+    # Bản sao nguyên văn TurbiditySensorGUI.parse_serial_line trước khi tối ưu
+    line = line.replace("Vôn", "VOLTAGE").replace("Độ đục", "TURBIDITY")
+    if "VOLTAGE" not in line or "TURBIDITY" not in line:
+        raise ValueError("Dòng không chứa dữ liệu hợp lệ")
+    turb_match = re.search(r"TURBIDITY\s*[:=]\s*([-+]?\d*\.?\d+)", line, re.IGNORECASE)
+    if not turb_match: raise ValueError("Không tìm thấy TURBIDITY")
+    turbidity = float(turb_match.group(1))
+    volt_match = re.search(r"VOLT(?:AGE)?\s*[:=]\s*([-+]?\d*\.?\d+)\s*(mV|v)?", line, re.IGNORECASE)
+    if not volt_match: raise ValueError("Không tìm thấy VOLTAGE")
+    volt_val = float(volt_match.group(1))
+    volt_unit = volt_match.group(2)
+    voltage_mV = volt_val
+    if volt_unit and volt_unit.lower() == 'v':
+        voltage_mV = volt_val * 1000.0
+    elif not volt_unit and abs(volt_val) < 100:
+        voltage_mV = volt_val * 1000.0
+    return float(voltage_mV), float(turbidity)
+
+
+def make_lines(n):
+    lines = [f"Vôn:{3000 + i % 600},Độ đục:{(i * 7) % 1000 / 10:.2f}" for i in range(n)]
+    # Một ít dòng lạ để đường dự phòng cũng được đo
+    for i in range(0, n, 50):
+        lines[i] = "VOLTAGE = 3.55 V, TURBIDITY = 12.5" if i % 100 else "ACK:A"
+    return lines
+
+
+def bench(fn, lines):
+    start = time.perf_counter()
+    ok = 0
+    for line in lines:
+        try:
+            fn(line)
+            ok += 1
+        except ValueError:
+            pass
+    return time.perf_counter() - start, ok
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    lines = make_lines(n)
+
+    # Kết quả phải giống hệt bản cũ
+    for line in lines[:2000]:
+        try:
+            expected = legacy_parse_serial_line(line)
+        except ValueError:
+            expected = None
+        try:
+            got = serial_parser.parse_serial_line(line)
+        except ValueError:
+            got = None
+        assert expected == got, (line, expected, got)
+
+    old_s, old_ok = bench(legacy_parse_serial_line, lines)
+    new_s, new_ok = bench(serial_parser.parse_serial_line, lines)
+    t0 = time.perf_counter()
+    volts, turbs, errors = serial_parser.parse_lines(lines)
+    batch_s = time.perf_counter() - t0
+    assert new_ok == old_ok == len(turbs) and errors == n - new_ok
+
+    print(f"Số dòng: {n} ({n - old_ok} dòng không hợp lệ)")
+    print(f"Parser cũ        : {n / old_s:12,.0f} dòng/s")
+    print(f"Parser mới       : {n / new_s:12,.0f} dòng/s  (x{old_s / new_s:.1f})")
+    print(f"parse_lines (lô) : {n / batch_s:12,.0f} dòng/s  (x{old_s / batch_s:.1f})")
+
+
+if __name__ == "__main__":
+    main()
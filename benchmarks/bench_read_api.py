@@ -0,0 +1,162 @@
+"""Nhiều client cùng hỏi dữ liệu: mỗi client tự mở turbidity.db (cách cũ) so với read_api.
+
+Tạo CSDL tạm N dòng thô (kèm bảng tổng hợp), một luồng ghi 10 mẫu/giây qua BatchedDBWriter
+(commit mỗi 2 s như chương trình desktop). Mỗi client là một luồng hỏi liên tục, lần lượt:
+mẫu mới nhất, 50 mẫu gần nhất, một trang khoảng thời gian và 7 ngày tổng hợp theo giờ.
+  - DB trực tiếp: mỗi client một kết nối SQLite, chạy truy vấn mỗi lần hỏi
+  - API: keep-alive + gzip, luôn nhận đủ thân
+  - API + If-None-Match: client gửi lại ETag đã có, không đổi thì nhận 304 không thân
+Client và server chạy chung một tiến trình (chung GIL): số tuyệt đối thấp hơn khi server chạy riêng,
+so sánh tương đối vẫn đúng.
+
+Chạy: python benchmarks/bench_read_api.py [số_dòng] [số_client] [số_giây_mỗi_chế_độ]
+"""
+import http.client
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import read_api
+import turbidity_db
+from dashboard_data import connect_readonly
+
+T0_MS = 1_700_000_000_000
+
+
+def build(db_path, n):
+    turbidity_db.init_db(db_path)
+    conn = turbidity_db.connect(db_path)
+    chunk = 100_000
+    for base in range(0, n, chunk):
+        rows = [(None, 3600.0, 5.0 + i % 40, "Nước trong", "Arduino Uno", T0_MS + i * 1000)
+                for i in range(base, min(n, base + chunk))]
+        turbidity_db.insert_rows(conn, rows)
+        conn.commit()
+    conn.close()
+    turbidity_db.backfill_rollups(db_path)
+
+
+def urls(n):
+    mid = T0_MS + (n // 2) * 1000
+    return [
+        "/api/latest",
+        "/api/readings?n=50",
+        f"/api/range?start={mid}&end={mid + 3_600_000}&limit=200",
+        f"/api/rollups?level=1h&start={T0_MS}&limit=168",
+    ]
+
+
+def direct_queries(n):
+    # Cùng bốn truy vấn, chạy thẳng trên SQLite
+    mid = T0_MS + (n // 2) * 1000
+    return [
+        lambda conn: turbidity_db.samples_page(conn, limit=1),
+        lambda conn: turbidity_db.samples_page(conn, limit=50),
+        lambda conn: turbidity_db.samples_page(conn, limit=201, start_ms=mid, end_ms=mid + 3_600_000),
+        lambda conn: turbidity_db.query_rollups(conn, "1h", start=turbidity_db.ms_to_ts(T0_MS), limit=168),
+    ]
+
+
+def direct_client(db_path, n, stop, out):
+    conn = connect_readonly(db_path)
+    queries = direct_queries(n)
+    latencies, i = [], 0
+    while not stop.is_set():
+        t0 = time.perf_counter()
+        queries[i % len(queries)](conn)
+        latencies.append(time.perf_counter() - t0)
+        i += 1
+    conn.close()
+    out.append((latencies, 0, 0))
+
+
+def api_client(port, paths, conditional, stop, out):
+    conn = http.client.HTTPConnection("127.0.0.1", port)
+    etags = {}
+    latencies, received, not_modified, i = [], 0, 0, 0
+    while not stop.is_set():
+        path = paths[i % len(paths)]
+        headers = {"Accept-Encoding": "gzip"}
+        if conditional and path in etags:
+            headers["If-None-Match"] = etags[path]
+        t0 = time.perf_counter()
+        conn.request("GET", path, headers=headers)
+        response = conn.getresponse()
+        body = response.read()
+        latencies.append(time.perf_counter() - t0)
+        received += len(body)
+        if response.status == 304:
+            not_modified += 1
+        else:
+            etags[path] = response.getheader("ETag")
+        i += 1
+    conn.close()
+    out.append((latencies, received, not_modified))
+
+
+def run(name, target, args, clients, seconds, db_path):
+    writer = turbidity_db.BatchedDBWriter(db_path).start()
+    stop = threading.Event()
+
+    def produce():
+        while not stop.wait(0.1):
+            writer.write(int(time.time() * 1000), 3600.0, 12.0, "Nước hơi đục", "Arduino Uno")
+
+    threading.Thread(target=produce, daemon=True).start()
+    out = []
+    threads = [threading.Thread(target=target, args=args + (stop, out), daemon=True) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    writer.close()
+    latencies = [x for lat, _, _ in out for x in lat]
+    requests = len(latencies)
+    received = sum(r for _, r, _ in out)
+    not_modified = sum(m for _, _, m in out)
+    latencies.sort()
+    per_request = f"{received / max(1, requests):.0f}" if target is api_client else "-"
+    print(f"{name:<24} {requests / seconds:>8.0f} {statistics.median(latencies) * 1000:>9.2f} "
+          f"{latencies[int(0.99 * (len(latencies) - 1))] * 1000:>9.2f} {per_request:>10} "
+          f"{not_modified / max(1, requests) * 100:>7.0f}%")
+    return requests
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 500_000
+    clients = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 10.0
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "turbidity.db")
+        t0 = time.perf_counter()
+        build(db_path, n)
+        print(f"Tạo {n} dòng + bảng tổng hợp: {time.perf_counter() - t0:.1f} s")
+        print(f"{clients} client, {seconds:.0f} s mỗi chế độ; DB nhận 10 mẫu/giây, commit mỗi 2 s")
+        print(f"{'chế độ':<24} {'req/s':>8} {'p50 (ms)':>9} {'p99 (ms)':>9} {'byte/req':>10} {'304':>8}")
+        requests = run("DB trực tiếp", direct_client, (db_path, n), clients, seconds, db_path)
+        print(f"{'':<24} truy vấn DB: {requests} (mọi request)")
+        server = read_api.make_server(db_path, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        api = server.RequestHandlerClass.api
+        port = server.server_address[1]
+        for name, conditional in (("API", False), ("API + If-None-Match", True)):
+            before = api.stats()
+            requests = run(name, api_client, (port, urls(n), conditional), clients, seconds, db_path)
+            after = api.stats()
+            queries = after["queries"] - before["queries"]
+            print(f"{'':<24} truy vấn DB: {queries} ({queries / max(1, requests) * 100:.2f}% số request), "
+                  f"bộ đệm bị xóa {after['invalidations'] - before['invalidations']} lần")
+        server.shutdown()
+        server.server_close()
+        api.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""Đo luồng đọc serial trên thiết bị giả bằng pty (chỉ chạy trên POSIX, cần pyserial).
+
+  1. CPU khi rảnh: vòng lặp cũ kiểm tra `in_waiting` so với N SensorReader chặn trong read()
+  2. Độ trễ từ lúc thiết bị ghi một dòng tới lúc dòng đã được parse
+  3. Thời gian kết nối lại khi thiết bị bị rút ra rồi cắm lại (symlink trỏ sang pty mới)
+
+Chạy: python benchmarks/bench_serial_transport.py [số_thiết_bị] [số_giây_đo_rảnh]
+"""
+import os
+import pty
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import serial
+
+import multi_sensor
+import serial_parser
+
+multi_sensor.ARDUINO_RESET_SEC = 0.05  # thiết bị giả không cần chờ khởi động lại
+
+
+class FakeDevice:
+    """Một cặp pty: phía slave là "cổng serial", phía master đóng vai Arduino."""
+
+    def __init__(self):
+        self.master, self.slave = pty.openpty()
+        self.path = os.ttyname(self.slave)
+
+    def write_line(self, line):
+        os.write(self.master, (line + "\n").encode())
+
+    def unplug(self):
+        os.close(self.master)
+        os.close(self.slave)
+
+
+def cpu_percent(seconds):
+    c0, t0 = time.process_time(), time.perf_counter()
+    time.sleep(seconds)
+    return (time.process_time() - c0) / (time.perf_counter() - t0) * 100.0
+
+
+def legacy_idle_cpu(seconds):
+    # Vòng lặp cũ của read_serial_data: không có dữ liệu thì quay lại kiểm tra in_waiting ngay
+    dev = FakeDevice()
+    conn = serial.Serial(dev.path, 9600, timeout=1)
+    running = True
+
+    def loop():
+        while running:
+            if conn.in_waiting > 0:
+                conn.readline()
+
+    t = threading.Thread(target=loop, daemon=True)
+    t.start()
+    cpu = cpu_percent(seconds)
+    running = False
+    t.join()
+    conn.close()
+    dev.unplug()
+    return cpu
+
+
+def wait_for(predicate, timeout=5.0):
+    deadline = time.perf_counter() + timeout
+    while not predicate():
+        if time.perf_counter() > deadline:
+            raise TimeoutError("thiết bị giả không phản hồi")
+        time.sleep(0.01)
+
+
+def reader_idle_and_latency(n_devices, seconds, n_lines=300):
+    devices = [FakeDevice() for _ in range(n_devices)]
+    latencies = []
+    sent = {}
+
+    def on_line(device_id, line):
+        voltage, _ = serial_parser.parse_serial_line(line)
+        latencies.append(time.perf_counter() - sent[int(voltage)])
+
+    hub = multi_sensor.SensorHub(
+        [(f"dev{i}", dev.path) for i, dev in enumerate(devices)], "text",
+        on_line=on_line, on_reading=None, on_status=lambda *a: None,
+    ).start()
+    wait_for(lambda: len(hub.connected()) == n_devices)
+    idle = cpu_percent(seconds)
+
+    for seq in range(n_lines):
+        dev = devices[seq % n_devices]
+        sent[1000 + seq] = time.perf_counter()
+        dev.write_line(f"Vôn:{1000 + seq},Độ đục:12.50")
+        time.sleep(0.002)
+    wait_for(lambda: len(latencies) == n_lines)
+    hub.stop()
+    for dev in devices:
+        dev.unplug()
+    return idle, sorted(latencies)
+
+
+def reconnect_time():
+    # Cổng cấu hình là một symlink; "cắm lại" = trỏ symlink sang pty mới
+    link = os.path.join(tempfile.mkdtemp(), "ttyFAKE")
+    dev = FakeDevice()
+    os.symlink(dev.path, link)
+    states = []
+    reader = multi_sensor.SensorReader("dev", link, "text", lambda *a: None, None,
+                                       lambda _d, state, _x: states.append((time.perf_counter(), state))).start()
+    wait_for(lambda: reader.is_connected)
+    dev.unplug()
+    replug = FakeDevice()
+    unplugged_at = time.perf_counter()
+    os.replace(_tmp_link(link, replug.path), link)
+    wait_for(lambda: states[-1][1] == "connected" and states[-1][0] > unplugged_at)
+    elapsed = states[-1][0] - unplugged_at
+    reader.request_stop()
+    reader.join()
+    replug.unplug()
+    return elapsed, reader.reconnects
+
+
+def _tmp_link(link, target):
+    tmp = link + ".new"
+    os.symlink(target, tmp)
+    return tmp
+
+
+def main():
+    n_devices = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 3.0
+
+    legacy = legacy_idle_cpu(seconds)
+    print(f"Vòng lặp in_waiting cũ, 1 cổng rảnh: {legacy:6.1f}% CPU")
+
+    idle, lat = reader_idle_and_latency(n_devices, seconds)
+    print(f"SensorReader, {n_devices} cổng rảnh:      {idle:6.1f}% CPU")
+    ms = [x * 1000.0 for x in lat]
+    print(f"Độ trễ ghi → parse ({len(ms)} dòng): p50 {statistics.median(ms):.3f} ms, "
+          f"p99 {ms[int(len(ms) * 0.99) - 1]:.3f} ms, max {ms[-1]:.3f} ms")
+
+    elapsed, reconnects = reconnect_time()
+    print(f"Kết nối lại sau khi rút/cắm thiết bị: {elapsed * 1000:.0f} ms (reconnects={reconnects})")
+
+
+if __name__ == "__main__":
+    main()
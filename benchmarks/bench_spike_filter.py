@@ -0,0 +1,60 @@
+"""Đo chi phí mỗi mẫu của bộ lọc gai và hiệu quả trên turbidity_log.json.
+
+Chạy: python benchmarks/bench_spike_filter.py [số_mẫu]
+"""
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import spike_filter
+from ingest_pipeline import get_water_status_bootstyle
+
+LOG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "turbidity_log.json")
+
+
+def synthetic(n, seed=0):
+    rng = random.Random(seed)
+    values = []
+    level = 5.0
+    for i in range(n):
+        level = max(0.0, level + rng.gauss(0, 0.3))
+        r = rng.random()
+        values.append(640.0 if r < 0.01 else 0.0 if r < 0.02 else level)
+    return values
+
+
+def status_changes(values):
+    statuses = [get_water_status_bootstyle(v)[0] for v in values]
+    return sum(1 for a, b in zip(statuses, statuses[1:]) if a != b)
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    values = synthetic(n)
+    print(f"Chi phí mỗi mẫu ({n} mẫu):")
+    for mode in spike_filter.MODES:
+        windows = (7, 31, 301) if mode in ("median", "hampel") else (7,)
+        for window in windows:
+            f = spike_filter.SpikeFilter(mode, window=window)
+            update = f.update
+            t0 = time.perf_counter()
+            for v in values:
+                update(v)
+            per_sample = (time.perf_counter() - t0) / n
+            print(f"  {mode:>8} w={window:<4}: {per_sample * 1e6:6.2f} µs/mẫu, thay {f.replaced} mẫu")
+
+    if os.path.exists(LOG_PATH):
+        with open(LOG_PATH, "r", encoding="utf-8") as fh:
+            raw = [float(r["turbidity"]) for r in json.load(fh)]
+        print(f"\nturbidity_log.json ({len(raw)} mẫu), số lần đổi trạng thái:")
+        for mode in spike_filter.MODES:
+            f = spike_filter.SpikeFilter(mode)
+            print(f"  {mode:>8}: {status_changes([f.update(v) for v in raw])}")
+
+
+if __name__ == "__main__":
+    main()
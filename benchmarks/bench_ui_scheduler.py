@@ -0,0 +1,106 @@
+"""Mô phỏng luồng Tk khi mẫu đến nhanh hơn tốc độ vẽ: after(0) cho từng mẫu so với CoalescingScheduler.
+
+Luồng "analytics" sinh snapshot với tần số cho trước; luồng "Tk" xử lý hàng đợi sự kiện,
+mỗi lần vẽ tốn RENDER_MS. Đo độ trễ (tuổi của dữ liệu lúc được vẽ) và độ dài hàng đợi.
+
+Chạy: python benchmarks/bench_ui_scheduler.py [mẫu/giây] [số_giây]
+"""
+import os
+import queue
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ui_scheduler import CoalescingScheduler
+
+RENDER_MS = 5.0  # ~ một khung blit + cập nhật Meter/nhãn
+TICK_MS = 100
+
+
+def produce(rate, seconds, sink):
+    interval = 1.0 / rate
+    start = time.perf_counter()
+    n = 0
+    while True:
+        now = time.perf_counter()
+        if now - start >= seconds:
+            return n
+        target = start + n * interval
+        if now < target:
+            time.sleep(target - now)
+        sink({"device_id": "dev", "ts": time.perf_counter(), "turbidity": float(n % 100)})
+        n += 1
+
+
+def render(snapshot, ages):
+    time.sleep(RENDER_MS / 1000.0)
+    ages.append(time.perf_counter() - snapshot["ts"])
+
+
+def legacy(rate, seconds):
+    # root.after(0, lambda: render(snapshot)) cho mỗi mẫu = một sự kiện trong hàng đợi Tk
+    events = queue.Queue()
+    ages = []
+    max_depth = 0
+    stop = threading.Event()
+
+    def tk_loop():
+        while not stop.is_set():
+            try:
+                fn = events.get(timeout=0.05)
+            except queue.Empty:
+                continue
+            fn()
+
+    tk = threading.Thread(target=tk_loop, daemon=True)
+    tk.start()
+
+    def sink(snapshot):
+        nonlocal max_depth
+        events.put(lambda: render(snapshot, ages))
+        max_depth = max(max_depth, events.qsize())
+
+    n = produce(rate, seconds, sink)
+    backlog = events.qsize()
+    stop.set()
+    tk.join()
+    return n, ages, {"max_queue": max_depth, "backlog_at_end": backlog}
+
+
+def coalesced(rate, seconds):
+    scheduler = CoalescingScheduler(tick_ms=TICK_MS)
+    ages = []
+    stop = threading.Event()
+
+    def tk_loop():
+        while not stop.is_set():
+            time.sleep(TICK_MS / 1000.0)
+            for snapshot in scheduler.drain().values():
+                render(snapshot, ages)
+
+    tk = threading.Thread(target=tk_loop, daemon=True)
+    tk.start()
+    n = produce(rate, seconds, lambda s: scheduler.push(s["device_id"], s))
+    stop.set()
+    tk.join()
+    return n, ages, scheduler.stats()
+
+
+def report(name, n, ages, extra):
+    ms = sorted(a * 1000.0 for a in ages)
+    print(f"{name}: {n} mẫu, {len(ms)} lần vẽ, tuổi dữ liệu p50 {ms[len(ms) // 2]:.0f} ms, "
+          f"max {ms[-1]:.0f} ms; {extra}")
+
+
+def main():
+    rate = float(sys.argv[1]) if len(sys.argv) > 1 else 500.0
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 3.0
+    print(f"{rate:.0f} mẫu/s trong {seconds:.0f} s, vẽ tốn {RENDER_MS:.0f} ms")
+    report("after(0) mỗi mẫu", *legacy(rate, seconds))
+    report("CoalescingScheduler", *coalesced(rate, seconds))
+
+
+if __name__ == "__main__":
+    main()
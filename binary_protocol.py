@@ -0,0 +1,134 @@
+import binascii
+import struct
+
+# Khung nhị phân của firmware khi build với -DBINARY_PROTOCOL=1 (xem src/main.cpp):
+#   0xAA 0x55 | seq u16 | millis u32 | adc u16 | ntu float32 | crc16 u16   (little-endian, 16 byte)
+SYNC = b"\xaa\x55"
+FRAME = struct.Struct("<2sHIHfH")
+FRAME_SIZE = FRAME.size
+CRC_START = len(SYNC)
+CRC_END = FRAME_SIZE - 2
+
+TEXT_BAUDRATE = 9600
+BINARY_BAUDRATE = 115200
+
+# Hằng số chuyển ADC → mV, trùng với VCC / ADC_MAX_COUNT trong firmware
+VCC_MV = 5000.0
+ADC_MAX_COUNT = 1023.0
+
+# seq lùi quá số khung này (hoặc lùi về 0) nghĩa là firmware đã khởi động lại (reset, sụt nguồn...)
+# và frameSeq đếm lại từ 0, không phải khung đến muộn. seq tiến thì chỉ coi là khởi động lại khi millis
+# của khung lùi lại: khoảng trống lớn (kể cả vắt qua 0xFFFF -> 0) với millis vẫn tăng là mất khung.
+RESTART_GAP = 64
+
+
+def crc16(data):
+    """CRC16-CCITT (0x1021, khởi tạo 0xFFFF); binascii.crc_hqx nhận memoryview nên không sao chép."""
+    return binascii.crc_hqx(data, 0xFFFF)
+
+
+def adc_to_millivolts(raw_adc):
+    return raw_adc / ADC_MAX_COUNT * VCC_MV
+
+
+def encode_frame(seq, timestamp_ms, raw_adc, ntu):
+    """Đóng gói một khung giống firmware (dùng cho benchmark và thiết bị giả lập)."""
+    body = FRAME.pack(SYNC, seq & 0xFFFF, timestamp_ms & 0xFFFFFFFF, raw_adc, ntu, 0)
+    return body[:CRC_END] + struct.pack("<H", crc16(body[CRC_START:CRC_END]))
+
+
+class FrameDecoder:
+    """Tách khung từ luồng byte serial, kiểm tra CRC và theo dõi số thứ tự.
+
+    `feed(data)` trả về danh sách (seq, timestamp_ms, raw_adc, ntu). Dữ liệu được
+    đọc bằng `unpack_from`/memoryview ngay trên bộ đệm, chỉ cắt bộ đệm một lần mỗi lần gọi.
+
+    Bộ đếm:
+      - frames:       số khung hợp lệ
+      - crc_errors:   số khung sai CRC (bị bỏ, dò lại sync từ byte kế tiếp)
+      - dropped:      số khung bị mất, suy ra từ khoảng trống trong seq
+      - out_of_order: số khung có seq lùi lại một chút hoặc trùng (bị bỏ)
+      - restarts:     số lần thiết bị gửi khởi động lại (seq nhảy về đầu, millis lùi); đồng bộ lại seq,
+                      không bỏ khung
+      - skipped_bytes: số byte rác bỏ qua khi dò sync
+    """
+
+    def __init__(self):
+        self._buf = bytearray()
+        self.last_seq = None
+        self.last_ts = None
+        self.frames = 0
+        self.crc_errors = 0
+        self.dropped = 0
+        self.out_of_order = 0
+        self.restarts = 0
+        self.skipped_bytes = 0
+
+    def reset(self):
+        """Bỏ byte dở dang và seq đã biết (giữ bộ đếm) — gọi sau mỗi lần mở lại cổng."""
+        self._buf.clear()
+        self.last_seq = None
+        self.last_ts = None
+
+    def feed(self, data):
+        buf = self._buf
+        buf += data
+        frames = []
+        pos = 0
+        end = len(buf)
+        with memoryview(buf) as view:
+            while end - pos >= FRAME_SIZE:
+                if buf[pos] != 0xAA or buf[pos + 1] != 0x55:
+                    nxt = buf.find(SYNC, pos + 1)
+                    if nxt < 0:
+                        # Giữ lại byte cuối phòng khi nó là nửa đầu của sync
+                        nxt = end - 1 if buf[end - 1] == 0xAA else end
+                    self.skipped_bytes += nxt - pos
+                    pos = nxt
+                    continue
+                _, seq, ts_ms, raw_adc, ntu, crc = FRAME.unpack_from(buf, pos)
+                if crc16(view[pos + CRC_START:pos + CRC_END]) != crc:
+                    self.crc_errors += 1
+                    self.skipped_bytes += 1
+                    pos += 1
+                    continue
+                pos += FRAME_SIZE
+                if self._check_seq(seq, ts_ms):
+                    self.frames += 1
+                    frames.append((seq, ts_ms, raw_adc, ntu))
+        del buf[:pos]
+        return frames
+
+    def _check_seq(self, seq, ts_ms):
+        if self.last_seq is not None:
+            delta = (seq - self.last_seq) & 0xFFFF
+            if delta == 0:
+                self.out_of_order += 1
+                return False
+            if delta < 0x8000:
+                # Khung muộn có seq lùi nên seq tiến + millis lùi chỉ có thể là khởi động lại
+                # (millis tràn u32 sau ~49 ngày là bước tiến nhỏ theo modulo, không phải lùi)
+                ts_back = (self.last_ts - ts_ms) & 0xFFFFFFFF
+                if 0 < ts_back < 0x80000000:
+                    self.restarts += 1
+                else:
+                    self.dropped += delta - 1
+            elif seq == 0 or 0x10000 - delta > RESTART_GAP:
+                self.restarts += 1
+            else:
+                self.out_of_order += 1
+                return False
+        self.last_seq = seq
+        self.last_ts = ts_ms
+        return True
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "crc_errors": self.crc_errors,
+            "dropped": self.dropped,
+            "out_of_order": self.out_of_order,
+            "restarts": self.restarts,
+            "skipped_bytes": self.skipped_bytes,
+            "buffered": len(self._buf),
+        }
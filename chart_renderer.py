@@ -0,0 +1,141 @@
+import time
+from datetime import datetime
+
+from matplotlib.ticker import FuncFormatter
+
+
+class BlitChartRenderer:
+    """Vẽ biểu đồ trực tiếp bằng blit, giới hạn số khung hình mỗi giây.
+
+    Hai đường (`line`, `trend_line`) được đánh dấu animated nên không nằm trong
+    lần vẽ đầy đủ; nền tĩnh (trục, lưới, nhãn) được chụp lại sau mỗi lần vẽ đầy đủ
+    (`draw_event`). Mỗi khung chỉ khôi phục nền, vẽ lại hai đường và blit vùng trục.
+
+    Vẽ đầy đủ (và tight_layout) chỉ xảy ra khi:
+      - cửa sổ đổi kích thước (`resize_event`)
+      - dữ liệu vượt khỏi giới hạn trục: trục x là timestamp, chừa `x_margin` phần
+        độ rộng phía phải nên chỉ phải dịch trục sau mỗi ~x_margin * 50 mẫu; trục y
+        nới ra khi dữ liệu vượt, thu lại khi dữ liệu chỉ còn chiếm < 1/4 chiều cao
+
+    `update()` có thể gọi với tần suất bất kỳ: nếu chưa tới lượt (1 / max_fps) thì
+    chỉ lưu dữ liệu mới nhất và hẹn vẽ qua `schedule(delay_ms, fn)` (vd. root.after).
+    Không có `schedule` thì vẽ ngay (dùng cho benchmark).
+    """
+
+    def __init__(self, figure, canvas, ax, line, trend_line, max_fps=10.0, schedule=None,
+                 x_margin=0.25, y_margin=0.1):
+        self.figure = figure
+        self.canvas = canvas
+        self.ax = ax
+        self.artists = (line, trend_line)
+        self.line = line
+        self.trend_line = trend_line
+        self.min_interval = 1.0 / max_fps if max_fps and max_fps > 0 else 0.0
+        self.schedule = schedule
+        self.x_margin = x_margin
+        self.y_margin = y_margin
+
+        self._background = None
+        self._layout_dirty = True
+        self._axes_dirty = True
+        self._pending = None
+        self._scheduled = False
+        self._drawing = False
+        self._last_frame = 0.0
+        # Bộ đếm: khung đã vẽ, số lần vẽ đầy đủ, số cập nhật bị gộp vào khung sau
+        self.frames = 0
+        self.full_draws = 0
+        self.merged = 0
+
+        for artist in self.artists:
+            artist.set_animated(True)
+        ax.xaxis.set_major_formatter(FuncFormatter(lambda x, _pos: datetime.fromtimestamp(x).strftime("%H:%M:%S")))
+        ax.tick_params(axis='x', labelrotation=30)
+        canvas.mpl_connect("draw_event", self._on_draw)
+        canvas.mpl_connect("resize_event", self._on_resize)
+
+    def update(self, xs, ys, trend_xs, trend_ys):
+        if self._pending is not None:
+            self.merged += 1
+        self._pending = (xs, ys, trend_xs, trend_ys)
+        if self.schedule is None:
+            self.render()
+            return
+        wait = self._last_frame + self.min_interval - time.perf_counter()
+        if wait <= 0 and not self._scheduled:
+            self.render()
+        elif not self._scheduled:
+            self._scheduled = True
+            self.schedule(int(wait * 1000) + 1, self.render)
+
+    def invalidate(self):
+        # Buộc vẽ đầy đủ ở khung sau (vd. sau khi đổi tiêu đề/nhãn trục)
+        self._axes_dirty = True
+        self._layout_dirty = True
+
+    def render(self):
+        self._scheduled = False
+        data = self._pending
+        if data is None:
+            return
+        self._pending = None
+        xs, ys, trend_xs, trend_ys = data
+        self.line.set_data(xs, ys)
+        self.trend_line.set_data(trend_xs, trend_ys)
+        if self._rescale(xs, ys, trend_ys):
+            self._axes_dirty = True
+            self._layout_dirty = True  # nhãn trục đổi độ dài → lề có thể phải đổi
+        if self._axes_dirty or self._background is None:
+            self._full_draw()
+        self._blit()
+        self._last_frame = time.perf_counter()
+        self.frames += 1
+
+    def _rescale(self, xs, ys, trend_ys):
+        if not len(xs):
+            return False
+        changed = False
+        x0, x1 = self.ax.get_xlim()
+        first, last = xs[0], xs[-1]
+        if last > x1 or first < x0 or self.full_draws == 0:
+            span = max(last - first, 1.0)
+            self.ax.set_xlim(first, last + span * self.x_margin)
+            changed = True
+        lo = min(min(ys), min(trend_ys)) if len(trend_ys) else min(ys)
+        hi = max(max(ys), max(trend_ys)) if len(trend_ys) else max(ys)
+        y0, y1 = self.ax.get_ylim()
+        if lo < y0 or hi > y1 or (hi - lo) < (y1 - y0) * 0.25 or self.full_draws == 0:
+            pad = max((hi - lo) * self.y_margin, 1.0)
+            self.ax.set_ylim(lo - pad, hi + pad)
+            changed = True
+        return changed
+
+    def _full_draw(self):
+        if self._layout_dirty:
+            self.figure.tight_layout()
+            self._layout_dirty = False
+        self._drawing = True
+        try:
+            self.canvas.draw()  # draw_event → chụp nền (không gồm các đường animated)
+        finally:
+            self._drawing = False
+        self._axes_dirty = False
+        self.full_draws += 1
+
+    def _blit(self):
+        if self._background is None:
+            return
+        self.canvas.restore_region(self._background)
+        for artist in self.artists:
+            self.ax.draw_artist(artist)
+        self.canvas.blit(self.ax.bbox)
+
+    def _on_draw(self, _event):
+        self._background = self.canvas.copy_from_bbox(self.ax.bbox)
+        if not self._drawing:
+            # Backend tự vẽ lại (đổi kích thước, lộ cửa sổ): vẽ lại các đường lên nền mới
+            self._blit()
+
+    def _on_resize(self, _event):
+        self._layout_dirty = True
+        self._axes_dirty = True
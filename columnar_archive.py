@@ -0,0 +1,276 @@
+import argparse
+import json
+import os
+import shutil
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+import turbidity_db
+
+# Kho lưu trữ lạnh dạng cột: mỗi ngày một thư mục, mỗi cột một file nhị phân độ rộng cố định
+#   archive/2025-10-10/ts.i64             epoch mili-giây (int64)
+#                      turbidity.f32      NTU (float32), sau bộ lọc gai
+#                      raw_turbidity.f32  NTU đọc được trước bộ lọc gai (= turbidity nếu không lọc)
+#                      voltage.f32        mV (float32)
+#                      status.u8          mã trạng thái (turbidity_db.STATUS_CODES)
+#                      source.u16         mã thiết bị = chỉ số trong meta.json "sources"
+#                      meta.json          ghi sau cùng => ngày đã được niêm phong
+# Ngày niêm phong trước khi có cột nguồn không có source.u16/"sources": đọc không lọc vẫn được,
+# lọc theo thiết bị thì bỏ qua (chạy lại seal-day khi dòng thô còn trong DB để bổ sung).
+# Ngày thiếu raw_turbidity.f32 đọc cột này bằng turbidity.
+DEFAULT_ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "archive")
+
+COLUMNS = {
+    "ts": ("ts.i64", np.int64),
+    "turbidity": ("turbidity.f32", np.float32),
+    "raw_turbidity": ("raw_turbidity.f32", np.float32),
+    "voltage": ("voltage.f32", np.float32),
+    "status": ("status.u8", np.uint8),
+    "source": ("source.u16", np.uint16),
+}
+DAY_FORMAT = "%Y-%m-%d"
+
+
+def day_start_ms(day):
+    """Epoch mili-giây của 00:00:00 giờ địa phương ngày `day` ('YYYY-MM-DD')."""
+    return int(time.mktime(datetime.strptime(day, DAY_FORMAT).timetuple())) * 1000
+
+
+def sealed_days(archive_dir=DEFAULT_ARCHIVE_DIR):
+    if not os.path.isdir(archive_dir):
+        return []
+    return sorted(
+        d for d in os.listdir(archive_dir)
+        if os.path.exists(os.path.join(archive_dir, d, "meta.json"))
+    )
+
+
+def write_day(day, arrays, archive_dir=DEFAULT_ARCHIVE_DIR, sources=None):
+    """Ghi các cột của một ngày (đã sắp theo ts) rồi đổi tên thư mục một lần (nguyên tử).
+
+    `sources`: tên thiết bị theo mã trong cột "source" (thiếu cột thì mọi dòng mang mã 0).
+    Thiếu cột "raw_turbidity" thì ghi bằng "turbidity".
+    """
+    final_dir = os.path.join(archive_dir, day)
+    tmp_dir = final_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    n = len(arrays["ts"])
+    for name, (filename, dtype) in COLUMNS.items():
+        if name in arrays:
+            column = arrays[name]
+        elif name == "raw_turbidity":
+            column = arrays["turbidity"]
+        else:
+            column = np.zeros(n, dtype=dtype)
+        np.ascontiguousarray(column, dtype=dtype).tofile(os.path.join(tmp_dir, filename))
+    meta = {"day": day, "rows": n, "sources": list(sources or [""])}
+    if n:
+        meta["first_ts"] = int(arrays["ts"][0])
+        meta["last_ts"] = int(arrays["ts"][-1])
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    shutil.rmtree(final_dir, ignore_errors=True)
+    os.replace(tmp_dir, final_dir)
+    return n
+
+
+def seal_day(day, db_path=turbidity_db.DEFAULT_DB_PATH, archive_dir=DEFAULT_ARCHIVE_DIR):
+    """Niêm phong một ngày từ bảng readings vào kho lưu trữ."""
+    start_ms = day_start_ms(day)
+    end_ms = day_start_ms((datetime.strptime(day, DAY_FORMAT) + timedelta(days=1)).strftime(DAY_FORMAT)) - 1
+    ts, turb, raw_turb, volt, status, source = [], [], [], [], [], []
+    source_codes = {}
+    conn = turbidity_db.connect(db_path)
+    try:
+        for t, vo, tu, st, src, raw in turbidity_db.iter_samples(conn, start_ms, end_ms):
+            ts.append(t)
+            turb.append(tu or 0.0)
+            raw_turb.append(raw if raw is not None else (tu or 0.0))
+            volt.append(vo or 0.0)
+            status.append(turbidity_db.STATUS_CODES.get(st, 0))
+            source.append(source_codes.setdefault(src or "", len(source_codes)))
+    finally:
+        conn.close()
+    arrays = {"ts": ts, "turbidity": turb, "raw_turbidity": raw_turb, "voltage": volt, "status": status,
+              "source": source}
+    return write_day(day, arrays, archive_dir, sources=list(source_codes))
+
+
+def seal_pending(db_path=turbidity_db.DEFAULT_DB_PATH, archive_dir=DEFAULT_ARCHIVE_DIR, today=None):
+    """Niêm phong mọi ngày đã trọn vẹn (trước hôm nay) mà chưa có trong kho."""
+    today = today or date.today()
+    conn = turbidity_db.connect(db_path)
+    try:
+        first = turbidity_db.first_ts_ms(conn)
+    finally:
+        conn.close()
+    if first is None:
+        return []
+    done = set(sealed_days(archive_dir))
+    day = datetime.fromtimestamp(first / 1000).date()
+    if done:
+        day = max(day, datetime.strptime(max(done), DAY_FORMAT).date() + timedelta(days=1))
+    sealed = []
+    while day < today:
+        key = day.strftime(DAY_FORMAT)
+        if key not in done:
+            seal_day(key, db_path, archive_dir)
+            sealed.append(key)
+        day += timedelta(days=1)
+    return sealed
+
+
+def _empty_columns():
+    return {name: np.empty(0, dtype=dtype) for name, (_, dtype) in COLUMNS.items()}
+
+
+def read_meta(day, archive_dir=DEFAULT_ARCHIVE_DIR):
+    with open(os.path.join(archive_dir, day, "meta.json"), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def open_day(day, archive_dir=DEFAULT_ARCHIVE_DIR, meta=None):
+    """Trả về dict cột dạng np.memmap chỉ đọc (không sao chép dữ liệu)."""
+    day_dir = os.path.join(archive_dir, day)
+    rows = (meta or read_meta(day, archive_dir))["rows"]
+    if rows == 0:
+        return _empty_columns()
+    cols = {}
+    for name, (filename, dtype) in COLUMNS.items():
+        path = os.path.join(day_dir, filename)
+        if name == "source" and not os.path.exists(path):
+            cols[name] = np.zeros(rows, dtype=dtype)  # ngày niêm phong trước khi có cột nguồn
+        elif name == "raw_turbidity" and not os.path.exists(path):
+            cols[name] = cols["turbidity"]  # ngày niêm phong trước khi có cột giá trị thô
+        else:
+            cols[name] = np.memmap(path, dtype=dtype, mode="r", shape=(rows,))
+    return cols
+
+
+def _open_for_source(day, source, archive_dir):
+    """(cột, mã nguồn cần lọc): mã None = không lọc; trả về (None, None) nếu ngày không có thiết bị này."""
+    meta = read_meta(day, archive_dir)
+    if source is None:
+        return open_day(day, archive_dir, meta), None
+    sources = meta.get("sources", [])
+    if source not in sources:
+        return None, None
+    return open_day(day, archive_dir, meta), sources.index(source)
+
+
+def iter_range(start_ms, end_ms, archive_dir=DEFAULT_ARCHIVE_DIR, source=None):
+    """Sinh từng ngày trong [start_ms, end_ms] dưới dạng view trên memmap (không sao chép).
+
+    `source` (tên thiết bị) chỉ giữ dòng của thiết bị đó; ngày có nhiều thiết bị thì phải sao chép.
+    """
+    first = datetime.fromtimestamp(start_ms / 1000).date()
+    last = datetime.fromtimestamp(end_ms / 1000).date()
+    available = set(sealed_days(archive_dir))
+    day = first
+    while day <= last:
+        key = day.strftime(DAY_FORMAT)
+        if key in available:
+            cols, code = _open_for_source(key, source, archive_dir)
+            if cols is not None:
+                i0 = int(np.searchsorted(cols["ts"], start_ms, side="left"))
+                i1 = int(np.searchsorted(cols["ts"], end_ms, side="right"))
+                part = {name: col[i0:i1] for name, col in cols.items()}
+                if code is not None and not (part["source"] == code).all():
+                    mask = part["source"] == code
+                    part = {name: col[mask] for name, col in part.items()}
+                if len(part["ts"]):
+                    yield part
+        day += timedelta(days=1)
+
+
+def read_range(start_ms, end_ms, archive_dir=DEFAULT_ARCHIVE_DIR, source=None):
+    """Đọc [start_ms, end_ms] từ kho. Một ngày => view trên memmap; nhiều ngày => nối lại."""
+    parts = list(iter_range(start_ms, end_ms, archive_dir, source))
+    if not parts:
+        return _empty_columns()
+    if len(parts) == 1:
+        return parts[0]
+    return {name: np.concatenate([p[name] for p in parts]) for name in COLUMNS}
+
+
+def _days_newest_first(start_ms, end_ms, archive_dir):
+    first = datetime.fromtimestamp(start_ms / 1000).strftime(DAY_FORMAT)
+    last = datetime.fromtimestamp(end_ms / 1000).strftime(DAY_FORMAT)
+    return [d for d in reversed(sealed_days(archive_dir)) if first <= d <= last]
+
+
+def page_before(before_ms, start_ms, limit, status_codes=None, archive_dir=DEFAULT_ARCHIVE_DIR, source=None):
+    """Tối đa `limit` dòng có ts trong [start_ms, before_ms), mới nhất trước (phân trang keyset theo ts).
+
+    Duyệt ngược từng ngày và dừng khi đủ trang: chỉ chạm các ngày cần thiết, không nối cả khoảng.
+    `status_codes` (mã turbidity_db.STATUS_CODES) lọc trạng thái, `source` lọc thiết bị, bằng mặt nạ numpy.
+    """
+    parts, need = [], limit
+    for day in _days_newest_first(start_ms, before_ms - 1, archive_dir):
+        cols, code = _open_for_source(day, source, archive_dir)
+        if cols is None:
+            continue
+        i0 = int(np.searchsorted(cols["ts"], start_ms, side="left"))
+        i1 = int(np.searchsorted(cols["ts"], before_ms, side="left"))
+        idx = np.arange(i0, i1)
+        mask = None if code is None else cols["source"][i0:i1] == code
+        if status_codes is not None:
+            status_mask = np.isin(cols["status"][i0:i1], status_codes)
+            mask = status_mask if mask is None else mask & status_mask
+        if mask is not None:
+            idx = idx[mask]
+        idx = idx[::-1][:need]
+        if len(idx):
+            parts.append({name: col[idx] for name, col in cols.items()})
+            need -= len(idx)
+        if need <= 0:
+            break
+    if not parts:
+        return _empty_columns()
+    return {name: np.concatenate([p[name] for p in parts]) for name in COLUMNS}
+
+
+def count_range(start_ms, end_ms, status_codes=None, cap=None, archive_dir=DEFAULT_ARCHIVE_DIR, source=None):
+    """Số dòng trong [start_ms, end_ms]; với `cap`, dừng khi đã vượt cap."""
+    total = 0
+    for cols in iter_range(start_ms, end_ms, archive_dir, source):
+        if status_codes is None:
+            total += len(cols["ts"])
+        else:
+            total += int(np.count_nonzero(np.isin(cols["status"], status_codes)))
+        if cap is not None and total > cap:
+            break
+    return total
+
+
+def to_records(cols):
+    """Chuyển cột sang các dòng (ts, voltage, turbidity, status) giống bảng readings."""
+    names = turbidity_db.STATUS_NAMES
+    for t, v, tu, st in zip(cols["ts"].tolist(), cols["voltage"].tolist(),
+                            cols["turbidity"].tolist(), cols["status"].tolist()):
+        yield (
+            datetime.fromtimestamp(t / 1000).strftime(turbidity_db.TS_FORMAT),
+            v, tu, names.get(st, ""),
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Kho lưu trữ dạng cột cho dữ liệu độ đục")
+    parser.add_argument("--db", default=turbidity_db.DEFAULT_DB_PATH)
+    parser.add_argument("--archive", default=DEFAULT_ARCHIVE_DIR)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("seal", help="niêm phong mọi ngày trọn vẹn chưa có trong kho")
+    p_day = sub.add_parser("seal-day", help="niêm phong (lại) một ngày")
+    p_day.add_argument("day", help="YYYY-MM-DD")
+    args = parser.parse_args()
+    if args.command == "seal":
+        print(f"Đã niêm phong: {seal_pending(args.db, args.archive) or 'không có ngày mới'}")
+    elif args.command == "seal-day":
+        print(f"{args.day}: {seal_day(args.day, args.db, args.archive)} dòng")
+
+
+if __name__ == "__main__":
+    main()
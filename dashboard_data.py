@@ -0,0 +1,391 @@
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+
+import columnar_archive
+import live_feed
+import turbidity_db
+from downsample import downsample
+
+COLUMNS = ["timestamp", "turbidity", "voltage", "status"]
+# pandas (~0,25 s) được nhập trong các hàm dựng DataFrame chứ không lúc nhập module: app_mobile nhập
+# module này ngay sau khi gửi khung trang, pandas chỉ được nạp khi thật sự cần dữ liệu
+
+
+def to_local_datetime(values):
+    """Chuỗi ts (schema v1) hoặc epoch ms (schema v2) -> datetime giờ địa phương."""
+    import pandas as pd
+
+    series = pd.Series(values)
+    if pd.api.types.is_numeric_dtype(series):
+        local_tz = datetime.now().astimezone().tzinfo
+        return pd.to_datetime(series, unit="ms", utc=True).dt.tz_convert(local_tz).dt.tz_localize(None)
+    return pd.to_datetime(series)
+
+
+def connect_readonly(db_path):
+    """Kết nối chỉ đọc, dùng được từ nhiều luồng (mỗi phiên Streamlit chạy trên một luồng riêng)."""
+    uri = Path(db_path).resolve().as_uri() + "?mode=ro"
+    return sqlite3.connect(uri, uri=True, check_same_thread=False, timeout=5.0)
+
+
+def empty_frame():
+    import pandas as pd
+
+    return pd.DataFrame(columns=COLUMNS).set_index("timestamp")
+
+
+class IncrementalFrame:
+    """DataFrame (index timestamp) chỉ nối thêm các dòng có id lớn hơn id đã thấy.
+
+    `max_rows=None` giữ mọi dòng, còn lại chỉ giữ `max_rows` dòng mới nhất.
+    Mỗi lần có dòng mới, `frame` là một đối tượng mới; đối tượng cũ không bị sửa
+    nên người gọi có thể dùng tiếp mà không cần khóa (nhưng không được sửa tại chỗ).
+    """
+
+    def __init__(self, max_rows=None):
+        self.max_rows = max_rows
+        self.frame = empty_frame()
+        self.version = 0  # tăng mỗi khi frame đổi
+        self.rows_appended = 0
+        self.checked_at = float("-inf")  # lần hỏi DB gần nhất (time.monotonic)
+        self._v2 = None
+        self._first_id = None
+        self._last_id = 0
+
+    def clear(self):
+        self.frame = empty_frame()
+        self.version += 1
+        self._first_id = None
+        self._last_id = 0
+
+    def refresh(self, conn):
+        v2 = turbidity_db.v2_ready(conn)
+        if v2 != self._v2:
+            # Schema vừa đổi (chuyển xong sang v2): nạp lại với kiểu ts mới
+            self._v2 = v2
+            self.clear()
+        if self.max_rows is None and self._first_id is not None:
+            # Giữ mọi dòng: nếu compact() đã xóa dòng cũ thì nạp lại để không giữ dữ liệu đã xóa
+            table = "samples" if v2 else "readings"
+            first_id = conn.execute(f"SELECT MIN(id) FROM {table}").fetchone()[0]
+            if first_id != self._first_id:
+                self.clear()
+        rows = self._fetch(conn, v2)
+        if not rows:
+            return False
+        if self._first_id is None:
+            self._first_id = rows[0][0]
+        self._last_id = rows[-1][0]
+        import pandas as pd
+
+        new = pd.DataFrame([row[1:] for row in rows], columns=COLUMNS)
+        new["timestamp"] = to_local_datetime(new["timestamp"])
+        new = new.set_index("timestamp")
+        frame = new if self.frame.empty else pd.concat([self.frame, new])
+        if self.max_rows is not None:
+            frame = frame.iloc[-self.max_rows:]
+        if not frame.index.is_monotonic_increasing:
+            # Nhiều thiết bị ghi xen kẽ: thứ tự id có thể lệch chút ít so với thời gian
+            frame = frame.sort_index(kind="stable")
+        self.frame = frame
+        self.version += 1
+        self.rows_appended += len(rows)
+        return True
+
+    def _fetch(self, conn, v2):
+        # Dùng khóa chính (rowid) nên chi phí chỉ phụ thuộc số dòng mới, không phụ thuộc kích thước bảng
+        if v2:
+            # Schema v2: ts là epoch ms, không cần phân tích chuỗi thời gian
+            sql = ("SELECT s.id, s.ts_ms, s.turbidity, s.voltage, st.name FROM samples s "
+                   "LEFT JOIN statuses st ON st.id = s.status_id WHERE s.id > ?")
+            key = "s.id"
+        else:
+            sql = "SELECT id, ts, turbidity, voltage, status FROM readings WHERE id > ?"
+            key = "id"
+        if self.max_rows is None:
+            return conn.execute(f"{sql} ORDER BY {key}", (self._last_id,)).fetchall()
+        rows = conn.execute(f"{sql} ORDER BY {key} DESC LIMIT ?", (self._last_id, self.max_rows)).fetchall()
+        rows.reverse()
+        return rows
+
+
+class DashboardData:
+    """Lớp dữ liệu dùng chung cho cả tiến trình Streamlit (tạo một lần qua st.cache_resource).
+
+    - Một kết nối SQLite chỉ đọc cho mọi phiên; truy vấn đi qua `read()` (có khóa).
+    - `latest()`: `tail_rows` dòng mới nhất cho phần thời gian thực. Chỉ hỏi DB tối đa một lần
+      mỗi `min_interval` giây dù có bao nhiêu người xem; các lần gọi khác trả về frame đã có.
+    - `overview()`: metadata cho bộ lọc lịch sử (khoảng thời gian, trạng thái), làm mới sau
+      `meta_interval` giây.
+    - `history_page()` / `history_count()`: tra cứu lịch sử lọc trong SQL (và kho dạng cột),
+      từng trang một. Bộ nhớ và số truy vấn không tăng theo số phiên hay kích thước bảng.
+    - `series()`: biểu đồ nhiều giờ/ngày, rút gọn về cỡ số pixel, dùng chung giữa các phiên.
+
+    Với `feed_port`, một FeedSubscriber nghe chương trình desktop: khi đang kết nối, `latest()`
+    lấy từ các bản ghi được đẩy tới (không hỏi DB, trễ cỡ mili-giây); DB chỉ còn dùng để bù phần
+    đuôi cũ hơn một lần mỗi lần kết nối. Mất kết nối thì tự quay lại đọc DB như trên.
+    """
+
+    def __init__(self, db_path, tail_rows=50, min_interval=0.5, meta_interval=5.0,
+                 archive_dir=columnar_archive.DEFAULT_ARCHIVE_DIR, feed_port=None,
+                 feed_host=live_feed.DEFAULT_HOST):
+        self.db_path = str(db_path)
+        self.min_interval = min_interval
+        self.meta_interval = meta_interval
+        self.archive_dir = archive_dir
+        self.tail = IncrementalFrame(tail_rows)
+        self._overview = (None, None, [])
+        self._overview_at = float("-inf")
+        # Kết quả dùng chung giữa các phiên (biểu đồ, trang lịch sử, tổng hợp): khóa -> (thời điểm nạp, kết quả)
+        self._results = OrderedDict()
+        self.max_results = 128
+        self._lock = threading.RLock()  # reentrant: kết quả nạp trong _cached() có thể gọi overview()
+        self._conn = None
+        self.queries = 0
+        self.hits = 0
+        self.feed = None
+        if feed_port is not None:
+            self.feed = live_feed.FeedSubscriber(feed_host, feed_port, maxlen=tail_rows).start()
+        self._live_lock = threading.Lock()
+        self._live = (None, empty_frame())  # ((generation, version), frame)
+        self._seeded = None  # generation đã bù phần đuôi từ DB
+
+    @contextmanager
+    def read(self):
+        """Kết nối chỉ đọc dùng chung; giữ khóa trong suốt khối with."""
+        with self._lock:
+            if self._conn is None:
+                self._conn = connect_readonly(self.db_path)
+            try:
+                yield self._conn
+            except sqlite3.DatabaseError:
+                # File DB bị thay thế/hỏng tạm thời: mở lại ở lần sau
+                self._close()
+                raise
+
+    def live(self):
+        """True nếu đang nhận dữ liệu đẩy trực tiếp từ chương trình desktop."""
+        return self.feed is not None and self.feed.connected
+
+    def latest(self):
+        if self.live():
+            return self._live_frame()
+        return self._frame(self.tail)
+
+    def _live_frame(self):
+        generation, version, records = self.feed.snapshot()
+        with self._live_lock:
+            key, frame = self._live
+            if key == (generation, version):
+                self.hits += 1
+                return frame
+            need = self.tail.max_rows - len(records)
+            if need > 0 and self._seeded != generation:
+                # Vừa kết nối, feed chưa đủ phần đuôi: bổ sung từ DB một lần cho mỗi kết nối
+                self._seeded = generation
+                with self.read() as conn:
+                    self.queries += 1
+                    self.tail.refresh(conn)
+                    self.tail.checked_at = time.monotonic()
+            frame = self._records_frame(records)
+            if need > 0:
+                import pandas as pd
+
+                seed = self.tail.frame
+                if not frame.empty:
+                    seed = seed[seed.index < frame.index[0]]
+                frame = pd.concat([seed.iloc[-need:], frame]) if not frame.empty else seed.iloc[-need:]
+            self._live = ((generation, version), frame)
+            return frame
+
+    @staticmethod
+    def _records_frame(records):
+        if not records:
+            return empty_frame()
+        import pandas as pd
+
+        frame = pd.DataFrame.from_records(records, columns=["ts_ms"] + COLUMNS[1:])
+        frame["timestamp"] = to_local_datetime(frame.pop("ts_ms")).values
+        frame = frame.set_index("timestamp")[COLUMNS[1:]]
+        if not frame.index.is_monotonic_increasing:
+            frame = frame.sort_index(kind="stable")
+        return frame
+
+    def _frame(self, incremental):
+        now = time.monotonic()
+        with self.read() as conn:
+            if now - incremental.checked_at < self.min_interval:
+                self.hits += 1
+            else:
+                incremental.checked_at = now
+                self.queries += 1
+                incremental.refresh(conn)
+            return incremental.frame
+
+    def overview(self):
+        """(ts đầu, ts cuối (epoch ms), các trạng thái) của dữ liệu thô; dùng chung, làm mới theo meta_interval."""
+        now = time.monotonic()
+        with self.read() as conn:
+            if now - self._overview_at < self.meta_interval:
+                self.hits += 1
+            else:
+                self._overview_at = now
+                self.queries += 1
+                self._overview = turbidity_db.samples_overview(conn)
+            return self._overview
+
+    def _cached(self, key, ttl, load):
+        """Kết quả `load(conn)` dùng chung, nạp lại sau `ttl` giây (LRU tối đa max_results khóa).
+
+        Mỗi lần chạy lại script Streamlit (mọi tương tác) đều đi qua phần lịch sử dù expander đang
+        đóng; nhờ bộ đệm này các lần chạy lại không hỏi lại DB.
+        """
+        now = time.monotonic()
+        with self.read() as conn:
+            cached = self._results.get(key)
+            if cached is not None and now - cached[0] < ttl:
+                self._results.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+            self.queries += 1
+            result = load(conn)
+            self._results[key] = (now, result)
+            if len(self._results) > self.max_results:
+                self._results.popitem(last=False)
+            return result
+
+    def series(self, seconds, n_out=1000, method="minmax"):
+        """Độ đục trong `seconds` giây gần nhất, rút gọn còn ~n_out điểm (index timestamp).
+
+        Mỗi pixel tương ứng seconds / n_out giây nên chỉ nạp lại khi đã qua chừng đó thời gian
+        (tối thiểu min_interval): cửa sổ 7 ngày đọc DB vài phút một lần dù nhiều người xem.
+        """
+        def load(conn):
+            import pandas as pd
+
+            rows = turbidity_db.series(conn, int((time.time() - seconds) * 1000))
+            data = np.array(rows, dtype=np.float64).reshape(-1, 2)
+            xs, ys = downsample(data[:, 0], data[:, 1], n_out, method)
+            return pd.DataFrame({"timestamp": to_local_datetime(xs.astype(np.int64)).values,
+                                 "turbidity": ys}).set_index("timestamp")
+
+        return self._cached(("series", seconds, n_out, method), max(self.min_interval, seconds / n_out), load)
+
+    def rollups(self, level, start_ts=None, end_ts=None):
+        """turbidity_db.query_rollups dùng chung, làm mới theo meta_interval."""
+        return self._cached(("rollups", level, start_ts, end_ts), self.meta_interval,
+                            lambda conn: turbidity_db.query_rollups(conn, level, start_ts, end_ts))
+
+    def archived_days(self):
+        """Các ngày đã niêm phong trong kho dạng cột (liệt kê thư mục theo meta_interval)."""
+        return self._cached(("archived_days",), self.meta_interval,
+                            lambda conn: columnar_archive.sealed_days(self.archive_dir))
+
+    def _archive_end(self, start_ms, end_ms):
+        # Dữ liệu trước dòng thô đầu tiên chỉ còn trong kho lưu trữ (compact() đã xóa khỏi DB)
+        first_ms = self.overview()[0]
+        if first_ms is None or start_ms >= first_ms:
+            return None
+        return min(end_ms + 1, first_ms)
+
+    def history_page(self, cursor, start_ms, end_ms, statuses=None, limit=200, source=None):
+        """Một trang tra cứu lịch sử, mới nhất trước: (DataFrame, cursor trang cũ hơn hoặc None).
+
+        cursor ("raw", id) đọc keyset theo id trên SQLite, ("archive", ts_ms) đọc kho dạng cột
+        cho phần trước dữ liệu thô; trang đầu là ("raw", None). `statuses=None` không lọc trạng thái,
+        `source=None` không lọc thiết bị.
+        Kết quả dùng chung và làm mới theo meta_interval (DataFrame trả về không được sửa tại chỗ).
+        """
+        key = ("history_page", cursor, start_ms, end_ms, None if statuses is None else tuple(statuses), limit,
+               source)
+        return self._cached(key, self.meta_interval,
+                            lambda conn: self._history_page(conn, cursor, start_ms, end_ms, statuses, limit, source))
+
+    def _history_page(self, conn, cursor, start_ms, end_ms, statuses, limit, source):
+        import pandas as pd
+
+        first_ms = self.overview()[0]
+        archive_end = self._archive_end(start_ms, end_ms)
+        kind, anchor = cursor
+        if kind == "raw" and first_ms is not None and end_ms < first_ms:
+            # Cả khoảng nằm trước dữ liệu thô: đọc thẳng từ kho
+            kind, anchor = "archive", archive_end
+        if kind == "raw":
+            rows = turbidity_db.samples_page(conn, before=anchor, limit=limit + 1, start_ms=start_ms,
+                                             end_ms=end_ms, status=statuses, source=source)
+            more = len(rows) > limit
+            rows = rows[:limit]
+            df = pd.DataFrame([row[1:] for row in rows], columns=["timestamp", "voltage", "turbidity", "status"])
+            df["timestamp"] = pd.to_datetime(df["timestamp"])
+            if more:
+                next_cursor = ("raw", rows[-1][0])
+            elif archive_end is not None and len(self._archive_rows(archive_end, start_ms, 1, statuses, source)["ts"]):
+                next_cursor = ("archive", archive_end)
+            else:
+                next_cursor = None
+        else:
+            cols = self._archive_rows(anchor, start_ms, limit + 1, statuses, source)
+            more = len(cols["ts"]) > limit
+            cols = {name: col[:limit] for name, col in cols.items()}
+            df = pd.DataFrame({
+                "timestamp": to_local_datetime(cols["ts"]).values,
+                "voltage": cols["voltage"],
+                "turbidity": cols["turbidity"],
+                "status": [turbidity_db.STATUS_NAMES.get(c, "") for c in cols["status"].tolist()],
+            })
+            next_cursor = ("archive", int(cols["ts"][-1])) if more else None
+        return df.set_index("timestamp")[["turbidity", "voltage", "status"]], next_cursor
+
+    def history_count(self, start_ms, end_ms, statuses=None, cap=10000, source=None):
+        """Số dòng khớp bộ lọc (SQLite + kho), dừng đếm khi vượt `cap` để luôn rẻ; dùng chung như history_page."""
+        key = ("history_count", start_ms, end_ms, None if statuses is None else tuple(statuses), cap, source)
+        return self._cached(key, self.meta_interval,
+                            lambda conn: self._history_count(conn, start_ms, end_ms, statuses, cap, source))
+
+    def _history_count(self, conn, start_ms, end_ms, statuses, cap, source):
+        total = turbidity_db.count_samples(conn, start_ms, end_ms, statuses, cap=cap, source=source)
+        archive_end = self._archive_end(start_ms, end_ms)
+        if archive_end is not None and total <= cap:
+            total += columnar_archive.count_range(start_ms, archive_end - 1, self._status_codes(statuses),
+                                                  cap=cap - total, archive_dir=self.archive_dir, source=source)
+        return total
+
+    def _archive_rows(self, before_ms, start_ms, limit, statuses, source):
+        return columnar_archive.page_before(before_ms, start_ms, limit, self._status_codes(statuses),
+                                            archive_dir=self.archive_dir, source=source)
+
+    @staticmethod
+    def _status_codes(statuses):
+        if statuses is None:
+            return None
+        return [turbidity_db.STATUS_CODES[s] for s in statuses if s in turbidity_db.STATUS_CODES]
+
+    def stats(self):
+        return {
+            "queries": self.queries,
+            "hits": self.hits,
+            "tail_rows": len(self.tail.frame),
+            "rows_appended": self.tail.rows_appended,
+            "feed": None if self.feed is None else self.feed.stats(),
+        }
+
+    def close(self):
+        if self.feed is not None:
+            self.feed.stop()
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
@@ -0,0 +1,178 @@
+import numpy as np
+
+# Giảm số điểm của chuỗi thời gian xuống cỡ số pixel chiều ngang mà vẫn giữ hình dạng (đỉnh/gai).
+# Các hàm trả về chỉ số điểm được giữ (tăng dần), người gọi lấy x[idx], y[idx].
+#   minmax: mỗi bucket giữ điểm nhỏ nhất và lớn nhất — không bao giờ mất gai, O(n)
+#   lttb:   Largest-Triangle-Three-Buckets, mỗi bucket giữ một điểm tạo tam giác lớn nhất với
+#           điểm đã chọn trước đó và trung bình bucket sau; lọc trước bằng minmax (MinMaxLTTB)
+#           nên chi phí vòng lặp theo bucket không phụ thuộc n
+
+
+def _bucket_starts(x, edges):
+    """Vị trí bắt đầu các bucket khác rỗng; edges là ranh giới trái của bucket thứ 2 trở đi.
+
+    x đã sắp xếp nên chỉ cần searchsorted trên ranh giới (O(số bucket * log n)),
+    không phải tính mã bucket cho từng điểm.
+    """
+    starts = np.unique(np.concatenate(([0], np.searchsorted(x, edges, side="left"))))
+    return starts[starts < len(x)]
+
+
+def minmax(x, y, n_out, bucket_width=None):
+    """Chỉ số các điểm min/max của ~n_out/2 bucket theo trục x (tối đa n_out điểm, luôn gồm hai đầu).
+
+    bucket_width (cùng đơn vị x) cố định ranh giới bucket theo giá trị tuyệt đối floor(x / width):
+    khi cửa sổ trượt theo dữ liệu mới, các bucket cũ giữ nguyên điểm đã chọn (biểu đồ trực tiếp
+    không bị nhấp nháy). Mặc định chia đều khoảng [x[0], x[-1]].
+    """
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n <= n_out or n_out < 4:
+        return np.arange(n)
+    if bucket_width is None:
+        n_buckets = max(1, (n_out - 2) // 2)
+        edges = np.linspace(float(x[0]), float(x[-1]), n_buckets + 1)[1:-1]
+    else:
+        first, last = np.floor(float(x[0]) / bucket_width), np.floor(float(x[-1]) / bucket_width)
+        edges = np.arange(first + 1, last + 1) * bucket_width
+    starts = _bucket_starts(x, edges)
+    ends = np.append(starts[1:], n)
+    y_lo = y_hi = y
+    if not np.isfinite(y).all():
+        # NaN/inf không được chọn làm cực trị (bucket toàn NaN: lấy điểm đầu bucket)
+        finite = np.isfinite(y)
+        y_lo = np.where(finite, y, np.inf)
+        y_hi = np.where(finite, y, -np.inf)
+    # Vòng lặp theo bucket (cỡ số pixel), argmin/argmax trong bucket chạy trên numpy
+    idx = np.empty(2 * len(starts) + 2, dtype=np.int64)
+    k = 0
+    for s, e in zip(starts.tolist(), ends.tolist()):
+        idx[k] = s + int(y_lo[s:e].argmin())
+        idx[k + 1] = s + int(y_hi[s:e].argmax())
+        k += 2
+    idx[k], idx[k + 1] = 0, n - 1
+    return np.unique(idx)
+
+
+def lttb(x, y, n_out, preselect=4):
+    """Chỉ số n_out điểm theo LTTB (gồm điểm đầu và cuối).
+
+    Với n lớn, lọc trước còn ~preselect * n_out điểm bằng minmax rồi mới chạy LTTB; kết quả
+    gần như giống hệt LTTB trên toàn bộ dữ liệu vì các điểm LTTB chọn hầu như luôn là cực trị.
+    """
+    x = np.asarray(x)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+    base = np.arange(n)
+    if preselect and n > preselect * n_out:
+        base = minmax(x, y, preselect * n_out)
+        if len(base) <= n_out:
+            return base
+    xs = x[base].astype(np.float64)
+    ys = np.nan_to_num(y[base])
+    m = len(base)
+    # Bucket giữa: chia đều m - 2 điểm (trừ đầu/cuối) thành n_out - 2 nhóm
+    edges = np.linspace(1, m - 1, n_out - 1).astype(np.int64)
+    # Trung bình của mỗi bucket (dùng làm điểm C cho bucket đứng trước)
+    sums_x = np.add.reduceat(xs[1:m - 1], edges[:-1] - 1)
+    sums_y = np.add.reduceat(ys[1:m - 1], edges[:-1] - 1)
+    sizes = np.diff(edges)
+    avg_x = np.append(sums_x / sizes, xs[-1])
+    avg_y = np.append(sums_y / sizes, ys[-1])
+    out = np.empty(n_out, dtype=np.int64)
+    out[0] = 0
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        cx, cy = avg_x[i + 1], avg_y[i + 1]
+        # 2 * diện tích tam giác (A, B, C) cho mọi B trong bucket
+        area = np.abs((xs[a] - cx) * (ys[lo:hi] - ys[a]) - (xs[a] - xs[lo:hi]) * (cy - ys[a]))
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    out[-1] = m - 1
+    return base[out]
+
+
+METHODS = {"minmax": minmax, "lttb": lttb}
+
+
+def downsample(x, y, n_out, method="minmax", **kwargs):
+    """(x, y) rút gọn còn khoảng n_out điểm bằng `method` ("minmax" hoặc "lttb")."""
+    x = np.asarray(x)
+    y = np.asarray(y)
+    idx = METHODS[method](x, y, n_out, **kwargs)
+    return x[idx], y[idx]
+
+
+class SeriesBuffer:
+    """Bộ đệm (ts, value) có giới hạn bằng numpy, đọc ra là view liên tục (không sao chép).
+
+    Mảng dài gấp đôi capacity: ghi nối tiếp, khi chạm cuối mới dời `capacity` điểm mới nhất
+    về đầu (O(1) khấu hao mỗi điểm). `ts` phải không giảm để `since()` dùng searchsorted.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._ts = np.empty(2 * capacity, dtype=np.float64)
+        self._values = np.empty(2 * capacity, dtype=np.float64)
+        self._start = 0
+        self._end = 0
+
+    def __len__(self):
+        return self._end - self._start
+
+    def append(self, ts, value):
+        if self._end == len(self._ts):
+            self._compact()
+        self._ts[self._end] = ts
+        self._values[self._end] = value
+        self._end += 1
+        if self._end - self._start > self.capacity:
+            self._start += 1
+
+    def extend(self, ts, values):
+        for t, v in zip(ts, values):
+            self.append(t, v)
+
+    def prepend(self, ts, values):
+        """Thêm dữ liệu cũ hơn điểm đầu hiện có (vd. nạp lịch sử từ DB); giữ tối đa capacity điểm mới nhất."""
+        ts = np.asarray(ts, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        if len(self):
+            keep = ts < self._ts[self._start]
+            ts, values = ts[keep], values[keep]
+        merged_ts = np.concatenate((ts, self.ts))[-self.capacity:]
+        merged_values = np.concatenate((values, self.values))[-self.capacity:]
+        n = len(merged_ts)
+        self._ts[:n] = merged_ts
+        self._values[:n] = merged_values
+        self._start, self._end = 0, n
+
+    @property
+    def ts(self):
+        return self._ts[self._start:self._end]
+
+    @property
+    def values(self):
+        return self._values[self._start:self._end]
+
+    def first_ts(self):
+        return self._ts[self._start] if len(self) else None
+
+    def since(self, ts):
+        """View (ts, values) của các điểm có ts >= ts."""
+        i = self._start + int(np.searchsorted(self.ts, ts, side="left"))
+        return self._ts[i:self._end], self._values[i:self._end]
+
+    def tail(self, n):
+        i = max(self._start, self._end - n)
+        return self._ts[i:self._end], self._values[i:self._end]
+
+    def _compact(self):
+        n = len(self)
+        self._ts[:n] = self._ts[self._start:self._end]
+        self._values[:n] = self._values[self._start:self._end]
+        self._start, self._end = 0, n
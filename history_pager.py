@@ -0,0 +1,67 @@
+from collections import deque
+
+
+class HistoryPager:
+    """Cửa sổ trượt gồm tối đa `max_pages` trang lịch sử, tải thêm theo hướng cuộn.
+
+    `fetch_page(before=None, after=None, limit=n)` trả về các dòng mới nhất trước,
+    phần tử đầu của mỗi dòng là khóa keyset (id với dữ liệu thô, bucket với bảng
+    tổng hợp). Khi cửa sổ vượt `max_pages`, trang ở đầu bên kia bị bỏ — bộ nhớ
+    (và số dòng trong Treeview) không vượt page_size * max_pages dù bảng có
+    hàng triệu dòng.
+
+    `older()` / `newer()` trả về (các dòng mới tải, các dòng bị bỏ) hoặc None khi
+    đã hết dữ liệu theo hướng đó.
+    """
+
+    def __init__(self, fetch_page, page_size=200, max_pages=3):
+        self.fetch_page = fetch_page
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.pages = deque()  # trang mới nhất ở bên trái
+        self.has_older = False
+        self.has_newer = False
+
+    def __len__(self):
+        return sum(len(page) for page in self.pages)
+
+    def rows(self):
+        for page in self.pages:
+            yield from page
+
+    def reset(self, anchor=None):
+        """Trang đầu: các dòng có khóa < anchor (None = mới nhất). Trả về các dòng đã tải."""
+        rows = self.fetch_page(before=anchor, limit=self.page_size)
+        self.pages = deque([rows]) if rows else deque()
+        self.has_older = len(rows) == self.page_size
+        # Neo ở giữa lịch sử: có thể còn dòng mới hơn anchor
+        self.has_newer = anchor is not None
+        return rows
+
+    def older(self):
+        if not self.has_older or not self.pages:
+            return None
+        rows = self.fetch_page(before=self.pages[-1][-1][0], limit=self.page_size)
+        self.has_older = len(rows) == self.page_size
+        if not rows:
+            return None
+        self.pages.append(rows)
+        dropped = []
+        if len(self.pages) > self.max_pages:
+            dropped = self.pages.popleft()
+            self.has_newer = True
+        return rows, dropped
+
+    def newer(self):
+        if not self.has_newer or not self.pages:
+            return None
+        rows = self.fetch_page(after=self.pages[0][0][0], limit=self.page_size)
+        self.has_newer = len(rows) == self.page_size
+        if not rows:
+            return None
+        self.pages.appendleft(rows)
+        dropped = []
+        if len(self.pages) > self.max_pages:
+            dropped = self.pages.pop()
+            self.has_older = True
+        return rows, dropped
@@ -0,0 +1,355 @@
+import queue
+import threading
+import time
+from collections import deque
+
+from sliding_window import SlidingRegression
+
+
+# Hàm tiện ích: trả về (status_text, bootstyle_name)
+def get_water_status_bootstyle(turbidity):
+    if turbidity < 1: return "Nước cất", "success"
+    elif turbidity <= 10: return "Nước trong", "info"
+    elif turbidity <= 50: return "Nước hơi đục", "warning"
+    elif turbidity <= 100: return "Nước đục", "danger"
+    else: return "Nước rất đục", "danger"
+
+
+class SensorAnalytics:
+    """Trạng thái phân tích của một cảm biến: mức cảnh báo, xu hướng, tốc độ thay đổi.
+
+    `process()` không đụng tới Tk hay mạng; nó trả về kết quả cùng danh sách
+    sự kiện (thông báo Telegram, lệnh serial) để các tầng sau thực hiện.
+    """
+
+    def __init__(self):
+        self.current_alert_level = 0
+        self.last_status_sent = None
+
+        self.TREND_WINDOW_SEC = 60
+        self.TREND_ALERT_SLOPE = 30.0  # NTU per minute
+        self.TREND_LINE_WINDOW_SEC = 300  # cửa sổ hiển thị đường xu hướng trên biểu đồ
+        self.TREND_ROLLING_WINDOW_SEC = 60  # cửa sổ lăn cho đường xu hướng (tạo gấp khúc)
+        # Cảnh báo tốc độ thay đổi ngắn hạn (1-2 phút)
+        self.RATE_WINDOW_SEC = 60             # cửa sổ 1 phút (có thể tăng 120s nếu cần)
+        self.RATE_ALERT_SLOPE = 20.0          # NTU/phút
+        self.RATE_MIN_DELTA = 10.0            # thay đổi tối thiểu trong cửa sổ
+        self.RATE_MIN_POINTS = 3              # tối thiểu số điểm trong cửa sổ
+        self.RATE_ALERT_COOLDOWN_SEC = 60     # tránh spam cảnh báo ngắn hạn
+        self.last_rate_alert_at = 0.0
+        self.TREND_SNAPSHOT_POINTS = 50       # số điểm overlay gửi kèm snapshot (biểu đồ GUI giữ 50 điểm)
+
+        # Các cửa sổ hồi quy trượt O(1) mỗi mẫu: chi phí không phụ thuộc độ dài cửa sổ
+        self.rate_regression = SlidingRegression(self.RATE_WINDOW_SEC)
+        self.trend_regression = SlidingRegression(self.TREND_WINDOW_SEC)
+        self.rolling_regression = SlidingRegression(self.TREND_ROLLING_WINDOW_SEC)
+        self.trend_line = deque()  # (ts, y_fit) trong TREND_LINE_WINDOW_SEC
+
+    def process(self, now_ts, voltage, turbidity, raw_turbidity=None):
+        # turbidity: giá trị đã qua bộ lọc gai (nếu có); raw_turbidity: giá trị đọc được
+        status, status_bootstyle = get_water_status_bootstyle(turbidity)
+        # Sự kiện theo thứ tự: ("notify", message, skip_cooldown) hoặc ("command", cmd)
+        events = []
+
+        # Cảnh báo tốc độ thay đổi ngắn hạn (1 phút): dự báo vấn đề trước khi vượt ngưỡng cao
+        try:
+            rate = self.rate_regression
+            rate.add(now_ts, turbidity)
+            if len(rate) >= max(2, self.RATE_MIN_POINTS):
+                slope2 = rate.slope() * 60.0  # NTU/phút
+                (t_first, y_first), (t_last, y_last) = rate.first(), rate.last()
+                delta2 = y_last - y_first
+                dur2 = max(1e-6, (t_last - t_first) / 60.0)
+                if slope2 >= self.RATE_ALERT_SLOPE and delta2 >= self.RATE_MIN_DELTA:
+                    if (now_ts - self.last_rate_alert_at) >= self.RATE_ALERT_COOLDOWN_SEC:
+                        self.last_rate_alert_at = now_ts
+                        events.append((
+                            "notify",
+                            f"📈 Cảnh báo xu hướng: Nước đang đục nhanh! ~{slope2:.0f} NTU/min (Δ{delta2:.1f} NTU/{dur2:.1f} min)",
+                            True,
+                        ))
+        except Exception:
+            pass
+
+        # Gửi Telegram mỗi khi trạng thái thay đổi (không giới hạn tần suất)
+        if status != self.last_status_sent:
+            events.append(("notify", f"Trạng thái thay đổi: {status} — {turbidity:.2f} NTU", True))
+            self.last_status_sent = status
+
+        # Logic Cảnh báo Đa cấp
+        new_alert_level = 0
+        if turbidity > 100: new_alert_level = 3
+        elif turbidity > 50: new_alert_level = 2
+        elif turbidity > 10: new_alert_level = 1
+
+        if new_alert_level > self.current_alert_level:
+            self.current_alert_level = new_alert_level
+            # Gửi lệnh tới Arduino khi vượt mức rất đục
+            if new_alert_level >= 3:
+                events.append(("command", "A"))
+                events.append(("notify", f"Cảnh báo: Độ đục rất cao ({turbidity:.2f} NTU)", False))
+        elif new_alert_level == 0 and self.current_alert_level > 0:
+            self.current_alert_level = 0
+            print("Trạng thái cảnh báo đã reset (nước trong trở lại).")
+            events.append(("command", "S"))
+
+        self.trend_regression.add(now_ts, turbidity)
+        self._update_trend_line(now_ts, turbidity)
+        trend_series = self.trend_series(now_ts, limit=self.TREND_SNAPSHOT_POINTS)
+
+        # Phát hiện xu hướng tăng nhanh
+        try:
+            if self.is_trend_rising(now_ts):
+                events.append(("notify", f"Cảnh báo xu hướng: Độ đục đang tăng nhanh (>{self.TREND_ALERT_SLOPE:.0f} NTU/phút)", False))
+                events.append(("command", "A"))
+        except Exception:
+            pass
+
+        return {
+            "ts": now_ts,
+            "voltage": voltage,
+            "turbidity": turbidity,
+            "raw_turbidity": turbidity if raw_turbidity is None else raw_turbidity,
+            "status": status,
+            "bootstyle": status_bootstyle,
+            "trend": trend_series,
+            "events": events,
+        }
+
+    def _update_trend_line(self, now_ts, turbidity):
+        # Overlay Xu hướng (gấp khúc): mỗi điểm là giá trị hồi quy lăn tại thời điểm của nó,
+        # tính một lần khi mẫu đến rồi giữ lại trong cửa sổ hiển thị
+        self.rolling_regression.add(now_ts, turbidity)
+        fitted = self.rolling_regression.fit()
+        if fitted is not None:
+            y_fit = fitted[1](now_ts)
+        else:
+            # Fallback: dùng giá trị thực hoặc bản sao giá trị trước đó để nối mượt
+            y_fit = self.trend_line[-1][1] if self.trend_line else turbidity
+        self.trend_line.append((now_ts, y_fit))
+        cutoff = now_ts - self.TREND_LINE_WINDOW_SEC
+        while self.trend_line and self.trend_line[0][0] < cutoff:
+            self.trend_line.popleft()
+
+    def trend_series(self, now_ts, limit=None):
+        cutoff = now_ts - self.TREND_LINE_WINDOW_SEC
+        points = []
+        for t, y_fit in reversed(self.trend_line):
+            if t < cutoff or (limit is not None and len(points) >= limit):
+                break
+            points.append(y_fit)
+        if len(points) < 2:
+            return []
+        points.reverse()
+        return points
+
+    def is_trend_rising(self, now_ts=None):
+        # Độ dốc hồi quy trên TREND_WINDOW_SEC giây gần nhất
+        if now_ts is None:
+            now_ts = time.time()
+        trend = self.trend_regression
+        trend.evict(now_ts - self.TREND_WINDOW_SEC)
+        if len(trend) < 2:
+            return False
+        return trend.slope() * 60.0 >= self.TREND_ALERT_SLOPE
+
+
+class Stage:
+    """Một tầng xử lý: hàng đợi có giới hạn + luồng worker gọi `handler(item)`.
+
+    Bộ đếm backpressure:
+      - processed: số phần tử đã xử lý
+      - blocked:   số lần `put` phải chờ vì hàng đợi đầy
+      - dropped:   số phần tử bị bỏ vì hàng đợi vẫn đầy sau thời gian chờ
+      - max_depth: độ sâu hàng đợi lớn nhất từng thấy
+    """
+
+    def __init__(self, name, handler, maxsize=256, put_timeout=0.0):
+        self.name = name
+        self.handler = handler
+        self.put_timeout = put_timeout
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.processed = 0
+        self.blocked = 0
+        self.dropped = 0
+        self.errors = 0
+        self.max_depth = 0
+        self._thread = None
+        self._running = False
+
+    def start(self):
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name=f"stage-{self.name}", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=2.0):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def put(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.blocked += 1
+            try:
+                if self.put_timeout <= 0:
+                    raise queue.Full
+                self.queue.put(item, timeout=self.put_timeout)
+            except queue.Full:
+                self.dropped += 1
+                return False
+        depth = self.queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+        return True
+
+    def stats(self):
+        return {
+            "depth": self.queue.qsize(),
+            "max_depth": self.max_depth,
+            "processed": self.processed,
+            "blocked": self.blocked,
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
+
+    def _run(self):
+        # Khi dừng vẫn xử lý nốt phần còn trong hàng đợi (giới hạn bởi timeout của stop)
+        while self._running or not self.queue.empty():
+            try:
+                item = self.queue.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            try:
+                self.handler(item)
+            except Exception as e:
+                self.errors += 1
+                print(f"Lỗi tầng {self.name}: {e}")
+            self.processed += 1
+
+
+class DeviceChannel:
+    """Trạng thái riêng của một thiết bị trong pipeline: phân tích, lọc gai và bộ đếm."""
+
+    def __init__(self, device_id, analytics, spike_filter=None):
+        self.device_id = device_id
+        self.analytics = analytics
+        self.spike_filter = spike_filter
+        self.samples = 0
+        self.parse_errors = 0
+
+    def stats(self):
+        stats = {"samples": self.samples, "parse_errors": self.parse_errors}
+        if self.spike_filter is not None:
+            stats["filter"] = self.spike_filter.stats()
+        return stats
+
+
+class IngestPipeline:
+    """Chuỗi xử lý ngoài luồng Tk: parse → analytics → persistence → notification.
+
+    Luồng đọc serial chỉ gọi `submit(line, device_id)`. Luồng UI chỉ nhận ảnh chụp
+    (snapshot) nhỏ qua `on_snapshot`, không phải làm DB/HTTP/tính toán. Nhiều
+    thiết bị dùng chung bốn luồng tầng; kết quả mang khóa "device_id".
+    """
+
+    def __init__(self, parse_fn, analytics, persist_fn, notify_fn, command_fn, on_snapshot, maxsize=256,
+                 spike_filter=None, device_id=None):
+        self.parse_fn = parse_fn
+        self.persist_fn = persist_fn
+        self.notify_fn = notify_fn
+        self.command_fn = command_fn
+        self.on_snapshot = on_snapshot
+        # Mỗi thiết bị có bộ lọc gai + trạng thái phân tích/cảnh báo riêng; các tầng (luồng) dùng chung,
+        # hàng đợi FIFO nên thứ tự mẫu của từng thiết bị được giữ nguyên
+        self.devices = {}
+        self.default_device = device_id
+        self.add_device(device_id, analytics, spike_filter)
+        # Tầng đầu chặn luồng đọc một chút (đẩy ngược về bộ đệm serial) trước khi bỏ dòng;
+        # các tầng sau không bao giờ chặn tầng trước.
+        self.parse_stage = Stage("parse", self._parse, maxsize=maxsize, put_timeout=0.5)
+        self.analytics_stage = Stage("analytics", self._analyze, maxsize=maxsize)
+        self.persist_stage = Stage("persistence", self._persist, maxsize=maxsize * 4)
+        self.notify_stage = Stage("notification", self._notify, maxsize=64)
+        self.stages = [self.parse_stage, self.analytics_stage, self.persist_stage, self.notify_stage]
+        self.parse_errors = 0
+
+    @property
+    def analytics(self):
+        return self.devices[self.default_device].analytics
+
+    @property
+    def spike_filter(self):
+        return self.devices[self.default_device].spike_filter
+
+    def add_device(self, device_id, analytics=None, spike_filter=None):
+        # Gọi trước khi thiết bị gửi dữ liệu; analytics mặc định là một SensorAnalytics mới
+        channel = DeviceChannel(device_id, analytics if analytics is not None else SensorAnalytics(), spike_filter)
+        self.devices[device_id] = channel
+        return channel
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+        return self
+
+    def stop(self):
+        for stage in self.stages:
+            stage.stop()
+
+    def submit(self, line, device_id=None):
+        return self.parse_stage.put((time.time(), self._device_key(device_id), line))
+
+    def submit_reading(self, voltage, turbidity, device_id=None):
+        # Dữ liệu đã giải mã sẵn (khung nhị phân): đi qua tầng parse để giữ nguyên backpressure
+        return self.parse_stage.put((time.time(), self._device_key(device_id), (voltage, turbidity)))
+
+    def _device_key(self, device_id):
+        return self.default_device if device_id is None else device_id
+
+    def stats(self):
+        stats = {stage.name: stage.stats() for stage in self.stages}
+        stats["parse"]["parse_errors"] = self.parse_errors
+        if self.spike_filter is not None:
+            stats["filter"] = self.spike_filter.stats()
+        if len(self.devices) > 1:
+            stats["devices"] = {device_id: channel.stats() for device_id, channel in self.devices.items()}
+        return stats
+
+    def _parse(self, item):
+        received_at, device_id, line = item
+        channel = self.devices[device_id]
+        try:
+            voltage, turbidity = line if isinstance(line, tuple) else self.parse_fn(line)
+        except ValueError:
+            # Bỏ qua các dòng không phân tích được (như các dòng setup của Arduino)
+            self.parse_errors += 1
+            channel.parse_errors += 1
+            return
+        filtered = turbidity if channel.spike_filter is None else channel.spike_filter.update(turbidity)
+        self.analytics_stage.put((received_at, channel, voltage, filtered, turbidity))
+
+    def _analyze(self, item):
+        received_at, channel, voltage, turbidity, raw_turbidity = item
+        result = channel.analytics.process(received_at, voltage, turbidity, raw_turbidity)
+        result["device_id"] = channel.device_id
+        channel.samples += 1
+        self.persist_stage.put(result)
+        if result["events"]:
+            self.notify_stage.put((channel.device_id, result["events"]))
+        self.on_snapshot(result)
+
+    def _persist(self, result):
+        self.persist_fn(result)
+
+    def _notify(self, item):
+        device_id, events = item
+        for event in events:
+            if event[0] == "notify":
+                self.notify_fn(event[1], skip_cooldown=event[2], device_id=device_id)
+            elif event[0] == "command":
+                self.command_fn(event[1], device_id=device_id)
@@ -0,0 +1,284 @@
+import json
+import os
+import queue
+import socket
+import threading
+import time
+from collections import deque
+
+# Kênh đẩy dữ liệu cục bộ: chương trình desktop phát từng mẫu cho các dashboard đang nghe.
+# Giao thức: TCP trên 127.0.0.1, mỗi dòng một bản ghi JSON (NDJSON) như
+#   {"ts_ms": 1760000000000, "voltage": 3600.0, "turbidity": 12.5, "status": "Nước hơi đục",
+#    "source": "Arduino Uno", "raw_turbidity": 12.5}
+# Người nghe chỉ đọc; vừa kết nối sẽ nhận lại `replay` bản ghi gần nhất rồi tới dữ liệu trực tiếp.
+# Dùng TCP loopback thay vì Unix socket để chạy được cả trên Windows.
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8766
+
+
+def encode(record):
+    return (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+class _Connection:
+    """Một người nghe phía publisher: hàng đợi có giới hạn + luồng gửi riêng."""
+
+    def __init__(self, sock, addr, max_pending):
+        self.sock = sock
+        self.addr = addr
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.closed = False
+        self.sent = 0
+
+    def close(self):
+        self.closed = True
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class FeedPublisher:
+    """Phát bản ghi tới mọi người nghe qua TCP localhost; `publish()` không bao giờ chặn người gọi.
+
+    - Mỗi bản ghi được mã hóa một lần rồi đưa vào hàng đợi của từng người nghe.
+    - Người nghe chậm (hàng đợi đầy `max_pending` dòng) bị ngắt kết nối, không làm chậm luồng ghi;
+      họ tự kết nối lại và nhận lại phần replay.
+    - Giữ `replay` bản ghi gần nhất để người mới nghe có ngay phần đuôi dữ liệu.
+    """
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, replay=50, max_pending=1000, send_timeout=5.0):
+        self.host = host
+        self.port = port
+        self.max_pending = max_pending
+        self.send_timeout = send_timeout
+        self._replay = deque(maxlen=replay)
+        self._connections = []
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+        self._stop = threading.Event()
+        self.published = 0
+        self.accepted = 0
+        self.dropped_slow = 0
+
+    def start(self):
+        """Mở cổng nghe; lỗi bind (vd. cổng đã dùng) được ném ra cho người gọi quyết định."""
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if os.name != "nt":
+            # Mở lại ngay sau khi đóng chương trình (cổng cũ còn TIME_WAIT); trên Windows tùy chọn
+            # này lại cho phép tiến trình khác chiếm cùng cổng nên không dùng
+            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server.bind((self.host, self.port))
+        server.listen(8)
+        server.settimeout(0.5)  # để luồng accept kiểm tra cờ dừng
+        self._server = server
+        self.port = server.getsockname()[1]  # port=0: hệ điều hành chọn cổng trống
+        self._thread = threading.Thread(target=self._accept_loop, name="feed-accept", daemon=True)
+        self._thread.start()
+        return self
+
+    def publish(self, record):
+        line = encode(record)
+        with self._lock:
+            self._replay.append(line)
+            self.published += 1
+            for conn in self._connections:
+                try:
+                    conn.queue.put_nowait(line)
+                except queue.Full:
+                    self.dropped_slow += 1
+                    conn.close()
+            if any(conn.closed for conn in self._connections):
+                self._connections = [conn for conn in self._connections if not conn.closed]
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+        if self._server is not None:
+            self._server.close()
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+                try:
+                    conn.queue.put_nowait(None)  # đánh thức luồng gửi
+                except queue.Full:
+                    pass  # hàng đợi còn dữ liệu: luồng gửi sẽ gặp socket đã đóng và tự thoát
+            self._connections = []
+
+    def stats(self):
+        with self._lock:
+            return {
+                "port": self.port,
+                "subscribers": len(self._connections),
+                "accepted": self.accepted,
+                "published": self.published,
+                "dropped_slow": self.dropped_slow,
+            }
+
+    def _accept_loop(self):
+        while not self._stop.is_set():
+            try:
+                sock, addr = self._server.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            sock.settimeout(self.send_timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn = _Connection(sock, addr, self.max_pending)
+            with self._lock:
+                # Replay và đăng ký trong cùng khóa: không mất cũng không lặp bản ghi nào
+                for line in self._replay:
+                    conn.queue.put_nowait(line)
+                self._connections.append(conn)
+                self.accepted += 1
+            threading.Thread(target=self._send_loop, args=(conn,), name=f"feed-send-{addr[1]}",
+                             daemon=True).start()
+
+    def _send_loop(self, conn):
+        while not conn.closed:
+            line = conn.queue.get()
+            if line is None:
+                break
+            # Gom các dòng đang chờ thành một lần gửi
+            lines = [line]
+            while True:
+                try:
+                    line = conn.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if line is None:
+                    break
+                lines.append(line)
+            try:
+                conn.sock.sendall(b"".join(lines))
+                conn.sent += len(lines)
+            except OSError:
+                break
+        conn.close()
+
+
+class FeedSubscriber:
+    """Nghe FeedPublisher trên một luồng nền, tự kết nối lại khi mất kết nối.
+
+    Giữ `maxlen` bản ghi mới nhất. `version` tăng mỗi khi có bản ghi mới, `generation` tăng
+    mỗi lần kết nối (bộ đệm được xóa vì publisher gửi lại phần replay).
+    `on_record(record)` (tùy chọn) được gọi trên luồng nền cho từng bản ghi.
+    """
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, maxlen=50, on_record=None,
+                 retry_interval=2.0, connect_timeout=1.0):
+        self.host = host
+        self.port = port
+        self.on_record = on_record
+        self.retry_interval = retry_interval
+        self.connect_timeout = connect_timeout
+        self._records = deque(maxlen=maxlen)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._attempted = threading.Event()  # đã thử kết nối lần đầu (thành công hay không)
+        self._sock = None
+        self._thread = None
+        self.connected = False
+        self.version = 0
+        self.generation = 0
+        self.received = 0
+        self.decode_errors = 0
+        self.received_at = None  # time.monotonic() của bản ghi gần nhất
+
+    def start(self, wait=True):
+        """Chạy luồng nghe; `wait` chờ lần thử kết nối đầu tiên để `connected` đúng ngay sau khi trả về."""
+        self._thread = threading.Thread(target=self._run, name="feed-subscriber", daemon=True)
+        self._thread.start()
+        if wait:
+            self._attempted.wait(self.connect_timeout + 1.0)
+        return self
+
+    def snapshot(self):
+        """(generation, version, danh sách bản ghi) nhất quán với nhau."""
+        with self._lock:
+            return self.generation, self.version, list(self._records)
+
+    def stop(self):
+        self._stop.set()
+        sock = self._sock
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+
+    def stats(self):
+        return {
+            "connected": self.connected,
+            "generation": self.generation,
+            "received": self.received,
+            "decode_errors": self.decode_errors,
+        }
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                sock = socket.create_connection((self.host, self.port), timeout=self.connect_timeout)
+            except OSError:
+                self._attempted.set()
+                self._stop.wait(self.retry_interval)
+                continue
+            sock.settimeout(1.0)  # để kiểm tra cờ dừng
+            self._sock = sock
+            with self._lock:
+                self._records.clear()
+                self.generation += 1
+                self.version += 1
+                self.connected = True
+            self._attempted.set()
+            try:
+                self._read(sock)
+            finally:
+                self.connected = False
+                self._sock = None
+                try:
+                    sock.close()
+                except OSError:
+                    pass
+            self._stop.wait(self.retry_interval)
+
+    def _read(self, sock):
+        buffer = b""
+        while not self._stop.is_set():
+            try:
+                chunk = sock.recv(65536)
+            except socket.timeout:
+                continue
+            except OSError:
+                return
+            if not chunk:
+                return  # publisher đã đóng
+            buffer += chunk
+            if b"\n" not in buffer:
+                continue
+            *lines, buffer = buffer.split(b"\n")
+            records = []
+            for line in lines:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    self.decode_errors += 1
+            if not records:
+                continue
+            with self._lock:
+                self._records.extend(records)
+                self.version += 1
+                self.received += len(records)
+                self.received_at = time.monotonic()
+            if self.on_record is not None:
+                for record in records:
+                    self.on_record(record)
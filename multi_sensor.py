@@ -0,0 +1,276 @@
+import threading
+import time
+
+import serial
+
+import binary_protocol
+
+# Cổng dò tự động khi chưa cấu hình SENSOR_PORTS (giữ hành vi một cảm biến cũ)
+DEFAULT_SCAN_PORTS = ['COM3', 'COM4', 'COM5', '/dev/ttyUSB0', '/dev/ttyACM0', '/dev/ttyS0']
+# Mã thiết bị mặc định = nguồn dữ liệu cũ, để các dòng cũ và mới cùng một "source"
+DEFAULT_DEVICE_ID = "Arduino Uno"
+COMMAND_COOLDOWN_SEC = 10  # gửi mỗi loại lệnh tối đa một lần / 10 s cho từng thiết bị
+# read() chặn không thời hạn và chỉ thức dậy khi có byte; dừng bằng cancel_read() (pyserial >= 3.1).
+# Bản pyserial không có cancel_read dùng FALLBACK_READ_TIMEOUT_SEC để còn kiểm tra cờ dừng.
+FALLBACK_READ_TIMEOUT_SEC = 1.0
+ARDUINO_RESET_SEC = 2.0  # Arduino khởi động lại khi mở cổng
+# Kết nối lại khi mở cổng thất bại hoặc mất kết nối: chờ lũy thừa 2 từ MIN tới MAX giây
+RECONNECT_MIN_SEC = 0.5
+RECONNECT_MAX_SEC = 30.0
+
+
+def parse_sensor_ports(spec):
+    """Đọc cấu hình dạng "be_loc=/dev/ttyUSB0, be_chua=COM4" → [(device_id, port), ...].
+
+    Mục không có "=" dùng chính tên cổng làm mã thiết bị. Chuỗi rỗng → một thiết bị
+    mặc định dò tự động trên DEFAULT_SCAN_PORTS (port = None).
+    """
+    devices = []
+    seen = set()
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        device_id, sep, port = item.partition("=")
+        device_id, port = device_id.strip(), port.strip()
+        if not sep:
+            port = device_id
+        if not device_id or not port:
+            raise ValueError(f"Cấu hình thiết bị không hợp lệ: {item!r}")
+        if device_id in seen:
+            raise ValueError(f"Trùng mã thiết bị: {device_id!r}")
+        seen.add(device_id)
+        devices.append((device_id, port))
+    return devices or [(DEFAULT_DEVICE_ID, None)]
+
+
+class SensorReader:
+    """Một cảm biến = một cổng serial + một luồng đọc.
+
+    Luồng đọc chặn trong `readline()`/`read()`: khi không có dữ liệu nó ngủ trong
+    kernel và chỉ thức dậy khi có byte (hoặc khi `request_stop` gọi `cancel_read`),
+    nên hàng chục cổng chỉ tốn hàng chục luồng đang ngủ. Dòng văn bản đi tới
+    `on_line(device_id, line)`, khung nhị phân đã giải mã tới
+    `on_reading(device_id, voltage_mv, ntu)`.
+
+    Mở cổng thất bại hoặc mất kết nối thì tự thử lại với thời gian chờ tăng dần
+    (RECONNECT_MIN_SEC → RECONNECT_MAX_SEC, về lại mức đầu sau khi kết nối được).
+    `on_status(device_id, state, detail)` báo "connecting" / "connected" /
+    "retrying" (detail = số giây chờ) / "lost" / "closed".
+
+    Mọi callback chạy trên luồng đọc và không được chặn hay gọi Tk: SensorHub.stop() trên
+    luồng Tk join từng luồng đọc, một callback chờ luồng Tk sẽ treo tới hết thời gian join.
+    """
+
+    def __init__(self, device_id, port, protocol, on_line, on_reading, on_status):
+        self.device_id = device_id
+        self.ports = [port] if port else list(DEFAULT_SCAN_PORTS)
+        self.protocol = protocol
+        self.on_line = on_line
+        self.on_reading = on_reading
+        self.on_status = on_status
+        self.frame_decoder = binary_protocol.FrameDecoder() if protocol == "binary" else None
+        self.connection = None
+        self.port = None
+        self.state = "idle"
+        self.lines = 0
+        self.commands = 0
+        self.reconnects = 0
+        self.callback_errors = 0
+        self.last_command_type = None
+        self.last_command_sent_at = 0.0
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def baudrate(self):
+        return binary_protocol.BINARY_BAUDRATE if self.protocol == "binary" else binary_protocol.TEXT_BAUDRATE
+
+    @property
+    def is_connected(self):
+        conn = self.connection
+        return conn is not None and conn.is_open
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=f"serial-{self.device_id}", daemon=True)
+            self._thread.start()
+        return self
+
+    def request_stop(self):
+        self._stop.set()
+        conn = self.connection
+        # Đánh thức read() đang chặn; bản pyserial cũ thì read() tự trả về sau FALLBACK_READ_TIMEOUT_SEC
+        cancel = getattr(conn, "cancel_read", None)
+        if callable(cancel):
+            try:
+                cancel()
+            except Exception:
+                pass
+
+    def join(self, timeout=FALLBACK_READ_TIMEOUT_SEC + 1.0):
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def send_command(self, cmd):
+        now = time.time()
+        if not self.is_connected:
+            return False
+        if self.last_command_type == cmd and (now - self.last_command_sent_at) < COMMAND_COOLDOWN_SEC:
+            return False
+        try:
+            with self._write_lock:
+                self.connection.write(cmd.encode('utf-8'))
+            self.last_command_type = cmd
+            self.last_command_sent_at = now
+            self.commands += 1
+            return True
+        except Exception as e:
+            print(f"[{self.device_id}] Lỗi gửi lệnh tới Arduino: {e}")
+            return False
+
+    def stats(self):
+        stats = {
+            "port": self.port,
+            "state": self.state,
+            "lines": self.lines,
+            "commands": self.commands,
+            "reconnects": self.reconnects,
+            "callback_errors": self.callback_errors,
+        }
+        if self.frame_decoder is not None:
+            stats["frames"] = self.frame_decoder.stats()
+        return stats
+
+    def _set_state(self, state, detail=None):
+        self.state = state
+        self.on_status(self.device_id, state, detail)
+
+    def _open(self):
+        for port in self.ports:
+            if self._stop.is_set():
+                return None
+            try:
+                conn = serial.Serial(port=port, baudrate=self.baudrate, timeout=None, write_timeout=1)
+            except serial.SerialException as e:
+                print(f"[{self.device_id}] Failed to connect on {port}: {e}")
+                continue
+            if not callable(getattr(conn, "cancel_read", None)):
+                conn.timeout = FALLBACK_READ_TIMEOUT_SEC
+            # Cho Arduino thời gian khởi động lại (dừng được ngay trong lúc chờ)
+            if self._stop.wait(ARDUINO_RESET_SEC):
+                conn.close()
+                return None
+            try:
+                conn.reset_input_buffer()
+            except Exception:
+                pass
+            self.port = port
+            return conn
+        return None
+
+    def _run(self):
+        delay = RECONNECT_MIN_SEC
+        while not self._stop.is_set():
+            self._set_state("connecting")
+            conn = self._open()
+            if conn is None:
+                if self._stop.is_set():
+                    break
+                self._set_state("retrying", delay)
+                self._stop.wait(delay)
+                delay = min(delay * 2, RECONNECT_MAX_SEC)
+                continue
+            delay = RECONNECT_MIN_SEC
+            if self.frame_decoder is not None:
+                # Mở cổng làm Arduino khởi động lại và frameSeq đếm lại từ 0
+                self.frame_decoder.reset()
+            self.connection = conn
+            self._set_state("connected", self.port)
+            try:
+                if self.frame_decoder is not None:
+                    self._read_frames(conn)
+                else:
+                    self._read_lines(conn)
+            except (serial.SerialException, OSError) as e:
+                if not self._stop.is_set():
+                    print(f"[{self.device_id}] Lỗi đọc serial (Mất kết nối?): {e}")
+                    self.reconnects += 1
+                    self._set_state("lost", str(e))
+            finally:
+                self.connection = None
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+        self._set_state("closed")
+
+    def _deliver(self, callback, *args):
+        # Lỗi ở tầng sau không được làm chết luồng đọc hay bắt nó ngủ
+        try:
+            callback(self.device_id, *args)
+        except Exception as e:
+            self.callback_errors += 1
+            print(f"[{self.device_id}] Lỗi xử lý dữ liệu đọc được: {e}")
+
+    def _read_lines(self, conn):
+        stop = self._stop
+        while not stop.is_set():
+            raw = conn.readline()  # trả về ngay khi gặp '\n'; rỗng khi bị cancel_read/timeout dự phòng
+            if not raw:
+                continue
+            line = raw.decode('utf-8', errors='ignore').strip()
+            if line:
+                self.lines += 1
+                self._deliver(self.on_line, line)
+
+    def _read_frames(self, conn):
+        decoder = self.frame_decoder
+        stop = self._stop
+        while not stop.is_set():
+            data = conn.read(conn.in_waiting or binary_protocol.FRAME_SIZE)
+            if not data:
+                continue
+            for _seq, _ts_ms, raw_adc, ntu in decoder.feed(data):
+                self._deliver(self.on_reading, binary_protocol.adc_to_millivolts(raw_adc), float(ntu))
+
+
+class SensorHub:
+    """Quản lý nhiều SensorReader: mở cổng song song, dừng đồng loạt, định tuyến lệnh theo thiết bị."""
+
+    def __init__(self, devices, protocol, on_line, on_reading, on_status):
+        self.readers = {
+            device_id: SensorReader(device_id, port, protocol, on_line, on_reading, on_status)
+            for device_id, port in devices
+        }
+
+    def __len__(self):
+        return len(self.readers)
+
+    def device_ids(self):
+        return list(self.readers)
+
+    def start(self):
+        for reader in self.readers.values():
+            reader.start()
+        return self
+
+    def stop(self):
+        # Báo dừng tất cả trước rồi mới join: tổng thời gian dừng ~ một timeout đọc, không phải N
+        for reader in self.readers.values():
+            reader.request_stop()
+        for reader in self.readers.values():
+            reader.join()
+
+    def connected(self):
+        return [device_id for device_id, reader in self.readers.items() if reader.is_connected]
+
+    def send_command(self, cmd, device_id):
+        reader = self.readers.get(device_id)
+        return reader.send_command(cmd) if reader is not None else False
+
+    def stats(self):
+        return {device_id: reader.stats() for device_id, reader in self.readers.items()}
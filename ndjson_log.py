@@ -0,0 +1,177 @@
+import argparse
+import json
+import os
+
+import turbidity_db
+
+# Log dạng NDJSON: mỗi dòng một bản ghi JSON, chỉ ghi nối (append-only)
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_LOG_PATH = os.path.join(BASE_DIR, "turbidity_log.ndjson")
+LEGACY_JSON_PATH = os.path.join(BASE_DIR, "turbidity_log.json")
+
+FIELDS = ("timestamp", "voltage", "turbidity", "status", "source")
+
+
+def to_record(row):
+    """Dòng (ts, voltage, turbidity, status, source[, ts_ms[, raw_turbidity]]) -> bản ghi NDJSON."""
+    rec = dict(zip(FIELDS, row))
+    if len(row) > 6 and row[6] is not None:
+        rec["raw_turbidity"] = row[6]
+    return rec
+
+
+def append_records(path, records):
+    """Ghi nối nhiều bản ghi bằng một lần write; người đọc bỏ qua dòng cuối chưa có '\\n'."""
+    data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+    if not data:
+        return
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(data)
+        f.flush()
+
+
+def tail_records(path, n, block_size=8192):
+    """Đọc n bản ghi cuối bằng cách seek ngược từ cuối file, không phân tích cả file."""
+    if n <= 0:
+        return []
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        pos = end
+        data = b""
+        # Cần n+1 ký tự xuống dòng để chắc chắn có đủ n dòng trọn vẹn
+        while pos > 0 and data.count(b"\n") <= n:
+            step = min(block_size, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    # Dòng cuối không kết thúc bằng '\n' là dòng đang được ghi dở
+    if not data.endswith(b"\n"):
+        data = data[: data.rfind(b"\n") + 1]
+    lines = data.split(b"\n")[:-1]
+    if pos > 0:
+        lines = lines[1:]  # dòng đầu có thể bị cắt ngang
+    records = []
+    for line in lines[-n:]:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            continue
+    return records
+
+
+def iter_records(path):
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.endswith("\n"):
+                break
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def iter_json_array(path, chunk_size=65536):
+    """Đọc dần một file JSON dạng mảng (turbidity_log.json cũ) mà không nạp toàn bộ."""
+    decoder = json.JSONDecoder()
+    with open(path, "r", encoding="utf-8") as f:
+        buf = f.read(chunk_size).lstrip()
+        if not buf.startswith("["):
+            raise ValueError("File không phải mảng JSON")
+        buf = buf[1:]
+        eof = False
+        while True:
+            buf = buf.lstrip().lstrip(",").lstrip()
+            if buf.startswith("]"):
+                return
+            try:
+                obj, end = decoder.raw_decode(buf)
+            except ValueError:
+                if eof:
+                    if buf.strip():
+                        raise
+                    return
+                more = f.read(chunk_size)
+                if not more:
+                    eof = True
+                buf += more
+                continue
+            yield obj
+            buf = buf[end:]
+
+
+def migrate_json_to_db(json_path=LEGACY_JSON_PATH, db_path=turbidity_db.DEFAULT_DB_PATH, batch_size=5000):
+    """Chuyển một lần mảng JSON cũ vào bảng readings (kèm bảng tổng hợp), theo từng lô.
+
+    Số bản ghi đã nạp của file được lưu trong bảng meta cùng transaction với mỗi lô: chạy lại
+    (kể cả sau khi bị ngắt giữa chừng) chỉ nạp phần chưa nạp, không nhân đôi dữ liệu.
+    Trả về số bản ghi nạp trong lần chạy này.
+    """
+    turbidity_db.init_db(db_path)
+    conn = turbidity_db.connect(db_path)
+    key = "json_migrated:" + os.path.abspath(json_path)
+    total = 0
+    try:
+        done = turbidity_db.get_meta(conn, key, 0)
+        batch = []
+        for i, rec in enumerate(iter_json_array(json_path)):
+            if i < done:
+                continue
+            batch.append((
+                rec["timestamp"],
+                float(rec.get("voltage") or 0.0),
+                float(rec.get("turbidity") or 0.0),
+                rec.get("status"),
+                rec.get("source"),
+            ))
+            if len(batch) >= batch_size:
+                total += _insert_batch(conn, batch, key, done + total + len(batch))
+                batch = []
+        if batch:
+            total += _insert_batch(conn, batch, key, done + total + len(batch))
+    finally:
+        conn.close()
+    return total
+
+
+def _insert_batch(conn, batch, key, done):
+    with conn:
+        turbidity_db.insert_rows(conn, batch)
+        turbidity_db.update_rollups(conn, batch)
+        turbidity_db.set_meta(conn, key, done)
+    return len(batch)
+
+
+def convert_json_to_ndjson(json_path=LEGACY_JSON_PATH, ndjson_path=DEFAULT_LOG_PATH, batch_size=5000):
+    total = 0
+    batch = []
+    for rec in iter_json_array(json_path):
+        batch.append(rec)
+        if len(batch) >= batch_size:
+            append_records(ndjson_path, batch)
+            total += len(batch)
+            batch = []
+    append_records(ndjson_path, batch)
+    return total + len(batch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chuyển đổi turbidity_log.json cũ")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_db = sub.add_parser("migrate-db", help="nạp mảng JSON cũ vào turbidity.db")
+    p_db.add_argument("--json", default=LEGACY_JSON_PATH)
+    p_db.add_argument("--db", default=turbidity_db.DEFAULT_DB_PATH)
+    p_nd = sub.add_parser("to-ndjson", help="chuyển mảng JSON cũ sang NDJSON")
+    p_nd.add_argument("--json", default=LEGACY_JSON_PATH)
+    p_nd.add_argument("--out", default=DEFAULT_LOG_PATH)
+    args = parser.parse_args()
+    if args.command == "migrate-db":
+        print(f"Đã nạp {migrate_json_to_db(args.json, args.db)} bản ghi vào {args.db}")
+    elif args.command == "to-ndjson":
+        print(f"Đã ghi {convert_json_to_ndjson(args.json, args.out)} bản ghi vào {args.out}")
+
+
+if __name__ == "__main__":
+    main()
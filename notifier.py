@@ -0,0 +1,304 @@
+import http.client
+import json
+import queue
+import ssl
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+try:
+    import certifi
+    HAS_CERTIFI = True
+except Exception:
+    HAS_CERTIFI = False
+
+TELEGRAM_API_URL = "https://api.telegram.org"
+MAX_MESSAGE_CHARS = 4096  # giới hạn độ dài một tin của Telegram
+
+SSL_HINT = (
+    "\nGợi ý khắc phục SSL:\n- Nếu đang ở mạng công ty/proxy, hãy cài chứng chỉ CA nội bộ vào Windows Trusted Root.\n"
+    "- Hoặc cài certifi: pip install certifi (ứng dụng sẽ tự dùng certifi nếu có).\n"
+    "- Hoặc đặt biến môi trường SSL_CERT_FILE hoặc REQUESTS_CA_BUNDLE trỏ tới file CA bundle.\n"
+    "- Chỉ để test tạm thời: set TELEGRAM_INSECURE_SKIP_VERIFY=1 (không khuyến nghị dùng lâu dài).\n"
+)
+
+
+def create_ssl_context(insecure_skip=False):
+    """SSL context dùng certifi nếu có; bỏ qua xác thực chỉ khi được yêu cầu rõ ràng."""
+    if insecure_skip:
+        print("[Cảnh báo] Đang bỏ qua xác thực SSL (TELEGRAM_INSECURE_SKIP_VERIFY=1). Chỉ sử dụng tạm thời để kiểm tra.")
+        return ssl._create_unverified_context()
+    context = ssl.create_default_context()
+    if HAS_CERTIFI:
+        try:
+            context.load_verify_locations(certifi.where())
+        except Exception:
+            pass
+    return context
+
+
+class SendError(Exception):
+    def __init__(self, message, retry_after=None, permanent=False):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.permanent = permanent
+
+
+class TokenBucket:
+    """Giới hạn tốc độ mỗi kênh: `rate` tin / `per` giây, cho phép dồn tối đa `burst` tin."""
+
+    def __init__(self, rate, per=60.0, burst=None):
+        self.capacity = float(burst if burst is not None else rate)
+        self.refill = rate / per
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _fill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill)
+        self.updated = now
+
+    def wait_time(self, now):
+        self._fill(now)
+        return 0.0 if self.tokens >= 1.0 else (1.0 - self.tokens) / self.refill
+
+    def take(self, now):
+        self._fill(now)
+        self.tokens -= 1.0
+
+
+class NotificationDispatcher:
+    """Gửi thông báo Telegram trên một luồng nền; `submit()` không bao giờ chặn người gọi.
+
+    - Hàng đợi có giới hạn: đầy thì bỏ tin mới (đếm `dropped`).
+    - Một kết nối HTTPS keep-alive dùng lại cho mọi tin; SSL context tạo một lần.
+    - Gộp đợt: các tin cùng kênh đến trong `coalesce_sec` giây được gửi thành một tin.
+    - Cooldown như trước: tin không có skip_cooldown bị bỏ nếu kênh vừa gửi trong `cooldown_sec`.
+    - Giới hạn tốc độ mỗi kênh (TokenBucket); chưa tới lượt thì tin tiếp tục được gộp chờ.
+    - Lỗi mạng / 5xx / 429: thử lại tối đa `max_retries` lần, chờ lũy thừa 2 (hoặc retry_after của 429).
+
+    Kênh (channel) là mã thiết bị; `label_channels=True` thì tin có tiền tố "[kênh] ".
+    `get_credentials()` trả về (token, chat_id) tại thời điểm gửi; thiếu thì tin bị bỏ.
+    """
+
+    MAX_BATCH = 20  # số tin tối đa gộp vào một lần gửi
+
+    def __init__(self, get_credentials, api_url=TELEGRAM_API_URL, maxsize=64, coalesce_sec=2.0, cooldown_sec=60,
+                 rate_per_min=20, burst=5, max_retries=5, backoff_sec=1.0, max_backoff_sec=30.0, timeout=10.0,
+                 label_channels=False, insecure_skip_verify=False):
+        self.get_credentials = get_credentials
+        parts = urlsplit(api_url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.base_path = parts.path.rstrip("/")
+        self.coalesce_sec = coalesce_sec
+        self.cooldown_sec = cooldown_sec
+        self.rate_per_min = rate_per_min
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff_sec = backoff_sec
+        self.max_backoff_sec = max_backoff_sec
+        self.timeout = timeout
+        self.label_channels = label_channels
+        self.insecure_skip_verify = insecure_skip_verify
+        self.queue = queue.Queue(maxsize=maxsize)
+        self._context = None
+        self._conn = None
+        self._pending = {}  # channel -> [các tin, thời điểm tin đầu, số tin lược bớt]
+        self._buckets = {}
+        self._last_sent = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self.submitted = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.suppressed = 0
+        self.retries = 0
+        self.failed = 0
+        self.connections = 0
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="notifier", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        # Gửi nốt các tin đang gộp (không chờ hết cửa sổ gộp) rồi đóng kết nối
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, message, channel=None, skip_cooldown=False):
+        now = time.monotonic()
+        if not skip_cooldown and (now - self._last_sent.get(channel, float("-inf"))) < self.cooldown_sec:
+            self.suppressed += 1
+            return False
+        try:
+            self.queue.put_nowait((channel, message))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        self.submitted += 1
+        return True
+
+    def stats(self):
+        return {
+            "submitted": self.submitted,
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "dropped": self.dropped,
+            "suppressed": self.suppressed,
+            "retries": self.retries,
+            "failed": self.failed,
+            "connections": self.connections,
+            "queued": self.queue.qsize(),
+            "pending": sum(len(p[0]) for p in self._pending.values()),
+        }
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                try:
+                    channel, message = self.queue.get(timeout=self._next_wait())
+                    self._add_pending(channel, message)
+                except queue.Empty:
+                    pass
+                self._flush_due()
+            while True:
+                try:
+                    self._add_pending(*self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._flush_due(force=True)
+        finally:
+            self._close()
+
+    def _add_pending(self, channel, message):
+        entry = self._pending.get(channel)
+        if entry is None:
+            self._pending[channel] = [[message], time.monotonic(), 0]
+            return
+        self.coalesced += 1
+        messages = entry[0]
+        if message in messages:  # các cảnh báo lặp lại trong một đợt chỉ giữ một lần
+            return
+        if len(messages) < self.MAX_BATCH:
+            messages.append(message)
+        else:
+            entry[2] += 1  # chỉ báo số tin bị lược bớt
+
+    def _bucket(self, channel):
+        bucket = self._buckets.get(channel)
+        if bucket is None:
+            bucket = self._buckets[channel] = TokenBucket(self.rate_per_min, 60.0, self.burst)
+        return bucket
+
+    def _next_wait(self):
+        if not self._pending:
+            return 0.5
+        now = time.monotonic()
+        waits = [
+            max(first_at + self.coalesce_sec - now, self._bucket(channel).wait_time(now))
+            for channel, (_messages, first_at, _omitted) in self._pending.items()
+        ]
+        return min(0.5, max(0.01, min(waits)))
+
+    def _flush_due(self, force=False):
+        now = time.monotonic()
+        for channel, (messages, first_at, omitted) in list(self._pending.items()):
+            bucket = self._bucket(channel)
+            if not force and (now - first_at < self.coalesce_sec or bucket.wait_time(now) > 0):
+                continue
+            del self._pending[channel]
+            bucket.take(now)
+            self._deliver(channel, self._format(channel, messages, omitted))
+
+    def _format(self, channel, messages, omitted=0):
+        text = "\n".join(messages)
+        if omitted:
+            text += f"\n(+{omitted} thông báo khác)"
+        if self.label_channels and channel is not None:
+            text = f"[{channel}] {text}"
+        if len(text) > MAX_MESSAGE_CHARS:
+            text = text[:MAX_MESSAGE_CHARS - 1] + "…"
+        return text
+
+    def _deliver(self, channel, text):
+        token, chat_id = self.get_credentials()
+        if not token or not chat_id:
+            return
+        delay = self.backoff_sec
+        for attempt in range(self.max_retries + 1):
+            try:
+                self._post(f"{self.base_path}/bot{token}/sendMessage", {"chat_id": chat_id, "text": text})
+                self.sent += 1
+                self._last_sent[channel] = time.monotonic()
+                return
+            except SendError as e:
+                err = e
+                if e.permanent:
+                    break
+                wait = e.retry_after if e.retry_after is not None else delay
+            except (OSError, http.client.HTTPException) as e:
+                err = e
+                self._close()  # kết nối hỏng: mở lại ở lần thử sau
+                wait = delay
+                if "CERTIFICATE_VERIFY_FAILED" in str(e).upper():
+                    print(SSL_HINT)
+                    break
+            # Khi đang dừng thì không chờ backoff: bỏ tin sau lần thử hiện tại
+            if attempt == self.max_retries or self._stop.is_set():
+                break
+            self.retries += 1
+            if self._stop.wait(min(wait, self.max_backoff_sec)):
+                break
+            delay = min(delay * 2, self.max_backoff_sec)
+        self.failed += 1
+        print(f"Gửi Telegram thất bại: {err}")
+
+    def _connection(self):
+        if self._conn is None:
+            if self.scheme == "https":
+                if self._context is None:
+                    self._context = create_ssl_context(self.insecure_skip_verify)
+                self._conn = http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout,
+                                                         context=self._context)
+            else:
+                # http:// chỉ dùng cho máy chủ thử nghiệm cục bộ
+                self._conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self.connections += 1
+        return self._conn
+
+    def _post(self, path, params):
+        body = urlencode(params).encode("utf-8")
+        conn = self._connection()
+        conn.request("POST", path, body=body, headers={
+            "Content-Type": "application/x-www-form-urlencoded",
+            "Connection": "keep-alive",
+        })
+        resp = conn.getresponse()
+        payload = resp.read()  # đọc hết để dùng lại kết nối
+        if resp.getheader("Connection", "").lower() == "close":
+            self._close()
+        if resp.status == 200:
+            return
+        retry_after = None
+        if resp.status == 429:
+            try:
+                retry_after = float(json.loads(payload)["parameters"]["retry_after"])
+            except Exception:
+                retry_after = float(resp.getheader("Retry-After") or self.backoff_sec)
+        raise SendError(f"HTTP {resp.status}: {payload[:200]!r}", retry_after=retry_after,
+                        permanent=400 <= resp.status < 500 and resp.status != 429)
+
+    def _close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
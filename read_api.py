@@ -0,0 +1,286 @@
+import argparse
+import gzip
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import turbidity_db
+from dashboard_data import connect_readonly
+
+# API đọc qua HTTP (JSON) cho mọi bên cần dữ liệu: script, dashboard khác... thay vì tự mở turbidity.db.
+#   GET /api/latest                                   mẫu mới nhất
+#   GET /api/readings?n=50                            n mẫu mới nhất (mới nhất trước)
+#   GET /api/range?start=&end=&status=&source=&limit=&before=  mẫu thô trong [start, end] (epoch ms), phân trang keyset
+#   GET /api/rollups?level=1h&start=&end=&source=&limit=   bảng tổng hợp 1m/1h/1d
+#   GET /api/overview                                 ts đầu/cuối và các trạng thái có dữ liệu
+# Phản hồi được giữ trong bộ đệm cho tới khi DB có commit mới (PRAGMA data_version), kèm ETag
+# theo nội dung: người hỏi lại với If-None-Match nhận 304 không có thân. Nén gzip nếu client chấp nhận.
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+MAX_ROWS = 5000       # giới hạn số dòng mỗi phản hồi
+GZIP_MIN_BYTES = 512  # thân nhỏ hơn không đáng nén
+
+
+class BadRequest(ValueError):
+    pass
+
+
+class Response:
+    """Phản hồi đã mã hóa sẵn: thân JSON, ETag theo nội dung, bản gzip tạo khi cần lần đầu."""
+
+    __slots__ = ("status", "body", "etag", "_gzip")
+
+    def __init__(self, status, payload):
+        self.status = status
+        self.body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.etag = '"' + hashlib.blake2b(self.body, digest_size=8).hexdigest() + '"'
+        self._gzip = None
+
+    def gzip_body(self):
+        if self._gzip is None:
+            self._gzip = gzip.compress(self.body, compresslevel=5)
+        return self._gzip
+
+
+def _int_param(query, name, default=None, lo=None, hi=None):
+    values = query.get(name)
+    if not values or values[0] == "":
+        return default
+    try:
+        value = int(values[0])
+    except ValueError:
+        raise BadRequest(f"{name} phải là số nguyên")
+    if lo is not None and value < lo:
+        raise BadRequest(f"{name} phải >= {lo}")
+    return value if hi is None else min(value, hi)
+
+
+def _reading(row):
+    i, ts, voltage, turbidity, status = row
+    return {"id": i, "ts": ts, "voltage": voltage, "turbidity": turbidity, "status": status}
+
+
+def _accepts_gzip(header):
+    # Theo q-value: "gzip;q=0" là từ chối; "*" áp cho gzip khi gzip không được nêu riêng
+    qvalues = {}
+    for item in (header or "").split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0  # q không hợp lệ: coi như không nhận
+        qvalues[coding] = q
+    for coding in ("gzip", "x-gzip", "*"):
+        if coding in qvalues:
+            return qvalues[coding] > 0
+    return False
+
+
+class ReadApi:
+    """Truy vấn + bộ đệm phản hồi, dùng chung cho mọi luồng của server.
+
+    - Một kết nối SQLite chỉ đọc, truy vấn tuần tự dưới một khóa.
+    - Trước mỗi lần tra bộ đệm đọc PRAGMA data_version (vài µs): đổi nghĩa là đã có commit từ
+      kết nối khác (BatchedDBWriter, compact...) nên xóa toàn bộ bộ đệm.
+    - Nhiều client cùng hỏi một URL ngay sau khi bộ đệm bị xóa chỉ tốn một truy vấn: người đầu
+      tiên nạp trong khóa, những người sau lấy kết quả đã có.
+    """
+
+    ROUTES = ("latest", "readings", "range", "rollups", "overview")
+
+    def __init__(self, db_path=turbidity_db.DEFAULT_DB_PATH, max_entries=256):
+        self.db_path = str(db_path)
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._data_version = None
+        self.queries = 0
+        self.hits = 0
+        self.invalidations = 0
+
+    def get(self, path, query):
+        """Response cho GET `path` (chuỗi query đã parse_qs); lỗi tham số trả về 400."""
+        route = path.rstrip("/").rsplit("/", 1)[-1] if path.startswith("/api/") else None
+        if route not in self.ROUTES:
+            return Response(404, {"error": "không có đường dẫn này", "routes": [f"/api/{r}" for r in self.ROUTES]})
+        key = (route, tuple(sorted((k, tuple(v)) for k, v in query.items())))
+        with self._lock:
+            try:
+                conn = self._connection()
+                version = conn.execute("PRAGMA data_version").fetchone()[0]
+                if version != self._data_version:
+                    if self._cache:
+                        self.invalidations += 1
+                    self._cache.clear()
+                    self._data_version = version
+                response = self._cache.get(key)
+                if response is not None:
+                    self._cache.move_to_end(key)
+                    self.hits += 1
+                    return response
+                self.queries += 1
+                response = Response(200, getattr(self, "_" + route)(conn, query))
+            except BadRequest as e:
+                return Response(400, {"error": str(e)})
+            except sqlite3.Error as e:
+                # DB chưa có / đang bị thay: mở lại ở lần sau, không giữ trong bộ đệm
+                self._close()
+                return Response(503, {"error": f"không đọc được CSDL: {e}"})
+            self._cache[key] = response
+            if len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+            return response
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = connect_readonly(self.db_path)
+            self._data_version = None
+        return self._conn
+
+    def _latest(self, conn, query):
+        rows = turbidity_db.samples_page(conn, limit=1)
+        return {"reading": _reading(rows[0]) if rows else None}
+
+    def _readings(self, conn, query):
+        n = _int_param(query, "n", 50, lo=1, hi=MAX_ROWS)
+        return {"readings": [_reading(row) for row in turbidity_db.samples_page(conn, limit=n)]}
+
+    def _range(self, conn, query):
+        limit = _int_param(query, "limit", 500, lo=1, hi=MAX_ROWS)
+        rows = turbidity_db.samples_page(
+            conn, before=_int_param(query, "before"), limit=limit + 1,
+            start_ms=_int_param(query, "start"), end_ms=_int_param(query, "end"),
+            status=query.get("status"), source=query.get("source", [None])[0],
+        )
+        more = len(rows) > limit
+        rows = rows[:limit]
+        # Trang cũ hơn: gọi lại với before=next_before
+        return {"readings": [_reading(row) for row in rows], "next_before": rows[-1][0] if more else None}
+
+    def _rollups(self, conn, query):
+        level = query.get("level", ["1h"])[0]
+        if level not in turbidity_db.ROLLUP_LEVELS:
+            raise BadRequest(f"level phải là một trong {list(turbidity_db.ROLLUP_LEVELS)}")
+        start, end = _int_param(query, "start"), _int_param(query, "end")
+        rows = turbidity_db.query_rollups(
+            conn, level,
+            start=turbidity_db.ms_to_ts(start) if start is not None else None,
+            end=turbidity_db.ms_to_ts(end) if end is not None else None,
+            source=query.get("source", [None])[0],
+            limit=_int_param(query, "limit", 500, lo=1, hi=MAX_ROWS),
+        )
+        return {"level": level, "buckets": [
+            {"bucket": bucket, "n": n, "turbidity_avg": avg, "turbidity_min": t_min, "turbidity_max": t_max,
+             "voltage_avg": v_avg, "status_counts": counts}
+            for bucket, n, avg, t_min, t_max, v_avg, counts in rows
+        ]}
+
+    def _overview(self, conn, query):
+        first_ms, last_ms, statuses = turbidity_db.samples_overview(conn)
+        return {"first_ms": first_ms, "last_ms": last_ms, "statuses": statuses}
+
+    def stats(self):
+        return {"queries": self.queries, "hits": self.hits, "invalidations": self.invalidations,
+                "cached": len(self._cache)}
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive: client hỏi định kỳ không phải bắt tay TCP lại
+    # Header và thân được gửi bằng hai lần write: không tắt Nagle thì mỗi phản hồi chờ delayed ACK (~40 ms)
+    disable_nagle_algorithm = True
+    api = None  # ReadApi, gán qua make_server()
+    quiet = True
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        response = self.api.get(url.path, parse_qs(url.query))
+        if response.status == 200 and self._not_modified(response.etag):
+            self.send_response(304)
+            self._common_headers(response)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = response.body
+        gzipped = len(body) >= GZIP_MIN_BYTES and _accepts_gzip(self.headers.get("Accept-Encoding"))
+        if gzipped:
+            body = response.gzip_body()
+        self.send_response(response.status)
+        self._common_headers(response)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        if gzipped:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _not_modified(self, etag):
+        tags = self.headers.get("If-None-Match")
+        if not tags:
+            return False
+        return any(tag.strip() in (etag, "W/" + etag, "*") for tag in tags.split(","))
+
+    def _common_headers(self, response):
+        if response.status == 200:
+            self.send_header("ETag", response.etag)
+            # Luôn hỏi lại (rẻ nhờ 304) để không bao giờ thấy dữ liệu cũ hơn DB
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Vary", "Accept-Encoding")
+
+    def log_message(self, format, *args):
+        if not self.quiet:
+            super().log_message(format, *args)
+
+
+def make_server(db_path=turbidity_db.DEFAULT_DB_PATH, host=DEFAULT_HOST, port=DEFAULT_PORT, quiet=True):
+    """ThreadingHTTPServer phục vụ ReadApi (port=0: hệ điều hành chọn cổng trống); gọi serve_forever()."""
+    handler = type("Handler", (ApiHandler,), {"api": ReadApi(db_path), "quiet": quiet})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API đọc dữ liệu độ đục qua HTTP (JSON, ETag, gzip)")
+    parser.add_argument("--db", default=turbidity_db.DEFAULT_DB_PATH)
+    parser.add_argument("--host", default=DEFAULT_HOST, help="0.0.0.0 để cho máy khác trong mạng truy cập")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--verbose", action="store_true", help="in từng request")
+    args = parser.parse_args()
+    server = make_server(args.db, args.host, args.port, quiet=not args.verbose)
+    print(f"Read API: http://{args.host}:{server.server_address[1]}/api/latest")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"Stats: {server.RequestHandlerClass.api.stats()}")
+        server.server_close()
+        server.RequestHandlerClass.api.close()
+
+
+if __name__ == "__main__":
+    main()
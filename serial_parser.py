@@ -0,0 +1,72 @@
+import re
+from array import array
+
+# Định dạng chuẩn của firmware (src/main.cpp): "Vôn:<mV>,Độ đục:<NTU>"
+FAST_PREFIX = "Vôn:"
+FAST_SEPARATOR = ",Độ đục:"
+
+# Đường dự phòng: các mẫu cũ, biên dịch một lần khi nạp module
+_TURB_RE = re.compile(r"TURBIDITY\s*[:=]\s*([-+]?\d*\.?\d+)", re.IGNORECASE)
+_VOLT_RE = re.compile(r"VOLT(?:AGE)?\s*[:=]\s*([-+]?\d*\.?\d+)\s*(mV|v)?", re.IGNORECASE)
+
+
+def _to_millivolts(volt_val, volt_unit):
+    # Logic phát hiện đơn vị (mV hay V)
+    if volt_unit and volt_unit.lower() == 'v':
+        return volt_val * 1000.0
+    if not volt_unit and abs(volt_val) < 100:  # Giả định nếu số quá nhỏ (<100) thì đó là Volt
+        return volt_val * 1000.0
+    return volt_val
+
+
+def parse_serial_line(line):
+    """Trả về (voltage_mV, turbidity); ném ValueError nếu dòng không chứa dữ liệu hợp lệ."""
+    # Đường nhanh: đúng định dạng firmware, chỉ cần partition + float
+    if line.startswith(FAST_PREFIX):
+        volt_text, sep, turb_text = line[len(FAST_PREFIX):].partition(FAST_SEPARATOR)
+        # Chỉ chấp nhận số kết thúc bằng chữ số (float() còn nhận "nan", "inf"...)
+        if sep and volt_text[-1:].isdigit() and turb_text[-1:].isdigit():
+            try:
+                return _to_millivolts(float(volt_text), None), float(turb_text)
+            except ValueError:
+                pass  # ví dụ có đơn vị "V"/"mV" đi kèm: để đường dự phòng xử lý
+    return _parse_fallback(line)
+
+
+def _parse_fallback(line):
+    line = line.replace("Vôn", "VOLTAGE").replace("Độ đục", "TURBIDITY")
+
+    # Chỉ tìm dòng có cả VOLTAGE và TURBIDITY
+    if "VOLTAGE" not in line or "TURBIDITY" not in line:
+        raise ValueError("Dòng không chứa dữ liệu hợp lệ")
+
+    turb_match = _TURB_RE.search(line)
+    if not turb_match: raise ValueError("Không tìm thấy TURBIDITY")
+    turbidity = float(turb_match.group(1))
+
+    volt_match = _VOLT_RE.search(line)
+    if not volt_match: raise ValueError("Không tìm thấy VOLTAGE")
+    voltage_mV = _to_millivolts(float(volt_match.group(1)), volt_match.group(2))
+
+    return float(voltage_mV), float(turbidity)
+
+
+def parse_lines(lines):
+    """Phân tích một lô dòng, trả về (voltages, turbidities, so_dong_loi) dạng cột.
+
+    Hai cột là array('d') nên có thể chuyển sang NumPy không sao chép bằng np.frombuffer.
+    """
+    voltages = array('d')
+    turbidities = array('d')
+    add_v = voltages.append
+    add_t = turbidities.append
+    errors = 0
+    for line in lines:
+        try:
+            v, t = parse_serial_line(line)
+        except ValueError:
+            errors += 1
+            continue
+        add_v(v)
+        add_t(t)
+    return voltages, turbidities, errors
@@ -0,0 +1,81 @@
+from collections import deque
+
+
+class SlidingRegression:
+    """Hồi quy tuyến tính y theo t trên cửa sổ thời gian trượt, cập nhật O(1).
+
+    Giữ các tổng chạy Σt, Σy, Σt², Σty; `add` cộng mẫu mới, `evict` trừ mẫu đã ra
+    khỏi cửa sổ. t được lưu tương đối với một gốc (`_origin`) để t² không mất độ
+    chính xác với timestamp epoch; khi gốc đã cũ thì tính lại tổng từ các mẫu
+    còn lại (hiếm, chi phí khấu hao O(1)) — đồng thời xóa sai số cộng/trừ dồn lại.
+    """
+
+    def __init__(self, window_sec):
+        self.window_sec = window_sec
+        self.samples = deque()
+        self._origin = None
+        self._st = self._sy = self._stt = self._sty = 0.0
+
+    def __len__(self):
+        return len(self.samples)
+
+    def add(self, t, y):
+        if self._origin is None:
+            self._origin = t
+        elif t - self._origin > 4 * self.window_sec:
+            self._rebase(self.samples[0][0] if self.samples else t)
+        self.samples.append((t, y))
+        x = t - self._origin
+        self._st += x
+        self._sy += y
+        self._stt += x * x
+        self._sty += x * y
+        self.evict(t - self.window_sec)
+
+    def evict(self, cutoff):
+        # Bỏ các mẫu có t < cutoff (mẫu đúng bằng cutoff vẫn nằm trong cửa sổ)
+        samples = self.samples
+        while samples and samples[0][0] < cutoff:
+            t, y = samples.popleft()
+            x = t - self._origin
+            self._st -= x
+            self._sy -= y
+            self._stt -= x * x
+            self._sty -= x * y
+        if not samples:
+            self._origin = None
+            self._st = self._sy = self._stt = self._sty = 0.0
+
+    def _rebase(self, origin):
+        self._origin = origin
+        self._st = self._sy = self._stt = self._sty = 0.0
+        for t, y in self.samples:
+            x = t - origin
+            self._st += x
+            self._sy += y
+            self._stt += x * x
+            self._sty += x * y
+
+    def fit(self):
+        """Trả về (slope theo đơn vị y/giây, hàm dự đoán) hoặc None nếu chưa đủ 2 mẫu."""
+        n = len(self.samples)
+        if n < 2:
+            return None
+        mean_x = self._st / n
+        mean_y = self._sy / n
+        den = self._stt - n * mean_x * mean_x
+        if den <= 1e-9:
+            den = 1e-9
+        slope = (self._sty - n * mean_x * mean_y) / den
+        origin = self._origin
+        return slope, (lambda t: mean_y + slope * (t - origin - mean_x))
+
+    def slope(self):
+        fitted = self.fit()
+        return fitted[0] if fitted else None
+
+    def first(self):
+        return self.samples[0]
+
+    def last(self):
+        return self.samples[-1]
@@ -0,0 +1,122 @@
+from bisect import bisect_left, insort
+from collections import deque
+
+# Bộ lọc gai (spike) dạng luồng, đặt giữa parse và phân tích/cảnh báo.
+#   median:   trả về trung vị lăn của `window` mẫu gần nhất
+#   hampel:   giữ mẫu nếu |x - trung vị| <= max(n_sigmas * 1.4826 * MAD, min_threshold),
+#             ngược lại thay bằng trung vị
+#   debounce: chỉ chấp nhận bước nhảy > min_threshold khi nó lặp lại `debounce_samples` mẫu liên tiếp
+#   off:      không lọc
+MODES = ("off", "median", "hampel", "debounce")
+MAD_SCALE = 1.4826  # MAD -> độ lệch chuẩn với phân phối chuẩn
+
+
+class RollingMedian:
+    """Cửa sổ trượt cố định + danh sách đã sắp xếp.
+
+    Thêm/bớt một mẫu: tìm vị trí bằng bisect O(log w) (việc dịch phần tử của list
+    là một memmove tối đa w con trỏ). Trung vị và MAD đọc trực tiếp trên danh sách
+    đã sắp: O(1) và O(log w).
+    """
+
+    def __init__(self, window):
+        if window < 1:
+            raise ValueError("window phải >= 1")
+        self.window = window
+        self._fifo = deque()
+        self._sorted = []
+
+    def __len__(self):
+        return len(self._sorted)
+
+    def add(self, value):
+        if len(self._fifo) == self.window:
+            old = self._fifo.popleft()
+            del self._sorted[bisect_left(self._sorted, old)]
+        self._fifo.append(value)
+        insort(self._sorted, value)
+
+    def median(self):
+        a = self._sorted
+        n = len(a)
+        mid = n // 2
+        return a[mid] if n % 2 else (a[mid - 1] + a[mid]) / 2.0
+
+    def mad(self, center):
+        """Trung vị của |x - center| mà không tạo lại danh sách (chọn phần tử thứ k của hai dãy tăng)."""
+        n = len(self._sorted)
+        if n % 2:
+            return self._kth_abs_dev(center, n // 2)
+        return (self._kth_abs_dev(center, n // 2 - 1) + self._kth_abs_dev(center, n // 2)) / 2.0
+
+    def _kth_abs_dev(self, center, k):
+        a = self._sorted
+        p = bisect_left(a, center)
+        n_left, n_right = p, len(a) - p
+        # Hai dãy tăng: khoảng cách về bên trái (center - a[p-1-i]) và bên phải (a[p+j] - center)
+        lo, hi = max(0, k + 1 - n_right), min(k + 1, n_left)
+        while lo < hi:
+            i = (lo + hi) // 2  # lấy i phần tử bên trái, k+1-i bên phải
+            if center - a[p - 1 - i] < a[p + k - i] - center:
+                lo = i + 1
+            else:
+                hi = i
+        i = lo
+        left = center - a[p - i] if i > 0 else float("-inf")
+        right = a[p + k - i] - center if k - i >= 0 else float("-inf")
+        return max(left, right)
+
+
+class SpikeFilter:
+    """Bộ lọc một kênh, bộ nhớ giới hạn bởi `window`. `update(x)` trả về giá trị đã lọc."""
+
+    def __init__(self, mode="hampel", window=7, n_sigmas=3.0, min_threshold=5.0, debounce_samples=3):
+        if mode not in MODES:
+            raise ValueError(f"mode phải là một trong {MODES}")
+        self.mode = mode
+        self.n_sigmas = n_sigmas
+        self.min_threshold = min_threshold  # NTU; tránh coi dao động nhỏ là gai khi MAD = 0
+        self.debounce_samples = debounce_samples
+        self._median = RollingMedian(window)
+        self._accepted = None
+        self._pending = None
+        self._pending_count = 0
+        self.samples = 0
+        self.replaced = 0
+
+    def update(self, value):
+        self.samples += 1
+        if self.mode == "off":
+            return value
+        if self.mode == "debounce":
+            out = self._debounce(value)
+        else:
+            self._median.add(value)
+            med = self._median.median()
+            if self.mode == "median":
+                out = med
+            else:
+                limit = max(self.n_sigmas * MAD_SCALE * self._median.mad(med), self.min_threshold)
+                out = value if abs(value - med) <= limit else med
+        if out != value:
+            self.replaced += 1
+        return out
+
+    def _debounce(self, value):
+        if self._accepted is None or abs(value - self._accepted) <= self.min_threshold:
+            self._accepted = value
+            self._pending = None
+            return value
+        # Bước nhảy lớn: chỉ chấp nhận khi các mẫu liên tiếp cùng ở mức mới
+        if self._pending is not None and abs(value - self._pending) <= self.min_threshold:
+            self._pending_count += 1
+        else:
+            self._pending = value
+            self._pending_count = 1
+        if self._pending_count >= self.debounce_samples:
+            self._accepted = value
+            self._pending = None
+        return self._accepted
+
+    def stats(self):
+        return {"mode": self.mode, "samples": self.samples, "replaced": self.replaced}
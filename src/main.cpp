@@ -9,6 +9,17 @@
 #define LCD_COLS 16
 #define LCD_ROWS 2
 
+// Giao thức serial: 0 = văn bản "Vôn:...,Độ đục:..." (mặc định, 9600 baud)
+//                   1 = khung nhị phân cố định 16 byte có CRC16 (bật bằng -DBINARY_PROTOCOL=1)
+#ifndef BINARY_PROTOCOL
+#define BINARY_PROTOCOL 0
+#endif
+#if BINARY_PROTOCOL
+#define SERIAL_BAUD 115200
+#else
+#define SERIAL_BAUD 9600
+#endif
+
 // Sensor parameters
 const float U0 = 3600.0; // Reference voltage at 0 NTU (mV)
 const float VCC = 5000.0; // Arduino supply voltage (mV)
@@ -19,18 +30,60 @@ unsigned long lastReading = 0;
 const unsigned long READING_INTERVAL = 1000; // Update every 1 second
 const unsigned long STARTUP_DELAY = 100; // Sensor startup time (ms)
 
+#if BINARY_PROTOCOL
+// Khung nhị phân (little-endian, khớp binary_protocol.py phía PC):
+//   0xAA 0x55 | seq u16 | millis u32 | adc u16 | ntu float32 | crc16 u16
+// CRC16-CCITT (đa thức 0x1021, khởi tạo 0xFFFF) tính trên 12 byte từ seq đến ntu.
+struct __attribute__((packed)) SensorFrame {
+  uint8_t sync[2];
+  uint16_t seq;
+  uint32_t timestampMs;
+  uint16_t rawAdc;
+  float ntu;
+  uint16_t crc;
+};
+
+uint16_t frameSeq = 0;
+
+uint16_t crc16Ccitt(const uint8_t *data, size_t len) {
+  uint16_t crc = 0xFFFF;
+  while (len--) {
+    crc ^= (uint16_t)(*data++) << 8;
+    for (uint8_t i = 0; i < 8; i++) {
+      crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : (crc << 1);
+    }
+  }
+  return crc;
+}
+
+void sendFrame(uint16_t rawAdc, float ntu) {
+  SensorFrame frame;
+  frame.sync[0] = 0xAA;
+  frame.sync[1] = 0x55;
+  frame.seq = frameSeq++;
+  frame.timestampMs = millis();
+  frame.rawAdc = rawAdc;
+  frame.ntu = ntu;
+  frame.crc = crc16Ccitt((const uint8_t *)&frame.seq, sizeof(SensorFrame) - 4);
+  Serial.write((const uint8_t *)&frame, sizeof(SensorFrame));
+}
+#endif
+
 // Initialize I2C LCD
 LiquidCrystal_I2C lcd(LCD_ADDR, LCD_COLS, LCD_ROWS);
 
-// Read average voltage to reduce noise
-float readSensorVoltage(uint16_t samples = 15, uint16_t delayMs = 5) {
+// Read average ADC count to reduce noise
+float readSensorAdc(uint16_t samples = 15, uint16_t delayMs = 5) {
   uint32_t sum = 0;
   for (uint16_t i = 0; i < samples; i++) {
     sum += analogRead(SENSOR_PIN);
     delay(delayMs);
   }
-  float avg = sum / (float)samples;
-  return (avg / ADC_MAX_COUNT) * VCC; // Convert to mV
+  return sum / (float)samples;
+}
+
+float adcToVoltage(float adc) {
+  return (adc / ADC_MAX_COUNT) * VCC; // Convert to mV
 }
 
 // Convert voltage to NTU based on sample code calibration
@@ -54,7 +107,7 @@ void setup() {
   digitalWrite(ALERT_PIN, LOW);
 
   // Initialize Serial
-  Serial.begin(9600);
+  Serial.begin(SERIAL_BAUD);
   
   // Initialize LCD
   lcd.init();
@@ -75,23 +128,32 @@ void loop() {
     char cmd = (char)Serial.read();
     if (cmd == 'A') {
       digitalWrite(ALERT_PIN, HIGH);
+#if !BINARY_PROTOCOL
       Serial.println("ACK:A");
+#endif
     } else if (cmd == 'S') {
       digitalWrite(ALERT_PIN, LOW);
+#if !BINARY_PROTOCOL
       Serial.println("ACK:S");
+#endif
     }
   }
 
   if (millis() - lastReading >= READING_INTERVAL) {
     // Read sensor voltage
-    float voltage = readSensorVoltage(15, 5);
+    float avgAdc = readSensorAdc(15, 5);
+    float voltage = adcToVoltage(avgAdc);
     float ntu = voltageToNTU(voltage);
     
+#if BINARY_PROTOCOL
+    sendFrame((uint16_t)(avgAdc + 0.5), ntu);
+#else
     // Send data to Python GUI (Chỉ gửi 1 dòng này)
     Serial.print("Vôn:");
     Serial.print(voltage, 0); // Send voltage in mV (integer)
     Serial.print(",Độ đục:");
     Serial.println(ntu, 2);
+#endif
     
     // Update LCD
     lcd.clear();
@@ -0,0 +1,39 @@
+import numpy as np
+
+import alert_backtest
+
+PARAMS = alert_backtest.DEFAULT_PARAMS
+
+
+def delivered(skip, normal, **params):
+    p = dict(PARAMS, **params)
+    posts, kept = alert_backtest.telegram_delivered(np.asarray(skip, dtype=float), np.asarray(normal, dtype=float), p)
+    return posts, kept.tolist()
+
+
+def test_messages_within_coalesce_window_share_one_post():
+    # Tin skip lúc 0 mở đợt, gửi lúc 2 s: tin thường lúc 1 s đi cùng; tin lúc 30 s bị cooldown
+    assert delivered([0.0], [1.0, 30.0]) == (1, [0])
+    # Qua cooldown 60 s kể từ lần gửi (2 s) thì tin thường mở đợt mới
+    assert delivered([0.0], [1.0, 30.0, 62.0]) == (2, [0, 2])
+
+
+def test_token_bucket_limits_burst_of_skip_messages():
+    # 10 tin skip cách nhau 3 s: 5 đợt đầu dùng hết burst, sau đó 1 lượt / 3 s (20/phút)
+    skip = np.arange(10) * 3.0
+    posts, _ = delivered(skip, [])
+    assert posts == 10
+    # Dồn dập hơn tốc độ nạp: đợt phải chờ bucket và gộp thêm tin
+    skip = np.arange(60) * 0.5
+    posts, _ = delivered(skip, [])
+    assert posts < 60
+    assert posts <= 5 + (30.0 + 2.0) * 20 / 60 + 1
+
+
+def test_replay_counts_posts_not_alerts():
+    t = np.arange(600, dtype=float)
+    y = np.where(t % 2 == 0, 5.0, 60.0)  # đổi trạng thái mỗi giây
+    result = alert_backtest.replay(t, y, {})
+    assert result["status_changes"] == 600
+    # Gộp đợt 2 s + 20 tin/phút: khoảng 5 + 600 s * 20 / 60 POST, không phải 600
+    assert result["telegram_sent"] <= 5 + 200 + 1
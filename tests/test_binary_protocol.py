@@ -0,0 +1,107 @@
+import binary_protocol
+from binary_protocol import FrameDecoder, encode_frame
+
+
+def frames(seqs, t0=10_000_000):
+    # millis tăng đều theo thứ tự gửi (kể cả khi seq tràn hoặc mất khung); t0 nhỏ = vừa khởi động
+    return b"".join(encode_frame(seq, t0 + i * 1000, 512, float(seq % 1000)) for i, seq in enumerate(seqs))
+
+
+def decoded_seqs(decoder, data, chunk=7):
+    out = []
+    for i in range(0, len(data), chunk):
+        out += [seq for seq, _ts, _adc, _ntu in decoder.feed(data[i:i + chunk])]
+    return out
+
+
+def test_roundtrip_fields():
+    decoder = FrameDecoder()
+    assert decoder.feed(encode_frame(7, 123456, 1023, 12.5)) == [(7, 123456, 1023, 12.5)]
+    assert binary_protocol.adc_to_millivolts(1023) == binary_protocol.VCC_MV
+
+
+def test_seq_wraparound_is_not_a_gap():
+    decoder = FrameDecoder()
+    seqs = [0xFFFD, 0xFFFE, 0xFFFF, 0, 1, 2]
+    assert decoded_seqs(decoder, frames(seqs)) == seqs
+    stats = decoder.stats()
+    assert (stats["dropped"], stats["out_of_order"], stats["restarts"]) == (0, 0, 0)
+
+
+def test_lost_frame_across_wraparound_counts_as_dropped():
+    decoder = FrameDecoder()
+    assert decoded_seqs(decoder, frames([0xFFFE, 0, 1])) == [0xFFFE, 0, 1]
+    assert decoder.dropped == 1
+    assert decoder.restarts == 0
+
+
+def test_sender_restart_resyncs_instead_of_dropping():
+    decoder = FrameDecoder()
+    before = list(range(500, 600))
+    after = list(range(0, 100))
+    assert decoded_seqs(decoder, frames(before) + frames(after, t0=0)) == before + after
+    assert decoder.restarts == 1
+    assert decoder.out_of_order == 0
+    assert decoder.dropped == 0
+
+
+def test_restart_soon_after_start_and_after_forward_gap():
+    # Khởi động lại khi seq còn nhỏ: lùi ít nhưng về đúng 0
+    decoder = FrameDecoder()
+    assert decoded_seqs(decoder, frames([0, 1, 2, 3]) + frames([0, 1], t0=0)) == [0, 1, 2, 3, 0, 1]
+    assert (decoder.restarts, decoder.out_of_order) == (1, 0)
+    # Về 0 từ giữa dải: seq tiến 25536 nhưng millis lùi => khởi động lại, không phải mất khung
+    decoder = FrameDecoder()
+    assert decoded_seqs(decoder, frames([40000]) + frames([0, 1], t0=0)) == [40000, 0, 1]
+    assert (decoder.restarts, decoder.dropped) == (1, 0)
+    # Khởi động lại mà mất vài khung đầu: seq tiến tới 3, millis vẫn lùi
+    decoder = FrameDecoder()
+    assert decoded_seqs(decoder, frames([40000]) + frames([3, 4], t0=0)) == [40000, 3, 4]
+    assert (decoder.restarts, decoder.dropped) == (1, 0)
+
+
+def test_burst_loss_across_wraparound_counts_as_dropped():
+    # Mất 300 khung vắt qua 0xFFFF -> 0, khung đầu tiên nhận lại đúng là seq 0
+    decoder = FrameDecoder()
+    sent = [(0xFFFF - 300 + i) & 0xFFFF for i in range(302)]  # ..., 0xFFFF, 0
+    received = sent[:1] + sent[-1:]
+    data = encode_frame(sent[0], 5_000_000, 512, 1.0) + encode_frame(sent[-1], 5_000_000 + 301 * 1000, 512, 1.0)
+    assert decoded_seqs(decoder, data) == received
+    assert (decoder.dropped, decoder.restarts) == (300, 0)
+
+
+def test_millis_u32_wrap_is_not_a_restart():
+    decoder = FrameDecoder()
+    data = encode_frame(10, 0xFFFFFF00, 512, 1.0) + encode_frame(11, 0x00000100, 512, 1.0)
+    assert decoded_seqs(decoder, data) == [10, 11]
+    assert (decoder.restarts, decoder.dropped) == (0, 0)
+
+
+def test_late_and_duplicate_frames_are_dropped():
+    decoder = FrameDecoder()
+    assert decoded_seqs(decoder, frames([10, 12, 11, 12, 13])) == [10, 12, 13]
+    assert decoder.out_of_order == 2
+    assert decoder.dropped == 1
+    assert decoder.restarts == 0
+
+
+def test_crc_error_rejects_frame_and_resyncs():
+    good = frames([1, 2, 3])
+    damaged = bytearray(good)
+    damaged[binary_protocol.FRAME_SIZE + 8] ^= 0xFF  # hỏng một byte dữ liệu của khung seq 2
+    decoder = FrameDecoder()
+    assert decoded_seqs(decoder, b"ACK:A\r\n" + bytes(damaged)) == [1, 3]
+    assert decoder.crc_errors == 1
+    assert decoder.dropped == 1
+    assert decoder.stats()["buffered"] == 0
+
+
+def test_reset_forgets_partial_frame_and_seq():
+    decoder = FrameDecoder()
+    data = frames([100, 101])
+    decoder.feed(data[:binary_protocol.FRAME_SIZE + 5])
+    decoder.reset()
+    assert decoder.stats()["buffered"] == 0
+    assert decoded_seqs(decoder, frames([1, 2])) == [1, 2]
+    assert decoder.out_of_order == 0 and decoder.restarts == 0
+    assert decoder.frames == 3
@@ -0,0 +1,114 @@
+import json
+import os
+
+import pytest
+
+import columnar_archive
+import turbidity_db
+from dashboard_data import DashboardData
+
+DAY = "2025-10-10"
+
+
+@pytest.fixture
+def sealed(tmp_path):
+    """Một ngày có hai thiết bị xen kẽ, đã niêm phong rồi xóa khỏi DB (như sau compact())."""
+    db_path = str(tmp_path / "turbidity.db")
+    archive_dir = str(tmp_path / "archive")
+    turbidity_db.init_db(db_path)
+    day_ms = columnar_archive.day_start_ms(DAY)
+    rows = []
+    for i in range(100):
+        source = "be_loc" if i % 2 else "be_chua"
+        status = "Nước đục" if i % 10 == 0 else "Nước trong"
+        rows.append((None, 3600.0, float(i), status, source, day_ms + i * 60_000))
+    conn = turbidity_db.connect(db_path)
+    turbidity_db.insert_rows(conn, rows)
+    conn.commit()
+    assert columnar_archive.seal_day(DAY, db_path, archive_dir) == 100
+    conn.execute("DELETE FROM samples")
+    # Một mẫu mới hơn để ngày đã niêm phong nằm trước dữ liệu thô
+    turbidity_db.insert_rows(conn, [(None, 3600.0, 1.0, "Nước trong", "be_loc", day_ms + 2 * 86_400_000)])
+    conn.commit()
+    conn.close()
+    return db_path, archive_dir, day_ms
+
+
+def test_seal_day_stores_source_column(sealed):
+    _db_path, archive_dir, day_ms = sealed
+    meta = columnar_archive.read_meta(DAY, archive_dir)
+    assert sorted(meta["sources"]) == ["be_chua", "be_loc"]
+    cols = columnar_archive.open_day(DAY, archive_dir)
+    names = [meta["sources"][code] for code in cols["source"].tolist()]
+    assert names == ["be_loc" if i % 2 else "be_chua" for i in range(100)]
+
+
+def test_readers_filter_by_source(sealed):
+    _db_path, archive_dir, day_ms = sealed
+    end_ms = day_ms + 86_400_000 - 1
+    cols = columnar_archive.read_range(day_ms, end_ms, archive_dir, source="be_loc")
+    assert cols["turbidity"].tolist() == [float(i) for i in range(1, 100, 2)]
+    assert len(columnar_archive.read_range(day_ms, end_ms, archive_dir)["ts"]) == 100
+    assert len(columnar_archive.read_range(day_ms, end_ms, archive_dir, source="khac")["ts"]) == 0
+
+    page = columnar_archive.page_before(end_ms, day_ms, 5, archive_dir=archive_dir, source="be_chua")
+    assert page["turbidity"].tolist() == [98.0, 96.0, 94.0, 92.0, 90.0]
+    code = turbidity_db.STATUS_CODES["Nước đục"]
+    page = columnar_archive.page_before(end_ms, day_ms, 100, [code], archive_dir=archive_dir, source="be_chua")
+    assert page["turbidity"].tolist() == [90.0, 80.0, 70.0, 60.0, 50.0, 40.0, 30.0, 20.0, 10.0, 0.0]
+    assert columnar_archive.count_range(day_ms, end_ms, [code], archive_dir=archive_dir, source="be_loc") == 0
+    assert columnar_archive.count_range(day_ms, end_ms, archive_dir=archive_dir, source="be_loc") == 50
+
+
+def test_legacy_day_without_source_column(sealed):
+    # Ngày niêm phong trước khi có cột nguồn: không có source.u16 và "sources"
+    _db_path, archive_dir, day_ms = sealed
+    day_dir = os.path.join(archive_dir, DAY)
+    os.remove(os.path.join(day_dir, "source.u16"))
+    meta = columnar_archive.read_meta(DAY, archive_dir)
+    del meta["sources"]
+    with open(os.path.join(day_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    end_ms = day_ms + 86_400_000 - 1
+    assert len(columnar_archive.read_range(day_ms, end_ms, archive_dir)["ts"]) == 100
+    # Không biết dòng nào của thiết bị nào: lọc theo thiết bị bỏ qua ngày này thay vì trộn lẫn
+    assert columnar_archive.count_range(day_ms, end_ms, archive_dir=archive_dir, source="be_loc") == 0
+
+
+def test_dashboard_history_filters_archive_by_source(sealed):
+    db_path, archive_dir, day_ms = sealed
+    data = DashboardData(db_path, archive_dir=archive_dir)
+    try:
+        end_ms = day_ms + 86_400_000 - 1
+        df, cursor = data.history_page(("raw", None), day_ms, end_ms, limit=20, source="be_loc")
+        assert df["turbidity"].tolist() == [float(i) for i in range(99, 59, -2)]
+        assert cursor is not None
+        assert data.history_count(day_ms, end_ms, source="be_loc") == 50
+        assert data.history_count(day_ms, end_ms) == 100
+    finally:
+        data.close()
+
+
+def test_seal_day_keeps_raw_turbidity(tmp_path):
+    db_path = str(tmp_path / "turbidity.db")
+    archive_dir = str(tmp_path / "archive")
+    turbidity_db.init_db(db_path)
+    day_ms = columnar_archive.day_start_ms(DAY)
+    conn = turbidity_db.connect(db_path)
+    # Mẫu 1 bị bộ lọc gai hạ từ 80 xuống 5; mẫu 2 không qua bộ lọc (raw NULL)
+    turbidity_db.insert_rows(conn, [
+        (None, 3600.0, 5.0, "Nước trong", "be_loc", day_ms, 5.0),
+        (None, 3600.0, 5.0, "Nước trong", "be_loc", day_ms + 1000, 80.0),
+        (None, 3600.0, 6.0, "Nước trong", "be_loc", day_ms + 2000),
+    ])
+    conn.commit()
+    conn.close()
+    assert columnar_archive.seal_day(DAY, db_path, archive_dir) == 3
+    cols = columnar_archive.read_range(day_ms, day_ms + 86_400_000 - 1, archive_dir)
+    assert cols["turbidity"].tolist() == [5.0, 5.0, 6.0]
+    assert cols["raw_turbidity"].tolist() == [5.0, 80.0, 6.0]
+
+    # Ngày niêm phong trước khi có cột: đọc bằng turbidity
+    os.remove(os.path.join(archive_dir, DAY, "raw_turbidity.f32"))
+    cols = columnar_archive.open_day(DAY, archive_dir)
+    assert cols["raw_turbidity"].tolist() == [5.0, 5.0, 6.0]
@@ -0,0 +1,46 @@
+import numpy as np
+
+from ingest_pipeline import SensorAnalytics
+
+T0 = 1_700_000_000.0
+
+
+def feed(analytics, values):
+    """Một mẫu/giây; trả về kết quả process() của mẫu cuối."""
+    for i, y in enumerate(values):
+        result = analytics.process(T0 + i, 3600.0, float(y))
+    return result
+
+
+def trend_alerts(result):
+    return [e for e in result["events"] if e[0] == "notify" and "Độ đục đang tăng nhanh" in e[1]]
+
+
+def endpoint_slope(values):
+    # Cách tính cũ: chỉ dùng điểm đầu và điểm cuối cửa sổ (NTU/phút)
+    return (values[-1] - values[0]) / (len(values) - 1) * 60.0
+
+
+def regression_slope(values):
+    return np.polyfit(np.arange(len(values)), values, 1)[0] * 60.0
+
+
+def test_trend_ignores_single_spike_at_window_end():
+    values = [5.0] * 59 + [45.0]
+    assert endpoint_slope(values) >= 30.0  # cách cũ sẽ cảnh báo
+    assert regression_slope(values) < 30.0
+    analytics = SensorAnalytics()
+    result = feed(analytics, values)
+    assert not analytics.is_trend_rising(T0 + 59)
+    assert trend_alerts(result) == []
+
+
+def test_trend_detects_ramp_despite_outlier_at_window_start():
+    values = [100.0] + [float(i) for i in range(1, 60)]  # tăng 60 NTU/phút, mẫu đầu là gai
+    assert endpoint_slope(values) < 30.0  # cách cũ sẽ bỏ sót
+    assert regression_slope(values) >= 30.0
+    analytics = SensorAnalytics()
+    result = feed(analytics, values)
+    assert analytics.is_trend_rising(T0 + 59)
+    assert len(trend_alerts(result)) == 1
+    assert abs(analytics.trend_regression.slope() * 60.0 - regression_slope(values)) < 1e-6
@@ -0,0 +1,83 @@
+import threading
+
+import pytest
+import serial
+
+import binary_protocol
+import multi_sensor
+
+
+class FakePort:
+    """Cổng serial giả: mỗi lần mở phát lại khung từ seq 0 (như Arduino vừa reset) rồi báo mất kết nối."""
+
+    opened = []
+    frames_per_open = 100
+    max_opens = 2
+
+    def __init__(self, port, baudrate, timeout, write_timeout):
+        if len(FakePort.opened) >= FakePort.max_opens:
+            raise serial.SerialException("không có thiết bị")
+        FakePort.opened.append(port)
+        data = b"".join(binary_protocol.encode_frame(seq, seq * 100, 512, float(seq))
+                        for seq in range(FakePort.frames_per_open))
+        # Cắt thành mảnh lẻ để có khung nằm vắt qua hai lần read()
+        self._chunks = [data[i:i + 37] for i in range(0, len(data), 37)]
+        self.is_open = True
+        self.timeout = timeout
+        self._cancel = threading.Event()
+
+    @property
+    def in_waiting(self):
+        return len(self._chunks[0]) if self._chunks else 0
+
+    def read(self, size):
+        if self._chunks:
+            return self._chunks.pop(0)
+        raise serial.SerialException("thiết bị đã rút")
+
+    def cancel_read(self):
+        self._cancel.set()
+
+    def reset_input_buffer(self):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+
+@pytest.fixture
+def fake_serial(monkeypatch):
+    FakePort.opened = []
+    monkeypatch.setattr(multi_sensor.serial, "Serial", FakePort)
+    monkeypatch.setattr(multi_sensor, "ARDUINO_RESET_SEC", 0.0)
+    monkeypatch.setattr(multi_sensor, "RECONNECT_MIN_SEC", 0.01)
+    return FakePort
+
+
+def test_reconnect_resets_frame_sequence(fake_serial):
+    readings = []
+    states = []
+    done = threading.Event()
+    expected = fake_serial.frames_per_open * fake_serial.max_opens
+
+    def on_reading(device_id, voltage_mv, ntu):
+        readings.append(ntu)
+        if len(readings) == expected:
+            done.set()
+
+    reader = multi_sensor.SensorReader(
+        "be_loc", "/dev/fake", "binary", on_line=None, on_reading=on_reading,
+        on_status=lambda device_id, state, detail: states.append(state),
+    ).start()
+    assert done.wait(5.0)
+    reader.request_stop()
+    reader.join()
+
+    # Khung sau khi mở lại (seq bắt đầu lại từ 0) không bị coi là lùi seq
+    assert readings == [float(seq) for seq in range(fake_serial.frames_per_open)] * 2
+    stats = reader.stats()
+    assert stats["frames"]["out_of_order"] == 0
+    assert stats["frames"]["crc_errors"] == 0
+    assert stats["reconnects"] >= 2
+    assert states.count("connected") == 2
+    assert "lost" in states and states[-1] == "closed"
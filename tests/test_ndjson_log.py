@@ -0,0 +1,34 @@
+import json
+import sqlite3
+
+import ndjson_log
+import turbidity_db
+
+
+def write_json_log(path, n):
+    records = [{"timestamp": f"2025-10-10 08:{i // 60:02d}:{i % 60:02d}", "voltage": 3600.0,
+                "turbidity": float(i), "status": "Nước trong", "source": "Arduino Uno"} for i in range(n)]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(records, f, ensure_ascii=False)
+
+
+def counts(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return (conn.execute("SELECT COUNT(*) FROM samples").fetchone()[0],
+                conn.execute("SELECT SUM(n) FROM readings_1d").fetchone()[0])
+    finally:
+        conn.close()
+
+
+def test_migrate_json_to_db_runs_once(tmp_path):
+    json_path, db_path = str(tmp_path / "turbidity_log.json"), str(tmp_path / "turbidity.db")
+    write_json_log(json_path, 13)
+    assert ndjson_log.migrate_json_to_db(json_path, db_path, batch_size=5) == 13
+    assert ndjson_log.migrate_json_to_db(json_path, db_path, batch_size=5) == 0
+    assert counts(db_path) == (13, 13)
+
+    # File có thêm bản ghi (hoặc lần trước bị ngắt): chỉ nạp phần còn thiếu
+    write_json_log(json_path, 20)
+    assert ndjson_log.migrate_json_to_db(json_path, db_path, batch_size=5) == 7
+    assert counts(db_path) == (20, 20)
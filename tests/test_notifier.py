@@ -0,0 +1,106 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import pytest
+
+from notifier import NotificationDispatcher
+
+
+class FakeTelegram(BaseHTTPRequestHandler):
+    """Bot API giả: trả lần lượt các phản hồi trong `responses` (hết thì 200), ghi lại từng POST."""
+
+    protocol_version = "HTTP/1.1"  # keep-alive như api.telegram.org
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"])).decode("utf-8")
+        server = self.server
+        with server.lock:
+            server.requests.append((self.path, parse_qs(body)))
+            status, payload = server.responses.pop(0) if server.responses else (200, {"ok": True})
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def telegram():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeTelegram)
+    server.lock = threading.Lock()
+    server.requests = []
+    server.responses = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_dispatcher(server, **kwargs):
+    options = dict(coalesce_sec=0.2, cooldown_sec=0, backoff_sec=0.05, max_backoff_sec=0.2)
+    options.update(kwargs)
+    return NotificationDispatcher(lambda: ("TOKEN", "42"), api_url=f"http://127.0.0.1:{server.server_port}",
+                                  **options).start()
+
+
+def test_coalesces_messages_on_one_channel(telegram):
+    dispatcher = make_dispatcher(telegram, coalesce_sec=0.5)
+    for message in ("Nước đục", "Tăng nhanh", "Nước đục"):
+        assert dispatcher.submit(message, channel="be_loc", skip_cooldown=True)
+    dispatcher.submit("Nước trong", channel="be_chua", skip_cooldown=True)
+    dispatcher.stop()
+
+    assert len(telegram.requests) == 2
+    texts = sorted(params["text"][0] for _path, params in telegram.requests)
+    assert texts == ["Nước trong", "Nước đục\nTăng nhanh"]
+    path, params = telegram.requests[0]
+    assert path == "/botTOKEN/sendMessage" and params["chat_id"] == ["42"]
+    stats = dispatcher.stats()
+    assert (stats["sent"], stats["coalesced"], stats["failed"]) == (2, 2, 0)
+    assert stats["connections"] == 1  # một kết nối keep-alive cho cả hai POST
+
+
+def test_retries_after_429_retry_after(telegram):
+    telegram.responses = [(429, {"ok": False, "parameters": {"retry_after": 0.1}})] * 2
+    dispatcher = make_dispatcher(telegram)
+    dispatcher.submit("Nước rất đục", skip_cooldown=True)
+    for _ in range(100):
+        if dispatcher.sent:
+            break
+        threading.Event().wait(0.05)
+    dispatcher.stop()
+
+    assert len(telegram.requests) == 3
+    stats = dispatcher.stats()
+    assert (stats["sent"], stats["retries"], stats["failed"]) == (1, 2, 0)
+
+
+def test_permanent_4xx_is_not_retried(telegram):
+    telegram.responses = [(400, {"ok": False, "description": "Bad Request: chat not found"})]
+    dispatcher = make_dispatcher(telegram)
+    dispatcher.submit("Nước đục", skip_cooldown=True)
+    dispatcher.stop()
+
+    assert len(telegram.requests) == 1
+    stats = dispatcher.stats()
+    assert (stats["sent"], stats["retries"], stats["failed"]) == (0, 0, 1)
+
+
+def test_cooldown_suppresses_normal_messages_after_send(telegram):
+    dispatcher = make_dispatcher(telegram, coalesce_sec=0.05, cooldown_sec=60)
+    dispatcher.submit("Xu hướng tăng")
+    for _ in range(100):
+        if dispatcher.sent:
+            break
+        threading.Event().wait(0.05)
+    assert not dispatcher.submit("Xu hướng tăng")
+    assert dispatcher.submit("Nước đục", skip_cooldown=True)
+    dispatcher.stop()
+    assert dispatcher.stats()["suppressed"] == 1
+    assert len(telegram.requests) == 2
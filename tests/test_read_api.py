@@ -0,0 +1,70 @@
+import gzip
+import http.client
+import json
+import threading
+
+import pytest
+
+import read_api
+import turbidity_db
+
+T0_MS = 1_700_000_000_000
+
+
+@pytest.fixture
+def server(tmp_path):
+    db_path = str(tmp_path / "turbidity.db")
+    turbidity_db.init_db(db_path)
+    conn = turbidity_db.connect(db_path)
+    turbidity_db.insert_rows(conn, [(None, 3600.0, float(i), "Nước trong", "be_loc", T0_MS + i * 1000)
+                                    for i in range(100)])
+    conn.commit()
+    conn.close()
+    server = read_api.make_server(db_path, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    server.RequestHandlerClass.api.close()
+
+
+def get(server, path, accept_encoding=None):
+    conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=5)
+    try:
+        headers = {"Accept-Encoding": accept_encoding} if accept_encoding is not None else {}
+        conn.request("GET", path, headers=headers)
+        resp = conn.getresponse()
+        return resp, resp.read()
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip", True),
+    ("gzip, deflate, br", True),
+    ("GZIP;q=0.5", True),
+    ("x-gzip", True),
+    ("*", True),
+    ("gzip;q=0", False),
+    ("gzip; q=0.000", False),
+    ("br, gzip;q=0, *;q=1", False),
+    ("*;q=0", False),
+    ("br;q=1, *;q=0.1", True),
+    ("identity", False),
+    ("gzip;q=abc", False),
+    ("", False),
+    (None, False),
+])
+def test_accepts_gzip_honours_qvalues(header, expected):
+    assert read_api._accepts_gzip(header) is expected
+
+
+def test_gzip_only_when_accepted(server):
+    resp, body = get(server, "/api/readings?n=100", "gzip")
+    assert resp.getheader("Content-Encoding") == "gzip"
+    assert len(json.loads(gzip.decompress(body))["readings"]) == 100
+
+    resp, body = get(server, "/api/readings?n=100", "gzip;q=0, identity")
+    assert resp.getheader("Content-Encoding") is None
+    assert len(json.loads(body)["readings"]) == 100
+    assert resp.getheader("Vary") == "Accept-Encoding"
@@ -0,0 +1,227 @@
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+import turbidity_db
+
+T0_MS = 1_700_000_000_000
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "turbidity.db")
+    turbidity_db.init_db(path)
+    return path
+
+
+@pytest.fixture
+def short_busy_timeout(monkeypatch):
+    # busy_timeout mặc định 5 s: rút ngắn để lỗi "database is locked" đến nhanh
+    connect = turbidity_db.connect
+    monkeypatch.setattr(turbidity_db, "connect", lambda db_path, timeout=5.0: connect(db_path, timeout=0.05))
+
+
+def count_samples(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM samples").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def hold_write_lock(db_path, seconds):
+    conn = sqlite3.connect(db_path, isolation_level=None, check_same_thread=False)
+    conn.execute("BEGIN IMMEDIATE")
+    released = threading.Event()
+
+    def release():
+        time.sleep(seconds)
+        conn.execute("ROLLBACK")
+        conn.close()
+        released.set()
+
+    threading.Thread(target=release, daemon=True).start()
+    return released
+
+
+def write_rows(writer, n, start=0):
+    for i in range(start, start + n):
+        writer.write(T0_MS + i * 1000, 3600.0, 5.0 + i, "Nước trong", "Arduino Uno")
+
+
+def test_writer_retries_locked_database(db_path, short_busy_timeout):
+    released = hold_write_lock(db_path, 0.6)
+    writer = turbidity_db.BatchedDBWriter(db_path, batch_size=10, flush_interval=0.05).start()
+    write_rows(writer, 25)
+    assert released.wait(5.0)
+    writer.close()
+    stats = writer.stats()
+    assert stats["retries"] >= 1
+    assert (stats["dropped"], stats["errors"]) == (0, 0)
+    assert stats["rows_written"] == 25
+    assert count_samples(db_path) == 25
+
+
+def test_writer_drops_batch_on_permanent_error(db_path):
+    flushed = []
+    writer = turbidity_db.BatchedDBWriter(db_path, batch_size=1, flush_interval=0.05,
+                                          on_flush=flushed.extend).start()
+    writer.write(None, 3600.0, 5.0, "Nước trong", "Arduino Uno")  # ts hỏng: không ghi lại được
+    time.sleep(0.3)
+    write_rows(writer, 3)
+    writer.close()
+    stats = writer.stats()
+    assert (stats["dropped"], stats["errors"], stats["retries"]) == (1, 1, 0)
+    assert stats["rows_written"] == 3 == len(flushed)
+    assert count_samples(db_path) == 3
+
+
+def test_writer_gives_up_when_close_times_out(db_path, short_busy_timeout):
+    released = hold_write_lock(db_path, 3.0)
+    writer = turbidity_db.BatchedDBWriter(db_path, batch_size=100, flush_interval=0.05).start()
+    write_rows(writer, 5)
+    time.sleep(0.2)
+    writer.close(timeout=1.0)
+    stats = writer.stats()
+    assert stats["rows_written"] == 0
+    assert stats["dropped"] == 5
+    released.wait(5.0)
+
+
+def make_v1_db(path, rows):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE readings (id INTEGER PRIMARY KEY AUTOINCREMENT, ts TEXT NOT NULL, "
+                 "voltage REAL, turbidity REAL, status TEXT, source TEXT)")
+    conn.executemany("INSERT INTO readings (ts, voltage, turbidity, status, source) VALUES (?, ?, ?, ?, ?)", rows)
+    conn.commit()
+    conn.close()
+
+
+def test_migrate_to_v2_quarantines_bad_timestamps(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    good = [(turbidity_db.ms_to_ts(T0_MS + i * 1000), 3600.0, float(i), "Nước trong", "Arduino Uno")
+            for i in range(10)]
+    bad = [("", 3600.0, 99.0, "Nước trong", "Arduino Uno"),
+           ("10/10/2025 08:00", 3600.0, 98.0, "Nước đục", "Arduino Uno")]
+    make_v1_db(path, good[:5] + bad + good[5:])
+
+    moved, bad_ts = turbidity_db.migrate_to_v2(path, chunk_size=4, pause=0)
+    assert (moved, bad_ts) == (10, 2)
+
+    conn = turbidity_db.connect(path)
+    try:
+        assert turbidity_db.v2_ready(conn)
+        rows = conn.execute("SELECT id, ts_ms, turbidity FROM samples ORDER BY id").fetchall()
+        assert [r[2] for r in rows] == [float(i) for i in range(10)]
+        assert [r[1] for r in rows] == [T0_MS + i * 1000 for i in range(10)]
+        # Giữ nguyên id cũ, kể cả khi có khoảng trống do dòng hỏng bị cất riêng
+        assert [r[0] for r in rows] == [1, 2, 3, 4, 5, 8, 9, 10, 11, 12]
+        quarantined = conn.execute(
+            f"SELECT id, ts, turbidity FROM {turbidity_db.BAD_TS_TABLE} ORDER BY id").fetchall()
+        assert quarantined == [(6, "", 99.0), (7, "10/10/2025 08:00", 98.0)]
+
+        # Ghi kiểu cũ qua VIEW readings: ts hỏng không làm lỗi câu lệnh, dòng hợp lệ vẫn vào samples
+        conn.execute("INSERT INTO readings (ts, voltage, turbidity, status, source) VALUES (?, ?, ?, ?, ?)",
+                     ("không phải thời gian", 3600.0, 1.0, "Nước trong", "Arduino Uno"))
+        conn.execute("INSERT INTO readings (ts, voltage, turbidity, status, source) VALUES (?, ?, ?, ?, ?)",
+                     (turbidity_db.ms_to_ts(T0_MS + 60_000), 3600.0, 2.0, "Nước trong", "Arduino Uno"))
+        conn.commit()
+        assert conn.execute("SELECT COUNT(*) FROM samples").fetchone()[0] == 11
+        assert conn.execute(f"SELECT COUNT(*) FROM {turbidity_db.BAD_TS_TABLE}").fetchone()[0] == 3
+    finally:
+        conn.close()
+
+
+def rollup_days(db_path):
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT bucket, n FROM readings_1d ORDER BY bucket").fetchall()
+    finally:
+        conn.close()
+
+
+def insert_raw(db_path, first_ms, n):
+    # Ghi dòng thô không qua luồng ghi (như CSDL cũ, trước khi có bảng tổng hợp)
+    conn = turbidity_db.connect(db_path)
+    turbidity_db.insert_rows(conn, [(None, 3600.0, 5.0, "Nước trong", "Arduino Uno", first_ms + i * 1000)
+                                    for i in range(n)])
+    conn.commit()
+    conn.close()
+
+
+def test_compact_backfills_rows_written_before_rollups(tmp_path):
+    path = str(tmp_path / "upgraded.db")
+    now = datetime(2025, 10, 10, 12, 0, 0)
+    old_ms = int((now - timedelta(days=30)).timestamp() * 1000)
+    turbidity_db.init_db(path)
+    conn = turbidity_db.connect(path)
+    conn.execute(f"DROP TABLE {turbidity_db.META_TABLE}")  # CSDL từ trước khi có mốc
+    conn.commit()
+    conn.close()
+    insert_raw(path, old_ms, 100)
+
+    # Nâng cấp: mốc đặt sau dòng cũ; luồng ghi mới tổng hợp dòng mới nên bảng 1d không còn trống
+    turbidity_db.init_db(path)
+    writer = turbidity_db.BatchedDBWriter(path, flush_interval=0.05).start()
+    for i in range(10):
+        writer.write(int(now.timestamp() * 1000) + i * 1000, 3600.0, 5.0, "Nước trong", "Arduino Uno")
+    writer.close()
+    assert rollup_days(path) == [("2025-10-10 00:00:00", 10)]
+
+    deleted = turbidity_db.compact(path, now=now)
+    assert deleted["raw"] == 100
+    assert count_samples(path) == 10
+    assert rollup_days(path) == [("2025-09-10 00:00:00", 100), ("2025-10-10 00:00:00", 10)]
+    # Chạy lại không cộng trùng
+    turbidity_db.compact(path, now=now)
+    assert rollup_days(path) == [("2025-09-10 00:00:00", 100), ("2025-10-10 00:00:00", 10)]
+
+
+def test_compact_recomputes_rollups_when_floor_is_unknown(db_path):
+    now = datetime(2025, 10, 10, 12, 0, 0)
+    old_ms = int((now - timedelta(days=30)).timestamp() * 1000)
+    insert_raw(db_path, old_ms, 100)
+    writer = turbidity_db.BatchedDBWriter(db_path, flush_interval=0.05).start()
+    for i in range(10):
+        writer.write(int(now.timestamp() * 1000) + i * 1000, 3600.0, 5.0, "Nước trong", "Arduino Uno")
+    writer.close()
+    conn = turbidity_db.connect(db_path)
+    conn.execute(f"DELETE FROM {turbidity_db.META_TABLE}")  # đã có tổng hợp nhưng không biết tới id nào
+    conn.commit()
+    conn.close()
+
+    turbidity_db.compact(db_path, now=now)
+    assert sum(n for _bucket, n in rollup_days(db_path)) == 110
+    assert count_samples(db_path) == 10
+
+
+def test_writer_does_not_retry_permanent_operational_error(db_path):
+    conn = sqlite3.connect(db_path)
+    conn.execute("ALTER TABLE samples RENAME TO samples_old")  # "no such table: samples"
+    conn.commit()
+    conn.close()
+    writer = turbidity_db.BatchedDBWriter(db_path, batch_size=5, flush_interval=0.05).start()
+    write_rows(writer, 5)
+    time.sleep(0.3)
+    writer.close()
+    stats = writer.stats()
+    assert (stats["retries"], stats["errors"], stats["dropped"]) == (0, 1, 5)
+
+
+def test_writer_gives_up_after_max_retries(db_path, short_busy_timeout, monkeypatch):
+    monkeypatch.setattr(turbidity_db.BatchedDBWriter, "MAX_RETRIES", 2)
+    monkeypatch.setattr(turbidity_db.BatchedDBWriter, "RETRY_MAX_SEC", 0.1)
+    released = hold_write_lock(db_path, 1.5)
+    writer = turbidity_db.BatchedDBWriter(db_path, batch_size=5, flush_interval=0.05).start()
+    write_rows(writer, 5)
+    time.sleep(1.0)
+    stats = writer.stats()
+    assert (stats["retries"], stats["errors"], stats["dropped"]) == (2, 1, 5)
+    assert released.wait(5.0)
+    # Lô sau vẫn ghi bình thường khi khóa đã nhả
+    write_rows(writer, 3, start=5)
+    writer.close()
+    assert count_samples(db_path) == 3
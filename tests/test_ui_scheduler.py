@@ -0,0 +1,15 @@
+from ui_scheduler import CoalescingScheduler
+
+
+def test_drain_keeps_only_latest_snapshot_per_key():
+    scheduler = CoalescingScheduler()
+    for i in range(2000):
+        scheduler.push("be_loc", {"ts": float(i), "turbidity": float(i % 100)})
+    scheduler.push("be_chua", {"ts": 0.0, "turbidity": 42.0})
+
+    drained = scheduler.drain()
+    assert drained["be_loc"]["ts"] == 1999.0
+    assert drained["be_chua"]["turbidity"] == 42.0
+    assert scheduler.drain() == {}
+    # merged: snapshot bị thay trước khi kịp vẽ (điểm biểu đồ không đi qua bộ gộp nên không mất)
+    assert scheduler.stats() == {"pushed": 2001, "drained": 2, "merged": 1999, "pending": 0}
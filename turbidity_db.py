@@ -0,0 +1,1072 @@
+import argparse
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+# Đường dẫn CSDL mặc định (cùng thư mục với các script)
+DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "turbidity.db")
+
+# Bảng tổng hợp: mức -> (tên bảng, số ký tự tiền tố của ts "YYYY-MM-DD HH:MM:SS")
+ROLLUP_LEVELS = {
+    "1m": ("readings_1m", 16),
+    "1h": ("readings_1h", 13),
+    "1d": ("readings_1d", 10),
+}
+BUCKET_TEMPLATE = "0000-01-01 00:00:00"
+TS_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Schema v2: ts là epoch mili-giây (INTEGER), trạng thái/nguồn là khóa ngoại tới bảng tra cứu.
+# `readings` trở thành VIEW tương thích để các truy vấn cũ vẫn chạy.
+SCHEMA_VERSION = 2
+LEGACY_TABLE = "readings_v1"
+# Dòng kiểu cũ có ts rỗng/sai định dạng (không đổi được sang epoch ms) được cất riêng ở đây thay vì
+# làm hỏng cả lô chuyển đổi (ts_ms NOT NULL)
+BAD_TS_TABLE = "readings_bad_ts"
+# Biểu thức SQL cho epoch ms từ chuỗi ts giờ địa phương; NULL khi ts không hợp lệ
+TS_MS_SQL = "CAST(strftime('%s', {ts}, 'utc') AS INTEGER) * 1000"
+
+# Bảng khóa/giá trị cho trạng thái bảo trì. ROLLUP_FLOOR_KEY: mọi dòng thô có id >= giá trị này đã
+# được cộng vào bảng tổng hợp (luồng ghi cộng dồn dòng mới); dòng có id nhỏ hơn cần backfill
+# trước khi compact() được xóa. Thiếu khóa = không biết => compact() tính lại toàn bộ.
+META_TABLE = "meta"
+ROLLUP_FLOOR_KEY = "rollup_floor"
+
+# Chính sách lưu giữ theo số ngày (None = giữ mãi mãi)
+RETENTION_POLICY = {
+    "raw": 7,      # dữ liệu thô 1 Hz
+    "1m": 90,      # tổng hợp theo phút
+    "1h": None,    # tổng hợp theo giờ
+    "1d": None,    # tổng hợp theo ngày
+}
+
+# Đếm số mẫu theo trạng thái trong mỗi bucket (các trạng thái của get_water_status_bootstyle)
+STATUS_COLUMNS = {
+    "Nước cất": "n_cat",
+    "Nước trong": "n_trong",
+    "Nước hơi đục": "n_hoi_duc",
+    "Nước đục": "n_duc",
+    "Nước rất đục": "n_rat_duc",
+}
+# Mã trạng thái 1 byte (0 = không xác định), dùng cho kho lưu trữ dạng cột
+STATUS_CODES = {status: code for code, status in enumerate(STATUS_COLUMNS, start=1)}
+STATUS_NAMES = {code: status for status, code in STATUS_CODES.items()}
+
+
+def connect(db_path=DEFAULT_DB_PATH, timeout=5.0):
+    """Mở kết nối SQLite ở chế độ WAL (người đọc không chặn người ghi)."""
+    conn = sqlite3.connect(db_path, timeout=timeout)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # NORMAL là đủ an toàn với WAL và tránh fsync ở mỗi commit
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def schema_version(conn):
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def _object_type(conn, name):
+    row = conn.execute("SELECT type FROM sqlite_master WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else None
+
+
+def v2_ready(conn):
+    """True khi đã ở schema v2 và không còn bảng cũ đang chờ chuyển."""
+    return schema_version(conn) >= SCHEMA_VERSION and _object_type(conn, LEGACY_TABLE) is None
+
+
+def init_db(db_path=DEFAULT_DB_PATH):
+    conn = sqlite3.connect(db_path, timeout=5.0)
+    # auto_vacuum chỉ có hiệu lực khi đặt trước khi tạo bảng đầu tiên (và trước WAL);
+    # với CSDL cũ dùng `python turbidity_db.py compact --enable-incremental-vacuum`
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    conn.execute("PRAGMA journal_mode=WAL")
+    try:
+        if schema_version(conn) < SCHEMA_VERSION and _object_type(conn, "readings") == "table":
+            # CSDL schema v1: giữ nguyên cho tới khi migrate_to_v2() chạy
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_readings_ts ON readings(ts)")
+        elif schema_version(conn) < SCHEMA_VERSION:
+            _create_v2_tables(conn)
+            _create_compat_view(conn, legacy=False)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        if _object_type(conn, "samples") == "table":
+            # turbidity là giá trị sau bộ lọc gai, raw_turbidity là giá trị đọc được (NULL nếu không lọc)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(samples)")}
+            if "raw_turbidity" not in columns:
+                conn.execute("ALTER TABLE samples ADD COLUMN raw_turbidity REAL")
+            # Lọc theo trạng thái + phân trang theo id: chỉ mục (status_id, rowid) cho quét ngược theo id
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_samples_status ON samples(status_id)")
+            if _object_type(conn, BAD_TS_TABLE) is None:
+                # CSDL v2 tạo trước khi có BAD_TS_TABLE: tạo bảng và trigger ghi qua VIEW mới
+                _create_v2_tables(conn)
+                _create_compat_view(conn, legacy=_object_type(conn, LEGACY_TABLE) is not None)
+        status_cols = ",\n".join(f"                {col} INTEGER NOT NULL DEFAULT 0" for col in STATUS_COLUMNS.values())
+        for table, _ in ROLLUP_LEVELS.values():
+            conn.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {table} (
+                    bucket TEXT NOT NULL,
+                    source TEXT NOT NULL DEFAULT '',
+                    n INTEGER NOT NULL,
+                    turbidity_min REAL,
+                    turbidity_max REAL,
+                    turbidity_sum REAL,
+                    turbidity_last REAL,
+                    voltage_min REAL,
+                    voltage_max REAL,
+                    voltage_sum REAL,
+                    voltage_last REAL,
+                    last_ts TEXT,
+{status_cols},
+                    PRIMARY KEY (bucket, source)
+                ) WITHOUT ROWID
+                """
+            )
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {META_TABLE} (key TEXT PRIMARY KEY, value)")
+        # Lần đầu có bảng meta: bảng tổng hợp còn trống thì mọi dòng thô hiện có chưa được tổng hợp.
+        # Đã có tổng hợp (CSDL nâng cấp từ bản trước) thì không biết dòng nào đã tính: để trống.
+        conn.execute(
+            f"INSERT OR IGNORE INTO {META_TABLE} (key, value) SELECT ?, {_max_raw_id_sql(conn)} + 1 "
+            f"WHERE NOT EXISTS (SELECT 1 FROM {ROLLUP_LEVELS['1d'][0]})",
+            (ROLLUP_FLOOR_KEY,),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _max_raw_id_sql(conn):
+    # Id lớn nhất của dữ liệu thô, kể cả khi đang chuyển schema (mỗi MAX(id) là một lần tra rowid)
+    tables = [t for t in ("samples", LEGACY_TABLE, "readings") if _object_type(conn, t) == "table"]
+    parts = [f"COALESCE((SELECT MAX(id) FROM {t}), 0)" for t in tables]
+    return f"MAX({', '.join(parts)}, 0)" if parts else "0"
+
+
+def get_meta(conn, key, default=None):
+    row = conn.execute(f"SELECT value FROM {META_TABLE} WHERE key = ?", (key,)).fetchone()
+    return default if row is None else row[0]
+
+
+def set_meta(conn, key, value):
+    conn.execute(f"INSERT OR REPLACE INTO {META_TABLE} (key, value) VALUES (?, ?)", (key, value))
+
+
+def needs_migration(db_path=DEFAULT_DB_PATH):
+    conn = sqlite3.connect(db_path, timeout=5.0)
+    try:
+        return not v2_ready(conn)
+    finally:
+        conn.close()
+
+
+def _create_v2_tables(conn):
+    conn.execute("CREATE TABLE IF NOT EXISTS statuses (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)")
+    conn.execute("CREATE TABLE IF NOT EXISTS sources (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL UNIQUE)")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS samples (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ts_ms INTEGER NOT NULL,
+            voltage REAL,
+            turbidity REAL,
+            status_id INTEGER REFERENCES statuses(id),
+            source_id INTEGER REFERENCES sources(id),
+            raw_turbidity REAL
+        )
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_samples_ts ON samples(ts_ms)")
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {BAD_TS_TABLE} (id INTEGER PRIMARY KEY, ts TEXT, voltage REAL, "
+        "turbidity REAL, status TEXT, source TEXT)"
+    )
+    # id trạng thái trùng với mã 1 byte của kho lưu trữ
+    conn.executemany("INSERT OR IGNORE INTO statuses (id, name) VALUES (?, ?)", STATUS_NAMES.items())
+
+
+def _create_compat_view(conn, legacy):
+    """VIEW `readings` với đúng các cột của schema v1; khi đang chuyển thì gộp cả bảng cũ."""
+    conn.execute("DROP VIEW IF EXISTS readings")
+    union = f" UNION ALL SELECT id, ts, voltage, turbidity, status, source FROM {LEGACY_TABLE}" if legacy else ""
+    conn.execute(
+        f"""
+        CREATE VIEW readings AS
+        SELECT s.id AS id,
+               strftime('%Y-%m-%d %H:%M:%S', s.ts_ms / 1000, 'unixepoch', 'localtime') AS ts,
+               s.voltage AS voltage, s.turbidity AS turbidity, st.name AS status, src.name AS source
+        FROM samples s
+        LEFT JOIN statuses st ON st.id = s.status_id
+        LEFT JOIN sources src ON src.id = s.source_id{union}
+        """
+    )
+    # Ghi/xóa qua VIEW như với bảng cũ; ts không hợp lệ vào BAD_TS_TABLE thay vì làm lỗi cả câu INSERT
+    ts_ms = TS_MS_SQL.format(ts="NEW.ts")
+    conn.execute(
+        f"""
+        CREATE TRIGGER readings_insert INSTEAD OF INSERT ON readings BEGIN
+            INSERT OR IGNORE INTO statuses (name) SELECT NEW.status WHERE NEW.status IS NOT NULL;
+            INSERT OR IGNORE INTO sources (name) SELECT NEW.source WHERE NEW.source IS NOT NULL;
+            INSERT INTO samples (ts_ms, voltage, turbidity, status_id, source_id)
+            SELECT {ts_ms}, NEW.voltage, NEW.turbidity,
+                   (SELECT id FROM statuses WHERE name = NEW.status),
+                   (SELECT id FROM sources WHERE name = NEW.source)
+            WHERE {ts_ms} IS NOT NULL;
+            INSERT INTO {BAD_TS_TABLE} (ts, voltage, turbidity, status, source)
+            SELECT NEW.ts, NEW.voltage, NEW.turbidity, NEW.status, NEW.source WHERE {ts_ms} IS NULL;
+        END
+        """
+    )
+    legacy_delete = f"\n            DELETE FROM {LEGACY_TABLE} WHERE id = OLD.id;" if legacy else ""
+    conn.execute(
+        f"""
+        CREATE TRIGGER readings_delete INSTEAD OF DELETE ON readings BEGIN
+            DELETE FROM samples WHERE id = OLD.id;{legacy_delete}
+        END
+        """
+    )
+
+
+def _lookup_ids(conn, table, names):
+    names = sorted({n for n in names if n is not None})
+    if not names:
+        return {}
+    conn.executemany(f"INSERT OR IGNORE INTO {table} (name) VALUES (?)", [(n,) for n in names])
+    marks = ", ".join("?" * len(names))
+    return dict(conn.execute(f"SELECT name, id FROM {table} WHERE name IN ({marks})", names))
+
+
+def ts_to_ms(ts):
+    return int(time.mktime(time.strptime(ts, TS_FORMAT))) * 1000
+
+
+def ms_to_ts(ts_ms):
+    return datetime.fromtimestamp(ts_ms / 1000).strftime(TS_FORMAT)
+
+
+def insert_rows(conn, rows):
+    """Ghi các dòng (ts, voltage, turbidity, status, source[, ts_ms[, raw_turbidity]]) theo schema hiện tại."""
+    if schema_version(conn) >= SCHEMA_VERSION:
+        status_ids = _lookup_ids(conn, "statuses", (r[3] for r in rows))
+        source_ids = _lookup_ids(conn, "sources", (r[4] for r in rows))
+        conn.executemany(
+            "INSERT INTO samples (ts_ms, voltage, turbidity, status_id, source_id, raw_turbidity) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [
+                (r[5] if len(r) > 5 else ts_to_ms(r[0]), r[1], r[2], status_ids.get(r[3]), source_ids.get(r[4]),
+                 r[6] if len(r) > 6 else None)
+                for r in rows
+            ],
+        )
+    else:
+        conn.executemany(BatchedDBWriter.INSERT_SQL, [r[:5] for r in rows])
+
+
+def migrate_to_v2(db_path=DEFAULT_DB_PATH, chunk_size=5000, pause=0.05):
+    """Chuyển trực tuyến schema v1 -> v2, từng khối nhỏ; luồng ghi vẫn chạy song song.
+
+    1. Đổi tên bảng cũ thành readings_v1, tạo bảng v2 và VIEW `readings` gộp cả hai.
+       Id mới bắt đầu sau id lớn nhất của bảng cũ nên thứ tự id được giữ nguyên.
+    2. Chuyển từng khối dòng (giữ nguyên id) từ readings_v1 sang samples. Dòng có ts không
+       đổi được sang epoch ms (rỗng, sai định dạng) được cất sang BAD_TS_TABLE, không chặn việc chuyển.
+    3. Khi bảng cũ rỗng: xóa nó và tạo lại VIEW chỉ đọc từ samples.
+
+    Trả về (số dòng đã chuyển, số dòng bị cất riêng vì ts hỏng) của lần chạy này.
+    """
+    init_db(db_path)
+    conn = connect(db_path)
+    conn.isolation_level = None  # tự quản lý BEGIN/COMMIT
+    moved = 0
+    bad_ts = 0
+    ts_ms = TS_MS_SQL.format(ts="r.ts")
+    try:
+        if schema_version(conn) < SCHEMA_VERSION:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(f"ALTER TABLE readings RENAME TO {LEGACY_TABLE}")
+            _create_v2_tables(conn)
+            max_id = conn.execute(f"SELECT COALESCE(MAX(id), 0) FROM {LEGACY_TABLE}").fetchone()[0]
+            conn.execute("DELETE FROM sqlite_sequence WHERE name = 'samples'")
+            conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('samples', ?)", (max_id,))
+            _create_compat_view(conn, legacy=True)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            conn.execute("COMMIT")
+        if _object_type(conn, LEGACY_TABLE) is None:
+            return moved, bad_ts
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            upto = conn.execute(
+                f"SELECT MAX(id) FROM (SELECT id FROM {LEGACY_TABLE} ORDER BY id LIMIT ?)", (chunk_size,)
+            ).fetchone()[0]
+            if upto is None:
+                conn.execute("DROP VIEW readings")
+                conn.execute(f"DROP TABLE {LEGACY_TABLE}")
+                _create_compat_view(conn, legacy=False)
+                conn.execute("COMMIT")
+                return moved, bad_ts
+            conn.execute(
+                f"INSERT OR IGNORE INTO statuses (name) SELECT DISTINCT status FROM {LEGACY_TABLE} "
+                f"WHERE id <= ? AND status IS NOT NULL", (upto,))
+            conn.execute(
+                f"INSERT OR IGNORE INTO sources (name) SELECT DISTINCT source FROM {LEGACY_TABLE} "
+                f"WHERE id <= ? AND source IS NOT NULL", (upto,))
+            moved += conn.execute(
+                f"""
+                INSERT INTO samples (id, ts_ms, voltage, turbidity, status_id, source_id)
+                SELECT r.id, {ts_ms}, r.voltage, r.turbidity,
+                       (SELECT id FROM statuses WHERE name = r.status),
+                       (SELECT id FROM sources WHERE name = r.source)
+                FROM {LEGACY_TABLE} r WHERE r.id <= ? AND {ts_ms} IS NOT NULL
+                """, (upto,)).rowcount
+            bad_ts += conn.execute(
+                f"INSERT OR REPLACE INTO {BAD_TS_TABLE} (id, ts, voltage, turbidity, status, source) "
+                f"SELECT r.id, r.ts, r.voltage, r.turbidity, r.status, r.source FROM {LEGACY_TABLE} r "
+                f"WHERE r.id <= ? AND {ts_ms} IS NULL", (upto,)).rowcount
+            conn.execute(f"DELETE FROM {LEGACY_TABLE} WHERE id <= ?", (upto,))
+            conn.execute("COMMIT")
+            print(f"Chuyển schema v2: {moved} dòng" + (f", {bad_ts} dòng ts hỏng cất vào {BAD_TS_TABLE}" if bad_ts else ""))
+            time.sleep(pause)
+    except Exception:
+        if conn.in_transaction:
+            conn.execute("ROLLBACK")
+        raise
+    finally:
+        conn.close()
+
+
+def bucket_of(ts, level):
+    """Khóa bucket cùng định dạng với ts, ví dụ '2025-10-10 20:25:00' cho mức 1m."""
+    n = ROLLUP_LEVELS[level][1]
+    return ts[:n] + BUCKET_TEMPLATE[n:]
+
+
+def aggregate_rows(rows, level):
+    """Gom các dòng (ts, voltage, turbidity, status, source) theo bucket, trong bộ nhớ."""
+    aggs = {}
+    for ts, voltage, turbidity, status, source, *_ in rows:
+        key = (bucket_of(ts, level), source or "")
+        a = aggs.get(key)
+        if a is None:
+            a = aggs[key] = {
+                "n": 0, "t_min": turbidity, "t_max": turbidity, "t_sum": 0.0,
+                "v_min": voltage, "v_max": voltage, "v_sum": 0.0,
+                "last_ts": ts, "t_last": turbidity, "v_last": voltage,
+                "status": dict.fromkeys(STATUS_COLUMNS.values(), 0),
+            }
+        a["n"] += 1
+        a["t_min"] = min(a["t_min"], turbidity)
+        a["t_max"] = max(a["t_max"], turbidity)
+        a["t_sum"] += turbidity
+        a["v_min"] = min(a["v_min"], voltage)
+        a["v_max"] = max(a["v_max"], voltage)
+        a["v_sum"] += voltage
+        if ts >= a["last_ts"]:
+            a["last_ts"], a["t_last"], a["v_last"] = ts, turbidity, voltage
+        col = STATUS_COLUMNS.get(status)
+        if col:
+            a["status"][col] += 1
+    return aggs
+
+
+def _upsert_sql(table):
+    cols = list(STATUS_COLUMNS.values())
+    placeholders = ", ".join("?" * (12 + len(cols)))
+    status_updates = ",\n".join(f"            {c} = {c} + excluded.{c}" for c in cols)
+    return f"""
+        INSERT INTO {table} (bucket, source, n, turbidity_min, turbidity_max, turbidity_sum, turbidity_last,
+                             voltage_min, voltage_max, voltage_sum, voltage_last, last_ts, {", ".join(cols)})
+        VALUES ({placeholders})
+        ON CONFLICT(bucket, source) DO UPDATE SET
+            n = n + excluded.n,
+            turbidity_min = min(turbidity_min, excluded.turbidity_min),
+            turbidity_max = max(turbidity_max, excluded.turbidity_max),
+            turbidity_sum = turbidity_sum + excluded.turbidity_sum,
+            turbidity_last = CASE WHEN excluded.last_ts >= last_ts THEN excluded.turbidity_last ELSE turbidity_last END,
+            voltage_min = min(voltage_min, excluded.voltage_min),
+            voltage_max = max(voltage_max, excluded.voltage_max),
+            voltage_sum = voltage_sum + excluded.voltage_sum,
+            voltage_last = CASE WHEN excluded.last_ts >= last_ts THEN excluded.voltage_last ELSE voltage_last END,
+            last_ts = max(last_ts, excluded.last_ts),
+{status_updates}
+    """
+
+
+def update_rollups(conn, rows):
+    """Cộng dồn các dòng mới vào mọi bảng tổng hợp (gọi trong cùng transaction với INSERT)."""
+    for level, (table, _) in ROLLUP_LEVELS.items():
+        params = []
+        for (bucket, source), a in aggregate_rows(rows, level).items():
+            params.append((
+                bucket, source, a["n"], a["t_min"], a["t_max"], a["t_sum"], a["t_last"],
+                a["v_min"], a["v_max"], a["v_sum"], a["v_last"], a["last_ts"],
+                *a["status"].values(),
+            ))
+        conn.executemany(_upsert_sql(table), params)
+
+
+def backfill_rollups(db_path=DEFAULT_DB_PATH, chunk_size=50000):
+    """Tính lại toàn bộ bảng tổng hợp từ `readings`, theo từng khối id (không khóa lâu).
+
+    An toàn khi luồng ghi đang chạy: các dòng có id lớn hơn mốc lấy lúc bắt đầu
+    được luồng ghi cộng dồn như bình thường.
+    """
+    init_db(db_path)
+    conn = connect(db_path)
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        for table, _ in ROLLUP_LEVELS.values():
+            conn.execute(f"DELETE FROM {table}")
+        upto = conn.execute("SELECT COALESCE(MAX(id), 0) FROM readings").fetchone()[0]
+        set_meta(conn, ROLLUP_FLOOR_KEY, upto + 1)
+        conn.commit()
+        return _backfill_below_floor(conn, chunk_size)
+    finally:
+        conn.close()
+
+
+def backfill_pending_rollups(db_path=DEFAULT_DB_PATH, chunk_size=50000):
+    """Tổng hợp các dòng thô chưa được tính (id < ROLLUP_FLOOR_KEY), không đụng tới phần đã có.
+
+    Thiếu mốc (CSDL nâng cấp từ bản chưa ghi mốc) thì tính lại toàn bộ bằng backfill_rollups().
+    """
+    init_db(db_path)
+    conn = connect(db_path)
+    try:
+        if get_meta(conn, ROLLUP_FLOOR_KEY) is not None:
+            return _backfill_below_floor(conn, chunk_size)
+    finally:
+        conn.close()
+    return backfill_rollups(db_path, chunk_size)
+
+
+def _backfill_below_floor(conn, chunk_size):
+    # Đi từ mốc xuống, mỗi khối cộng vào tổng hợp và hạ mốc trong cùng transaction:
+    # dừng giữa chừng rồi chạy lại không cộng trùng
+    total = 0
+    while True:
+        with conn:
+            floor = get_meta(conn, ROLLUP_FLOOR_KEY)
+            rows = conn.execute(
+                "SELECT id, ts, voltage, turbidity, status, source FROM readings "
+                "WHERE id < ? ORDER BY id DESC LIMIT ?",
+                (floor, chunk_size),
+            ).fetchall()
+            if not rows:
+                return total
+            update_rollups(conn, [r[1:] for r in rows])
+            set_meta(conn, ROLLUP_FLOOR_KEY, rows[-1][0])
+        total += len(rows)
+        print(f"Backfill: {total} dòng (id >= {rows[-1][0]})")
+
+
+def compact(db_path=DEFAULT_DB_PATH, policy=None, batch_size=2000, pause=0.05, vacuum_pages=256, now=None):
+    """Xóa dữ liệu quá hạn theo `policy` rồi trả lại dung lượng bằng incremental vacuum.
+
+    Mỗi lần xóa tối đa `batch_size` dòng trong một transaction ngắn và nghỉ `pause`
+    giây giữa các lần, để luồng ghi trực tiếp không bao giờ bị chặn lâu. Dữ liệu thô
+    chỉ bị xóa sau khi đã có trong bảng tổng hợp: các dòng dưới mốc ROLLUP_FLOOR_KEY
+    được backfill_pending_rollups() tổng hợp trước.
+    """
+    policy = dict(RETENTION_POLICY, **(policy or {}))
+    now = now or datetime.now()
+    conn = connect(db_path)
+    deleted = {}
+    try:
+        raw_days = policy.get("raw")
+        migrating = _object_type(conn, LEGACY_TABLE) is not None
+        if raw_days is not None and not migrating:
+            backfill_pending_rollups(db_path)
+            cutoff_dt = now - timedelta(days=raw_days)
+            if schema_version(conn) >= SCHEMA_VERSION:
+                deleted["raw"] = _delete_in_batches(
+                    conn,
+                    "DELETE FROM samples WHERE id IN (SELECT id FROM samples WHERE ts_ms < ? ORDER BY ts_ms LIMIT ?)",
+                    int(cutoff_dt.timestamp() * 1000), batch_size, pause,
+                )
+            else:
+                deleted["raw"] = _delete_in_batches(
+                    conn,
+                    "DELETE FROM readings WHERE id IN (SELECT id FROM readings WHERE ts < ? ORDER BY id LIMIT ?)",
+                    cutoff_dt.strftime(TS_FORMAT), batch_size, pause,
+                )
+        for level, (table, _) in ROLLUP_LEVELS.items():
+            days = policy.get(level)
+            if days is None:
+                continue
+            cutoff = bucket_of((now - timedelta(days=days)).strftime(TS_FORMAT), level)
+            deleted[level] = _delete_in_batches(
+                conn,
+                f"DELETE FROM {table} WHERE (bucket, source) IN "
+                f"(SELECT bucket, source FROM {table} WHERE bucket < ? LIMIT ?)",
+                cutoff, batch_size, pause,
+            )
+        deleted["vacuum_pages"] = _incremental_vacuum(conn, vacuum_pages, pause)
+        return deleted
+    finally:
+        conn.close()
+
+
+def _delete_in_batches(conn, sql, cutoff, batch_size, pause):
+    total = 0
+    while True:
+        with conn:
+            n = conn.execute(sql, (cutoff, batch_size)).rowcount
+        total += n
+        if n < batch_size:
+            return total
+        time.sleep(pause)
+
+
+def _incremental_vacuum(conn, pages, pause):
+    if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        return 0
+    freed = 0
+    while True:
+        free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if free == 0:
+            return freed
+        # executescript chạy lệnh tới hết (execute chỉ bước một lần = giải phóng 1 trang)
+        conn.executescript(f"PRAGMA incremental_vacuum({int(pages)})")
+        freed += min(free, pages)
+        time.sleep(pause)
+
+
+def enable_incremental_vacuum(db_path=DEFAULT_DB_PATH):
+    """Chuyển CSDL đã có sang auto_vacuum=INCREMENTAL (cần VACUUM một lần, chặn ghi trong lúc chạy)."""
+    conn = sqlite3.connect(db_path, timeout=30.0)
+    try:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return False
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+        return True
+    finally:
+        conn.close()
+
+
+def first_ts_ms(conn):
+    """Mốc thời gian sớm nhất còn dữ liệu thô (epoch ms) hoặc None."""
+    if v2_ready(conn):
+        return conn.execute("SELECT MIN(ts_ms) FROM samples").fetchone()[0]
+    first = conn.execute("SELECT MIN(ts) FROM readings").fetchone()[0]
+    return ts_to_ms(first) if first else None
+
+
+def iter_samples(conn, start_ms, end_ms):
+    """Các dòng thô trong [start_ms, end_ms]: (ts_ms, voltage, turbidity, status, source, raw_turbidity),
+    tăng dần theo thời gian. raw_turbidity là None nếu mẫu không qua bộ lọc gai (hoặc schema v1)."""
+    if v2_ready(conn):
+        yield from conn.execute(
+            "SELECT s.ts_ms, s.voltage, s.turbidity, st.name, src.name, s.raw_turbidity FROM samples s "
+            "LEFT JOIN statuses st ON st.id = s.status_id "
+            "LEFT JOIN sources src ON src.id = s.source_id "
+            "WHERE s.ts_ms BETWEEN ? AND ? ORDER BY s.ts_ms, s.id",
+            (start_ms, end_ms),
+        )
+        return
+    # Schema v1 hoặc đang chuyển: đi qua bảng/VIEW readings với ts dạng chuỗi
+    for ts, voltage, turbidity, status, source in conn.execute(
+        "SELECT ts, voltage, turbidity, status, source FROM readings WHERE ts >= ? AND ts <= ? ORDER BY ts, id",
+        (ms_to_ts(start_ms), ms_to_ts(end_ms)),
+    ):
+        yield ts_to_ms(ts), voltage, turbidity, status, source, None
+
+
+def series(conn, start_ms, end_ms=None, source=None):
+    """Chuỗi (ts_ms, turbidity) trong [start_ms, end_ms] tăng dần theo thời gian, cho biểu đồ.
+
+    Chỉ hai cột, không JOIN trạng thái; `source` lọc theo thiết bị.
+    """
+    if v2_ready(conn):
+        sql = "SELECT ts_ms, turbidity FROM samples WHERE ts_ms BETWEEN ? AND ?"
+        params = [start_ms, end_ms if end_ms is not None else 2 ** 62]
+        if source is not None:
+            sql += " AND source_id = (SELECT id FROM sources WHERE name = ?)"
+            params.append(source)
+        return conn.execute(sql + " ORDER BY ts_ms, id", params).fetchall()
+    sql = "SELECT ts, turbidity FROM readings WHERE ts >= ? AND ts <= ?"
+    params = [ms_to_ts(start_ms), ms_to_ts(end_ms) if end_ms is not None else "9999"]
+    if source is not None:
+        sql += " AND source = ?"
+        params.append(source)
+    return [(ts_to_ms(ts), turbidity) for ts, turbidity in conn.execute(sql + " ORDER BY ts, id", params)]
+
+
+def latest_readings(conn, end_ms=None, limit=500):
+    """`limit` dòng mới nhất tính đến end_ms: (ts, voltage, turbidity, status), mới nhất trước."""
+    if v2_ready(conn):
+        rows = conn.execute(
+            "SELECT s.ts_ms, s.voltage, s.turbidity, st.name FROM samples s "
+            "LEFT JOIN statuses st ON st.id = s.status_id "
+            "WHERE s.ts_ms <= ? ORDER BY s.ts_ms DESC LIMIT ?",
+            (end_ms if end_ms is not None else 2 ** 62, limit),
+        ).fetchall()
+        return [(ms_to_ts(t), v, tu, st) for t, v, tu, st in rows]
+    end_ts = ms_to_ts(end_ms) if end_ms is not None else "9999"
+    return conn.execute(
+        "SELECT ts, voltage, turbidity, status FROM readings WHERE ts <= ? ORDER BY ts DESC LIMIT ?",
+        (end_ts, limit),
+    ).fetchall()
+
+
+def sample_id_bounds(conn, start_ms=None, end_ms=None):
+    """Khoảng id [lo, hi] của các dòng thô trong [start_ms, end_ms], tra qua idx_samples_ts.
+
+    Id tăng theo thứ tự ghi (và migrate_to_v2 giữ nguyên id cũ) nên khoảng thời gian
+    tương ứng một khoảng id; trang dữ liệu sau đó chỉ cần quét theo rowid.
+    Trả về None nếu khoảng không có dòng nào.
+    """
+    lo = hi = None
+    if start_ms is not None:
+        row = conn.execute("SELECT id FROM samples WHERE ts_ms >= ? ORDER BY ts_ms, id LIMIT 1", (start_ms,)).fetchone()
+        if row is None:
+            return None
+        lo = row[0]
+    if end_ms is not None:
+        row = conn.execute("SELECT id FROM samples WHERE ts_ms <= ? ORDER BY ts_ms DESC, id DESC LIMIT 1",
+                           (end_ms,)).fetchone()
+        if row is None:
+            return None
+        hi = row[0]
+    if lo is not None and hi is not None and lo > hi:
+        return None
+    return lo, hi
+
+
+def _status_list(status):
+    """None | tên trạng thái | danh sách tên -> None hoặc tuple tên."""
+    if status is None:
+        return None
+    return (status,) if isinstance(status, str) else tuple(status)
+
+
+def _samples_filter(conn, start_ms, end_ms, status, source=None):
+    """Điều kiện WHERE (schema v2) cho khoảng thời gian, trạng thái và thiết bị; None nếu chắc chắn rỗng."""
+    where, params = [], []
+    if start_ms is not None or end_ms is not None:
+        bounds = sample_id_bounds(conn, start_ms, end_ms)
+        if bounds is None:
+            return None
+        for op, bound in zip((">=", "<="), bounds):
+            if bound is not None:
+                where.append(f"s.id {op} ?")
+                params.append(bound)
+        # Dấu + tắt chỉ mục ts: lọc chính xác trên từng dòng nhưng planner vẫn quét theo id
+        if start_ms is not None:
+            where.append("+s.ts_ms >= ?")
+            params.append(start_ms)
+        if end_ms is not None:
+            where.append("+s.ts_ms <= ?")
+            params.append(end_ms)
+    statuses = _status_list(status)
+    if statuses is not None:
+        if not statuses:
+            return None
+        if len(statuses) == 1:
+            # Một trạng thái: idx_samples_status (status_id, rowid) vẫn cho thứ tự theo id
+            where.append("s.status_id = (SELECT id FROM statuses WHERE name = ?)")
+        else:
+            # Nhiều trạng thái: IN trên chỉ mục phải sắp xếp lại mọi dòng khớp; quét theo id và lọc thì
+            # dừng ngay khi đủ một trang
+            marks = ", ".join("?" * len(statuses))
+            where.append(f"+s.status_id IN (SELECT id FROM statuses WHERE name IN ({marks}))")
+        params.extend(statuses)
+    if source is not None:
+        where.append("+s.source_id = (SELECT id FROM sources WHERE name = ?)")
+        params.append(source)
+    return where, params
+
+
+def samples_page(conn, before=None, after=None, limit=200, start_ms=None, end_ms=None, status=None, source=None):
+    """Một trang dòng thô, phân trang keyset theo id (không OFFSET: chi phí không phụ thuộc độ sâu).
+
+    before: các dòng có id < before (trang cũ hơn); after: id > after (trang mới hơn).
+    Lọc khoảng thời gian [start_ms, end_ms], trạng thái (một tên hoặc danh sách tên) và thiết bị ngay trong SQL.
+    Trả về (id, ts, voltage, turbidity, status), mới nhất trước.
+    """
+    if not v2_ready(conn):
+        return _readings_page(conn, before, after, limit, start_ms, end_ms, status, source)
+    flt = _samples_filter(conn, start_ms, end_ms, status, source)
+    if flt is None:
+        return []
+    where, params = flt
+    if after is not None:
+        where.append("s.id > ?")
+        params.append(after)
+        order = "ASC"
+    else:
+        if before is not None:
+            where.append("s.id < ?")
+            params.append(before)
+        order = "DESC"
+    params.append(limit)
+    rows = conn.execute(
+        "SELECT s.id, s.ts_ms, s.voltage, s.turbidity, st.name FROM samples s "
+        "LEFT JOIN statuses st ON st.id = s.status_id"
+        + (" WHERE " + " AND ".join(where) if where else "")
+        + f" ORDER BY s.id {order} LIMIT ?",
+        params,
+    ).fetchall()
+    if after is not None:
+        rows.reverse()
+    return [(i, ms_to_ts(t), v, tu, st) for i, t, v, tu, st in rows]
+
+
+def _readings_filter(start_ms, end_ms, status, source=None):
+    # Schema v1 hoặc đang chuyển: lọc trên bảng/VIEW readings với ts dạng chuỗi
+    where, params = [], []
+    if start_ms is not None:
+        where.append("ts >= ?")
+        params.append(ms_to_ts(start_ms))
+    if end_ms is not None:
+        where.append("ts <= ?")
+        params.append(ms_to_ts(end_ms))
+    statuses = _status_list(status)
+    if statuses is not None:
+        if not statuses:
+            return None
+        where.append(f"status IN ({', '.join('?' * len(statuses))})")
+        params.extend(statuses)
+    if source is not None:
+        where.append("source = ?")
+        params.append(source)
+    return where, params
+
+
+def _readings_page(conn, before, after, limit, start_ms, end_ms, status, source):
+    # Cùng keyset trên id của bảng/VIEW readings
+    flt = _readings_filter(start_ms, end_ms, status, source)
+    if flt is None:
+        return []
+    where, params = flt
+    if after is not None:
+        where.append("id > ?")
+        params.append(after)
+    elif before is not None:
+        where.append("id < ?")
+        params.append(before)
+    params.append(limit)
+    rows = conn.execute(
+        "SELECT id, ts, voltage, turbidity, status FROM readings"
+        + (" WHERE " + " AND ".join(where) if where else "")
+        + f" ORDER BY id {'ASC' if after is not None else 'DESC'} LIMIT ?",
+        params,
+    ).fetchall()
+    if after is not None:
+        rows.reverse()
+    return rows
+
+
+def count_samples(conn, start_ms=None, end_ms=None, status=None, cap=None, source=None):
+    """Số dòng thô khớp bộ lọc của samples_page. Với `cap`, dừng đếm khi vượt cap (trả về cap + 1)."""
+    if v2_ready(conn):
+        flt = _samples_filter(conn, start_ms, end_ms, status, source)
+        table = "samples s"
+    else:
+        flt = _readings_filter(start_ms, end_ms, status, source)
+        table = "readings"
+    if flt is None:
+        return 0
+    where, params = flt
+    sql = f"SELECT 1 FROM {table}" + (" WHERE " + " AND ".join(where) if where else "")
+    if cap is not None:
+        sql += " LIMIT ?"
+        params.append(cap + 1)
+    return conn.execute(f"SELECT COUNT(*) FROM ({sql})", params).fetchone()[0]
+
+
+def samples_overview(conn):
+    """(ts đầu, ts cuối (epoch ms), các trạng thái có dữ liệu) của dữ liệu thô; đọc qua chỉ mục.
+
+    Dùng cho phần metadata của bộ lọc (khoảng ngày, danh sách trạng thái) mà không quét bảng.
+    """
+    if v2_ready(conn):
+        # Hai truy vấn riêng: SQLite chỉ tối ưu MIN/MAX qua chỉ mục khi mỗi câu có một hàm
+        first = conn.execute("SELECT MIN(ts_ms) FROM samples").fetchone()[0]
+        last = conn.execute("SELECT MAX(ts_ms) FROM samples").fetchone()[0]
+        statuses = [row[0] for row in conn.execute(
+            "SELECT name FROM statuses st WHERE EXISTS (SELECT 1 FROM samples WHERE status_id = st.id) "
+            "ORDER BY id"
+        )]
+        return first, last, statuses
+    first = conn.execute("SELECT MIN(ts) FROM readings").fetchone()[0]
+    last = conn.execute("SELECT MAX(ts) FROM readings").fetchone()[0]
+    if first is None:
+        return None, None, []
+    # Schema v1 không có bảng trạng thái riêng: DISTINCT phải quét bảng (chỉ chạy khi metadata hết hạn)
+    statuses = [row[0] for row in conn.execute(
+        "SELECT status FROM readings WHERE status IS NOT NULL GROUP BY status ORDER BY MIN(id)"
+    )]
+    return ts_to_ms(first), ts_to_ms(last), statuses
+
+
+def sample_id_at(conn, ts_ms):
+    """Id của dòng thô mới nhất có ts <= ts_ms (điểm neo khi nhảy tới một thời điểm), hoặc None."""
+    if v2_ready(conn):
+        bounds = sample_id_bounds(conn, None, ts_ms)
+        return bounds[1] if bounds else None
+    row = conn.execute("SELECT id FROM readings WHERE ts <= ? ORDER BY ts DESC, id DESC LIMIT 1",
+                       (ms_to_ts(ts_ms),)).fetchone()
+    return row[0] if row else None
+
+
+def query_rollups(conn, level, start=None, end=None, source=None, limit=None, before=None, after=None,
+                  status=None):
+    """Đọc bucket trong khoảng [start, end] (chuỗi cùng định dạng ts), tăng dần theo thời gian.
+
+    Với `limit`, chỉ lấy `limit` bucket mới nhất trong khoảng — hoặc, khi có `after`,
+    `limit` bucket cũ nhất sau nó. `before`/`after` là bucket loại trừ (phân trang keyset),
+    `status` chỉ giữ các bucket có ít nhất một mẫu ở trạng thái đó.
+
+    Trả về các dòng (bucket, n, avg, min, max turbidity, avg voltage, status_counts).
+    """
+    table = ROLLUP_LEVELS[level][0]
+    where, params = [], []
+    if start is not None:
+        where.append("bucket >= ?")
+        params.append(bucket_of(start, level))
+    if end is not None:
+        where.append("bucket <= ?")
+        params.append(end)
+    if before is not None:
+        where.append("bucket < ?")
+        params.append(before)
+    if after is not None:
+        where.append("bucket > ?")
+        params.append(after)
+    if source is not None:
+        where.append("source = ?")
+        params.append(source)
+    sql = (
+        f"SELECT bucket, SUM(n), SUM(turbidity_sum), MIN(turbidity_min), MAX(turbidity_max), "
+        f"SUM(voltage_sum), "
+        + ", ".join(f"SUM({c})" for c in STATUS_COLUMNS.values())
+        + f" FROM {table}"
+        + (" WHERE " + " AND ".join(where) if where else "")
+        + " GROUP BY bucket"
+        + (f" HAVING SUM({STATUS_COLUMNS[status]}) > 0" if status is not None else "")
+    )
+    if limit is not None:
+        sql = f"SELECT * FROM ({sql} ORDER BY bucket {'ASC' if after is not None else 'DESC'} LIMIT ?) ORDER BY bucket"
+        params.append(limit)
+    else:
+        sql += " ORDER BY bucket"
+    result = []
+    for row in conn.execute(sql, params):
+        bucket, n, t_sum, t_min, t_max, v_sum = row[:6]
+        counts = dict(zip(STATUS_COLUMNS.keys(), row[6:]))
+        result.append((bucket, n, t_sum / n, t_min, t_max, v_sum / n, counts))
+    return result
+
+
+def dominant_status(counts):
+    """Trạng thái chiếm nhiều mẫu nhất trong bucket."""
+    return max(counts.items(), key=lambda kv: kv[1])[0] if counts else None
+
+
+def _is_busy(error):
+    """Lỗi tạm thời do kết nối khác đang giữ khóa (đáng thử lại), khác với lỗi cố định."""
+    code = getattr(error, "sqlite_errorcode", None)  # Python 3.11+
+    if code is not None:
+        return code & 0xFF in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+
+class BatchedDBWriter:
+    """Luồng ghi SQLite dài hạn: giữ kết nối mở và gom nhiều dòng vào một commit.
+
+    Commit khi đủ `batch_size` dòng hoặc khi dòng cũ nhất đã chờ quá
+    `flush_interval` giây. `close()` ghi nốt phần còn lại trước khi đóng.
+
+    CSDL bận/bị khóa (SQLITE_BUSY/SQLITE_LOCKED, xem `_is_busy`) không làm mất lô: lô được giữ lại
+    và ghi lại sau RETRY_MIN_SEC → RETRY_MAX_SEC giây (tăng gấp đôi), tối đa MAX_RETRIES lần; trong
+    lúc chờ, dòng mới nằm trong hàng đợi có giới hạn. Lỗi khác (không có bảng, lỗi đĩa, CSDL chỉ đọc,
+    dữ liệu hỏng...), lô đã thử hết MAX_RETRIES lần, hoặc lô vẫn chưa ghi được khi hết thời gian
+    `close()` thì bị bỏ (in ra lỗi), được cộng vào `errors`/`dropped`.
+    """
+
+    INSERT_SQL = "INSERT INTO readings (ts, voltage, turbidity, status, source) VALUES (?, ?, ?, ?, ?)"
+    RETRY_MIN_SEC = 0.1
+    RETRY_MAX_SEC = 5.0
+    MAX_RETRIES = 20  # ~1,5 phút với RETRY_MAX_SEC = 5
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, batch_size=50, flush_interval=2.0, max_pending=10000, on_flush=None):
+        self.db_path = db_path
+        # Gọi với danh sách dòng sau mỗi commit thành công (vd. ghi nối log NDJSON)
+        self.on_flush = on_flush
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._stop = threading.Event()
+        self._deadline = None
+        self._thread = None
+        # Bộ đếm để theo dõi
+        self.rows_written = 0
+        self.commits = 0
+        self.dropped = 0   # dòng bị bỏ: hàng đợi đầy hoặc lô lỗi không ghi được
+        self.retries = 0   # số lần ghi lại sau lỗi tạm thời
+        self.errors = 0    # số lô bị bỏ vì lỗi
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="db-writer", daemon=True)
+            self._thread.start()
+        return self
+
+    def write(self, ts_ms, voltage, turbidity, status, source, raw_turbidity=None):
+        # ts_ms: epoch mili-giây. Không bao giờ chặn luồng gọi; nếu hàng đợi đầy thì bỏ dòng và đếm lại
+        try:
+            self._queue.put_nowait((ts_ms, voltage, turbidity, status, source, raw_turbidity))
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout=10.0):
+        # Lô đang chờ ghi lại được thử tiếp tới hết `timeout`, sau đó mới bị bỏ
+        self._deadline = time.monotonic() + timeout
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self):
+        return {
+            "pending": self._queue.qsize(),
+            "rows_written": self.rows_written,
+            "commits": self.commits,
+            "retries": self.retries,
+            "errors": self.errors,
+            "dropped": self.dropped,
+        }
+
+    def _run(self):
+        conn = connect(self.db_path)
+        batch = []
+        first_at = None
+        retry_at = None
+        delay = self.RETRY_MIN_SEC
+        attempts = 0
+        try:
+            while True:
+                if retry_at is not None:
+                    # Chờ tới lần ghi lại; dòng mới nằm lại trong hàng đợi
+                    wait = max(0.0, retry_at - time.monotonic())
+                    if self._stop.is_set():
+                        time.sleep(wait)
+                    else:
+                        self._stop.wait(wait)
+                else:
+                    wait = self.flush_interval if first_at is None else max(0.0, first_at + self.flush_interval - time.monotonic())
+                    try:
+                        row = self._queue.get(timeout=min(wait, 0.5))
+                        batch.append(row)
+                        if first_at is None:
+                            first_at = time.monotonic()
+                    except queue.Empty:
+                        pass
+                stopping = self._stop.is_set()
+                if stopping:
+                    # Lấy hết phần còn trong hàng đợi trước khi thoát
+                    while True:
+                        try:
+                            batch.append(self._queue.get_nowait())
+                        except queue.Empty:
+                            break
+                now = time.monotonic()
+                if retry_at is not None:
+                    flush = now >= retry_at
+                else:
+                    due = first_at is not None and (now - first_at) >= self.flush_interval
+                    flush = len(batch) >= self.batch_size or due or stopping
+                if batch and flush:
+                    try:
+                        self._flush(conn, batch)
+                    except sqlite3.OperationalError as e:
+                        if not _is_busy(e):
+                            print(f"Lỗi ghi DB, bỏ {len(batch)} dòng: {e}")
+                            self.errors += 1
+                            self.dropped += len(batch)
+                        elif stopping and (self._deadline is None or time.monotonic() + delay > self._deadline):
+                            print(f"Lỗi ghi DB, bỏ {len(batch)} dòng khi đóng: {e}")
+                            self.errors += 1
+                            self.dropped += len(batch)
+                        elif attempts >= self.MAX_RETRIES:
+                            print(f"Lỗi ghi DB sau {attempts} lần thử lại, bỏ {len(batch)} dòng: {e}")
+                            self.errors += 1
+                            self.dropped += len(batch)
+                        else:
+                            print(f"Lỗi ghi DB (thử lại sau {delay:.1f} s): {e}")
+                            self.retries += 1
+                            attempts += 1
+                            retry_at = time.monotonic() + delay
+                            delay = min(delay * 2, self.RETRY_MAX_SEC)
+                            continue
+                    except Exception as e:
+                        print(f"Lỗi ghi DB, bỏ {len(batch)} dòng: {e}")
+                        self.errors += 1
+                        self.dropped += len(batch)
+                    batch = []
+                    first_at = None
+                    retry_at = None
+                    delay = self.RETRY_MIN_SEC
+                    attempts = 0
+                if stopping and not batch:
+                    break
+        finally:
+            conn.close()
+
+    def _flush(self, conn, batch):
+        # Chuỗi ts (giờ địa phương) dùng cho bucket tổng hợp, log NDJSON và schema v1
+        batch = [(ms_to_ts(ts_ms), v, t, st, src, ts_ms, raw) for ts_ms, v, t, st, src, raw in batch]
+        with conn:
+            insert_rows(conn, batch)
+            update_rollups(conn, batch)
+        self.rows_written += len(batch)
+        self.commits += 1
+        if self.on_flush is not None:
+            try:
+                self.on_flush(batch)
+            except Exception as e:
+                print(f"Lỗi ghi log: {e}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Công cụ bảo trì turbidity.db")
+    parser.add_argument("--db", default=DEFAULT_DB_PATH, help="đường dẫn CSDL")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("backfill-rollups", help="tính lại bảng tổng hợp 1m/1h/1d từ readings")
+    sub.add_parser("migrate-v2", help="chuyển schema sang v2 (epoch ms, bảng tra cứu trạng thái/nguồn)")
+    compact_parser = sub.add_parser("compact", help="xóa dữ liệu quá hạn theo chính sách lưu giữ")
+    compact_parser.add_argument("--raw-days", type=int, default=RETENTION_POLICY["raw"],
+                                help="số ngày giữ dữ liệu thô")
+    compact_parser.add_argument("--minute-days", type=int, default=RETENTION_POLICY["1m"],
+                                help="số ngày giữ tổng hợp theo phút")
+    compact_parser.add_argument("--archive", default=None,
+                                help="thư mục kho lưu trữ dạng cột (mặc định columnar_archive.DEFAULT_ARCHIVE_DIR)")
+    compact_parser.add_argument("--enable-incremental-vacuum", action="store_true",
+                                help="chuyển CSDL cũ sang incremental vacuum (VACUUM một lần)")
+    args = parser.parse_args()
+    if args.command == "backfill-rollups":
+        total = backfill_rollups(args.db)
+        print(f"Đã tổng hợp {total} dòng.")
+    elif args.command == "migrate-v2":
+        moved, bad_ts = migrate_to_v2(args.db)
+        print(f"Schema v2 sẵn sàng ({moved} dòng đã chuyển, {bad_ts} dòng ts hỏng cất vào {BAD_TS_TABLE}).")
+    elif args.command == "compact":
+        if args.enable_incremental_vacuum and enable_incremental_vacuum(args.db):
+            print("Đã bật auto_vacuum=INCREMENTAL.")
+        # Niêm phong các ngày sắp bị xóa dữ liệu thô vào kho lưu trữ trước (như periodic_compaction của GUI);
+        # columnar_archive tự import turbidity_db nên chỉ nhập ở đây
+        import columnar_archive
+        archive_dir = args.archive or columnar_archive.DEFAULT_ARCHIVE_DIR
+        last_day = (datetime.now() - timedelta(days=args.raw_days)).date()
+        sealed = columnar_archive.seal_pending(args.db, archive_dir, today=last_day + timedelta(days=1))
+        if sealed:
+            print(f"Đã lưu trữ các ngày: {sealed}")
+        deleted = compact(args.db, {"raw": args.raw_days, "1m": args.minute_days})
+        print(f"Đã dọn dữ liệu: {deleted}")
+
+
+if __name__ == "__main__":
+    main()
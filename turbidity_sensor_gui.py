@@ -1,31 +1,59 @@
 import tkinter as tk
 # Import ttkbootstrap as b
 import ttkbootstrap as b
-import serial
 import time
 import os
+import queue
 import threading
-from datetime import datetime
+import numpy as np
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import re
 import sqlite3
-from collections import deque
-from urllib.parse import urlencode
-import urllib.request
-import ssl
-try:
-    import certifi
-    HAS_CERTIFI = True
-except Exception:
-    HAS_CERTIFI = False
+import turbidity_db
+import ndjson_log
+import columnar_archive
+import serial_parser
+import binary_protocol
+import multi_sensor
+from spike_filter import SpikeFilter
+from chart_renderer import BlitChartRenderer
+from downsample import SeriesBuffer, downsample
+from ui_scheduler import CoalescingScheduler
+from history_pager import HistoryPager
+from ingest_pipeline import IngestPipeline, SensorAnalytics, get_water_status_bootstyle
+import notifier
+from notifier import NotificationDispatcher
+import live_feed
 
 # Lớp Cửa sổ Lịch sử (Đã nâng cấp lên ttkbootstrap)
 class HistoryWindow(tk.Toplevel):
-    def __init__(self, master=None):
+    # Độ phân giải hiển thị: None = dữ liệu thô, còn lại đọc từ bảng tổng hợp
+    RESOLUTIONS = {"Thô": None, "1 phút": "1m", "1 giờ": "1h", "1 ngày": "1d"}
+    ALL_STATUSES = "Mọi trạng thái"
+    # Treeview chỉ giữ tối đa PAGE_SIZE * MAX_PAGES dòng; cuộn gần mép thì tải trang kế (keyset)
+    PAGE_SIZE = 200
+    MAX_PAGES = 3
+    # Trạng thái -> bootstyle tag (tra dict thay vì so chuỗi từng dòng)
+    STATUS_TAGS = {
+        "Nước cất": "success",
+        "Nước trong": "info",
+        "Nước hơi đục": "warning",
+        "Nước đục": "danger",
+        "Nước rất đục": "danger",
+    }
+
+    def __init__(self, master=None, source=None):
         super().__init__(master)
-        self.title("Lịch sử Đo Độ đục")
-        self.geometry("600x400")
+        # source: chỉ xem dữ liệu của một thiết bị (None = mọi nguồn, như khi chỉ có một cảm biến)
+        self.source = source
+        self.title("Lịch sử Đo Độ đục" + (f" — {source}" if source else ""))
+        self.geometry("760x460")
+
+        # Một kết nối đọc cho cả vòng đời cửa sổ (WAL: không chặn luồng ghi)
+        db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "turbidity.db")
+        self.conn = sqlite3.connect(db_path)
+        self.pager = HistoryPager(self.fetch_page, page_size=self.PAGE_SIZE, max_pages=self.MAX_PAGES)
+        self._loading = False
 
         # Sử dụng b.Frame
         frame = b.Frame(self, padding=10)
@@ -44,48 +72,206 @@ class HistoryWindow(tk.Toplevel):
         self.tree.column("status", width=120, anchor=tk.W)
 
         # Sử dụng b.Scrollbar
-        scrollbar = b.Scrollbar(frame, orient=tk.VERTICAL, command=self.tree.yview)
-        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.scrollbar = b.Scrollbar(frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self.on_tree_scroll)
         self.tree.grid(row=0, column=0, sticky="nsew")
-        scrollbar.grid(row=0, column=1, sticky="ns")
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
         frame.rowconfigure(0, weight=1)
         frame.columnconfigure(0, weight=1)
 
-        # Xóa tag_configure, thay bằng bootstyle tags trong load_data
-        
         button_frame = b.Frame(self, padding=(0, 10))
         button_frame.pack(fill="x")
         
         # Sử dụng b.Button
         b.Button(button_frame, text="Làm mới", command=self.load_data, bootstyle='primary').pack(side="left", padx=10)
+        self.resolution_var = tk.StringVar(value="Thô")
+        resolution_box = b.Combobox(button_frame, textvariable=self.resolution_var, values=list(self.RESOLUTIONS),
+                                    state="readonly", width=8, bootstyle='primary')
+        resolution_box.pack(side="left", padx=5)
+        resolution_box.bind("<<ComboboxSelected>>", lambda _e: self.load_data())
+        # Lọc trạng thái ngay trong SQL
+        self.status_var = tk.StringVar(value=self.ALL_STATUSES)
+        status_box = b.Combobox(button_frame, textvariable=self.status_var,
+                                values=[self.ALL_STATUSES] + list(turbidity_db.STATUS_COLUMNS),
+                                state="readonly", width=14, bootstyle='primary')
+        status_box.pack(side="left", padx=5)
+        status_box.bind("<<ComboboxSelected>>", lambda _e: self.load_data())
+        # Khoảng ngày: "Từ" để trống = không giới hạn; "Đến" = hết ngày này
+        # (ngày cũ đã dọn khỏi DB được đọc từ kho lưu trữ)
+        b.Label(button_frame, text="Từ").pack(side="left", padx=(5, 2))
+        self.from_entry = b.DateEntry(button_frame, dateformat=columnar_archive.DAY_FORMAT, width=11, bootstyle='primary')
+        self.from_entry.entry.delete(0, tk.END)
+        self.from_entry.pack(side="left")
+        b.Label(button_frame, text="Đến").pack(side="left", padx=(5, 2))
+        self.day_entry = b.DateEntry(button_frame, dateformat=columnar_archive.DAY_FORMAT, width=11, bootstyle='primary')
+        self.day_entry.pack(side="left")
         b.Button(button_frame, text="Đóng", command=self.destroy, bootstyle='secondary').pack(side="right", padx=10)
+
+        # Nhảy tới một thời điểm: trang đầu là các dòng tại/trước thời điểm đó, cuộn lên để xem dòng mới hơn
+        jump_frame = b.Frame(self, padding=(0, 0, 0, 10))
+        jump_frame.pack(fill="x")
+        b.Label(jump_frame, text="Tới thời điểm").pack(side="left", padx=(10, 5))
+        self.jump_entry = b.Entry(jump_frame, width=20)
+        self.jump_entry.pack(side="left")
+        self.jump_entry.bind("<Return>", lambda _e: self.jump_to())
+        b.Button(jump_frame, text="Đi tới", command=self.jump_to, bootstyle='primary').pack(side="left", padx=5)
+        self.info_label = b.Label(jump_frame, text="")
+        self.info_label.pack(side="right", padx=10)
         
         self.load_data()
 
-    def load_data(self):
-        for item in self.tree.get_children():
-            self.tree.delete(item)
+    @staticmethod
+    def status_tag(status):
+        status_key = (status or "").replace(" ", "_").lower()
+
+        # Sử dụng bootstyle tags cho Treeview
+        status_tag = "default"
+        if "cất" in status_key: status_tag = 'success'
+        elif "trong" in status_key: status_tag = 'info'
+        elif "hơi_đục" in status_key: status_tag = 'warning'
+        elif "đục" in status_key and "rất" not in status_key: status_tag = 'danger'
+        elif "rất_đục" in status_key or "rất" in status_key: status_tag = 'danger'
+        return status_tag
+
+    def destroy(self):
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+        super().destroy()
+
+    def filters(self):
+        level = self.RESOLUTIONS.get(self.resolution_var.get())
+        status = self.status_var.get()
+        status = None if status == self.ALL_STATUSES else status
+        from_day = self.from_entry.entry.get().strip()
+        start_ms = columnar_archive.day_start_ms(from_day) if from_day else None
+        end_ms = columnar_archive.day_start_ms(self.day_entry.entry.get().strip()) + 86400 * 1000 - 1
+        return level, status, start_ms, end_ms
+
+    def fetch_page(self, before=None, after=None, limit=200):
+        # Các dòng (khóa, ts, voltage, turbidity, status), mới nhất trước; khóa = id hoặc bucket
+        level, status, start_ms, end_ms = self.filters()
+        if level is None:
+            return turbidity_db.samples_page(self.conn, before=before, after=after, limit=limit,
+                                             start_ms=start_ms, end_ms=end_ms, status=status, source=self.source)
+        # Mỗi dòng là một bucket: giá trị trung bình và trạng thái chiếm đa số
+        rollups = turbidity_db.query_rollups(
+            self.conn, level,
+            start=turbidity_db.ms_to_ts(start_ms) if start_ms is not None else None,
+            end=turbidity_db.ms_to_ts(end_ms), source=self.source, limit=limit, before=before, after=after,
+            status=status,
+        )
+        return [
+            (bucket, bucket, v_avg, t_avg, turbidity_db.dominant_status(counts))
+            for bucket, _n, t_avg, _t_min, _t_max, v_avg, counts in reversed(rollups)
+        ]
+
+    def load_data(self, anchor=None):
+        self.tree.delete(*self.tree.get_children())
+        self._loading = True
         try:
-            db_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "turbidity.db")
-            conn = sqlite3.connect(db_path)
-            cur = conn.cursor()
-            cur.execute("SELECT ts, voltage, turbidity, status FROM readings ORDER BY id DESC LIMIT 500")
-            rows = cur.fetchall()
-            conn.close()
-            for ts, voltage, turbidity, status in rows:
-                status_key = (status or "").replace(" ", "_").lower()
-                
-                # Sử dụng bootstyle tags cho Treeview
-                status_tag = "default"
-                if "cất" in status_key: status_tag = 'success'
-                elif "trong" in status_key: status_tag = 'info'
-                elif "hơi_đục" in status_key: status_tag = 'warning'
-                elif "đục" in status_key and "rất" not in status_key: status_tag = 'danger'
-                elif "rất_đục" in status_key or "rất" in status_key: status_tag = 'danger'
-                
-                self.tree.insert("", tk.END, values=(ts, round(voltage), round(turbidity, 2), status), tags=(status_tag,))
+            rows = self.pager.reset(anchor)
+            if not rows and self.RESOLUTIONS.get(self.resolution_var.get()) is None:
+                rows = self.archive_rows()
+            self.insert_rows(rows, tk.END)
+            self.update_info()
         except Exception as e:
             self.tree.insert("", tk.END, values=(f"Lỗi tải lịch sử: {e}", "", "", ""))
+        finally:
+            self._loading = False
+
+    def archive_rows(self):
+        # Dữ liệu thô ngày này đã bị dọn: đọc thẳng từ kho dạng cột (memmap), không phân trang
+        _level, status, start_ms, end_ms = self.filters()
+        day_start = end_ms - 86400 * 1000 + 1
+        cols = columnar_archive.read_range(max(day_start, start_ms or day_start), end_ms, source=self.source)
+        if status is not None:
+            mask = cols["status"] == turbidity_db.STATUS_CODES[status]
+            cols = {name: col[mask] for name, col in cols.items()}
+        cols = {name: col[-self.PAGE_SIZE * self.MAX_PAGES:][::-1] for name, col in cols.items()}
+        return [(f"archive-{i}",) + record for i, record in enumerate(columnar_archive.to_records(cols))]
+
+    def jump_to(self):
+        text = self.jump_entry.get().strip()
+        try:
+            ts_ms = turbidity_db.ts_to_ms(text)
+        except ValueError:
+            self.info_label.config(text=f"Định dạng: {turbidity_db.TS_FORMAT}")
+            return
+        level = self.RESOLUTIONS.get(self.resolution_var.get())
+        if level is None:
+            found = turbidity_db.sample_id_at(self.conn, ts_ms)
+            anchor = found + 1 if found is not None else None
+        else:
+            # "~" lớn hơn mọi ký tự của bucket: trang đầu gồm cả bucket chứa thời điểm này
+            anchor = turbidity_db.bucket_of(text, level) + "~"
+        self.load_data(anchor)
+
+    def insert_rows(self, rows, index):
+        tags = self.STATUS_TAGS
+        insert = self.tree.insert
+        for key, ts, voltage, turbidity, status in rows:
+            tag = tags.get(status) or self.status_tag(status)
+            insert("", index, iid=str(key), values=(ts, round(voltage), round(turbidity, 2), status), tags=(tag,))
+            if index != tk.END:
+                index += 1
+
+    def on_tree_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if self._loading:
+            return
+        if float(last) >= 0.98 and self.pager.has_older:
+            self._loading = True
+            self.after_idle(self.load_older)
+        elif float(first) <= 0.02 and self.pager.has_newer:
+            self._loading = True
+            self.after_idle(self.load_newer)
+
+    def load_older(self):
+        try:
+            top = self.top_index()
+            loaded = self.pager.older()
+            if loaded:
+                rows, dropped = loaded
+                self.insert_rows(rows, tk.END)
+                if dropped:
+                    self.tree.delete(*(str(row[0]) for row in dropped))
+                    self.scroll_to_index(top - len(dropped))
+            self.update_info()
+        finally:
+            self._loading = False
+
+    def load_newer(self):
+        try:
+            top = self.top_index()
+            loaded = self.pager.newer()
+            if loaded:
+                rows, dropped = loaded
+                if dropped:
+                    self.tree.delete(*(str(row[0]) for row in dropped))
+                self.insert_rows(rows, 0)
+                # Giữ nguyên dòng đang ở đầu khung nhìn
+                self.scroll_to_index(top + len(rows))
+            self.update_info()
+        finally:
+            self._loading = False
+
+    def top_index(self):
+        return int(round(self.tree.yview()[0] * len(self.tree.get_children())))
+
+    def scroll_to_index(self, index):
+        total = len(self.tree.get_children())
+        if total:
+            self.tree.yview_moveto(max(0, index) / total)
+
+    def update_info(self):
+        more = []
+        if self.pager.has_newer:
+            more.append("↑ mới hơn")
+        if self.pager.has_older:
+            more.append("↓ cũ hơn")
+        self.info_label.config(text=f"{len(self.tree.get_children())} dòng" + (f" ({', '.join(more)})" if more else ""))
 
 
 # Đã XÓA lớp GaugeWidget tùy chỉnh theo yêu cầu
@@ -98,37 +284,93 @@ class TurbiditySensorGUI:
         self.root.geometry("850x700")
         self.root.resizable(True, True)
 
-        self.serial_connection = None
+        self.hub = None
         self.is_running = False
-        self.turbidity_data = []
-        self.timestamps = []
         self.history_win = None
         
-        self.last_log_time = None
         self.log_interval = 3600  # 1 giờ (3600 giây)
-        self.last_turbidity = None
-        self.last_voltage = None
-
-        self.current_alert_level = 0
-        self.recent_samples = deque(maxlen=120)  # store last ~2 minutes assuming ~1s sample
-        self.last_command_sent_at = 0
-        self.last_command_type = None
-        self.last_notify_at = 0
+        # Mẫu cuối của từng thiết bị: device_id -> (voltage, turbidity, thời điểm ghi DB gần nhất)
+        self.last_readings = {}
 
         # Settings
         self.DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "turbidity.db")
         self.TELEGRAM_MIN_INTERVAL_SEC = 60  # giữ cooldown chung; trạng thái thay đổi sẽ bỏ qua
-        self.TREND_WINDOW_SEC = 60
-        self.TREND_ALERT_SLOPE = 30.0  # NTU per minute
-        self.TREND_LINE_WINDOW_SEC = 300  # cửa sổ hiển thị đường xu hướng trên biểu đồ
-        self.TREND_ROLLING_WINDOW_SEC = 60  # cửa sổ lăn cho đường xu hướng (tạo gấp khúc)
-        # Cảnh báo tốc độ thay đổi ngắn hạn (1-2 phút)
-        self.RATE_WINDOW_SEC = 60             # cửa sổ 1 phút (có thể tăng 120s nếu cần)
-        self.RATE_ALERT_SLOPE = 20.0          # NTU/phút
-        self.RATE_MIN_DELTA = 10.0            # thay đổi tối thiểu trong cửa sổ
-        self.RATE_MIN_POINTS = 3              # tối thiểu số điểm trong cửa sổ
-        self.RATE_ALERT_COOLDOWN_SEC = 60     # tránh spam cảnh báo ngắn hạn
-        self.last_rate_alert_at = 0.0
+        # Log NDJSON ghi nối song song với DB (nguồn dự phòng cho app mobile khi chưa có turbidity.db).
+        # Tắt mặc định: file không xoay vòng và không theo RETENTION_POLICY. Bật bằng NDJSON_LOG=1
+        # (ghi vào ndjson_log.DEFAULT_LOG_PATH) hoặc NDJSON_LOG=<đường dẫn>
+        ndjson_setting = os.environ.get("NDJSON_LOG", "").strip()
+        self.NDJSON_LOG_PATH = ndjson_log.DEFAULT_LOG_PATH if ndjson_setting == "1" else (ndjson_setting or None)
+        # "text" (mặc định, 9600 baud) hoặc "binary" (khung CRC16, 115200 baud; firmware env uno_binary)
+        self.SERIAL_PROTOCOL = os.environ.get("SERIAL_PROTOCOL", "text").strip().lower()
+        # Nhiều cảm biến: SENSOR_PORTS="be_loc=/dev/ttyUSB0,be_chua=COM4"; để trống = một Arduino dò cổng tự động.
+        # Mã thiết bị được ghi vào cột nguồn (source) của từng dòng dữ liệu.
+        self.devices = multi_sensor.parse_sensor_ports(os.environ.get("SENSOR_PORTS", ""))
+        self.device_ids = [device_id for device_id, _ in self.devices]
+        self.selected_device = self.device_ids[0]
+        # Biểu đồ: mỗi thiết bị giữ tối đa CHART_BUFFER_POINTS điểm (numpy); chỉ thiết bị đang chọn được vẽ.
+        # Khoảng dài được rút gọn (min-max) về cỡ số pixel chiều ngang nên vẽ hàng giờ/ngày vẫn nhẹ.
+        self.CHART_BUFFER_POINTS = int(os.environ.get("CHART_BUFFER_POINTS", "200000"))
+        self.CHART_RECENT_POINTS = 50
+        self.CHART_WINDOWS = {
+            "50 điểm gần nhất": None,
+            "10 phút": 600,
+            "1 giờ": 3600,
+            "6 giờ": 6 * 3600,
+            "24 giờ": 24 * 3600,
+        }
+        self.chart_window = None  # giây; None = CHART_RECENT_POINTS điểm gần nhất
+        self.chart_data = {device_id: SeriesBuffer(self.CHART_BUFFER_POINTS) for device_id in self.device_ids}
+        # Luồng analytics ghi nối từng mẫu, luồng Tk đọc/nạp lịch sử: mọi truy cập chart_data đi qua khóa này
+        self.chart_lock = threading.Lock()
+        self.chart_backfilled = {}  # device_id -> mốc (giây) đã nạp lịch sử từ DB tới
+        self.latest_snapshots = {}
+        # Biểu đồ vẽ bằng blit, tối đa CHART_MAX_FPS khung/giây bất kể tốc độ lấy mẫu
+        self.CHART_MAX_FPS = float(os.environ.get("CHART_MAX_FPS", "10"))
+        # Phần chữ/trạng thái: snapshot từ luồng analytics được gộp lại (chỉ giữ bản mới nhất), luồng Tk lấy ra
+        # mỗi UI_TICK_MS. Điểm biểu đồ không đi qua bộ gộp (xem update_gui)
+        self.UI_TICK_MS = int(os.environ.get("UI_TICK_MS", "100"))
+        self.ui_scheduler = CoalescingScheduler(tick_ms=self.UI_TICK_MS)
+        # Trạng thái kết nối từ các luồng đọc serial: xếp hàng ở đây, luồng Tk xử lý trong drain_ui
+        self.device_events = queue.Queue()
+        # Kênh đẩy cục bộ cho dashboard (app_mobile): mỗi mẫu được phát ngay trên 127.0.0.1:LIVE_FEED_PORT
+        # thay vì chờ dashboard quét DB; để trống để tắt
+        self.LIVE_FEED_PORT = os.environ.get("LIVE_FEED_PORT", str(live_feed.DEFAULT_PORT)).strip()
+        self.COMPACTION_INTERVAL_SEC = 3600  # chu kỳ dọn dữ liệu quá hạn (xem turbidity_db.RETENTION_POLICY)
+        self.compaction_thread = None
+
+        self.live_feed = None
+        if self.LIVE_FEED_PORT:
+            try:
+                self.live_feed = live_feed.FeedPublisher(port=int(self.LIVE_FEED_PORT)).start()
+            except OSError as e:
+                # Cổng đã bị chiếm (vd. mở hai cửa sổ): dashboard vẫn đọc được từ DB
+                print(f"Live feed disabled: {e}")
+
+        # Phân tích (cảnh báo, xu hướng) chạy trên luồng worker của pipeline
+        self.analytics = SensorAnalytics()
+        self.pipeline = IngestPipeline(
+            parse_fn=self.parse_serial_line,
+            analytics=self.analytics,
+            persist_fn=self.persist_result,
+            notify_fn=self.send_notification,
+            command_fn=self.send_serial_command,
+            on_snapshot=self.update_gui,
+            spike_filter=self.create_spike_filter(),
+            device_id=self.selected_device,
+        )
+        # Mỗi thiết bị còn lại có trạng thái phân tích/cảnh báo và bộ lọc riêng, dùng chung các luồng tầng
+        for device_id in self.device_ids[1:]:
+            self.pipeline.add_device(device_id, SensorAnalytics(), self.create_spike_filter())
+        self.pipeline.start()
+
+        # Telegram: một kết nối HTTPS keep-alive, gộp các cảnh báo dồn dập, cooldown riêng cho từng thiết bị
+        self.notifier = NotificationDispatcher(
+            self.telegram_credentials,
+            api_url=os.environ.get("TELEGRAM_API_URL", notifier.TELEGRAM_API_URL),
+            cooldown_sec=self.TELEGRAM_MIN_INTERVAL_SEC,
+            label_channels=len(self.device_ids) > 1,
+            insecure_skip_verify=os.environ.get("TELEGRAM_INSECURE_SKIP_VERIFY") == "1",
+        ).start()
 
         # Xóa create_styles()
         self.create_widgets()
@@ -138,9 +380,12 @@ class TurbiditySensorGUI:
         self.telegram_chat_id = None
         self.load_env_settings()
 
-        self.connect_to_arduino()
+        self.db_writer = None
         self.init_db()
+        self.connect_to_arduino()
         self.periodic_log()
+        self.drain_ui()
+        self.root.after(60000, self.periodic_compaction)  # lần đầu sau 1 phút
 
     # Đã XÓA hàm create_styles(self)
 
@@ -175,6 +420,19 @@ class TurbiditySensorGUI:
         self.connect_button.pack(side="left", padx=5)
         self.history_button = b.Button(button_frame, text="Lịch sử đo", command=self.open_history_window, bootstyle='primary')
         self.history_button.pack(side="left", padx=5)
+        if len(self.device_ids) > 1:
+            # Chọn thiết bị hiển thị trên dashboard; mọi thiết bị vẫn được ghi và cảnh báo
+            self.device_var = tk.StringVar(value=self.selected_device)
+            self.device_combo = b.Combobox(button_frame, textvariable=self.device_var, values=self.device_ids,
+                                           state="readonly", width=14)
+            self.device_combo.pack(side="left", padx=5)
+            self.device_combo.bind("<<ComboboxSelected>>", self.on_device_selected)
+        # Khoảng thời gian của biểu đồ; khoảng dài được nạp bù từ DB khi chọn
+        self.chart_window_var = tk.StringVar(value=next(iter(self.CHART_WINDOWS)))
+        chart_window_box = b.Combobox(button_frame, textvariable=self.chart_window_var, values=list(self.CHART_WINDOWS),
+                                      state="readonly", width=16)
+        chart_window_box.pack(side="left", padx=5)
+        chart_window_box.bind("<<ComboboxSelected>>", self.on_chart_window_selected)
 
         gauge_frame = b.Frame(main_frame)
         gauge_frame.grid(row=2, column=0, pady=20)
@@ -247,67 +505,86 @@ class TurbiditySensorGUI:
         self.line, = self.ax.plot([], [], color='#3b8fd6', marker='o', markersize=3, linewidth=2)
         self.trend_line, = self.ax.plot([], [], color='#f39c12', linestyle='--', linewidth=2, alpha=0.9)
         
-        self.figure.tight_layout()
         self.canvas_graph = FigureCanvasTkAgg(self.figure, master=self.graph_frame)
         self.canvas_graph.get_tk_widget().pack(fill="both", expand=True, padx=10, pady=10)
+        # Chỉ vẽ lại toàn bộ (và tight_layout) khi đổi kích thước hoặc đổi giới hạn trục
+        self.chart_renderer = BlitChartRenderer(self.figure, self.canvas_graph, self.ax, self.line, self.trend_line,
+                                                max_fps=self.CHART_MAX_FPS, schedule=self.root.after)
         # =======================================
 
     def open_history_window(self):
+        # Nhiều cảm biến: lịch sử của thiết bị đang chọn (DB, bảng tổng hợp và kho lưu trữ đều lọc theo nguồn)
+        source = self.selected_device if len(self.device_ids) > 1 else None
+        if self.history_win is not None and self.history_win.winfo_exists() and self.history_win.source != source:
+            self.history_win.destroy()
         if self.history_win is None or not self.history_win.winfo_exists():
             # Xóa tham số 'colors'
-            self.history_win = HistoryWindow(self.root)
+            self.history_win = HistoryWindow(self.root, source=source)
             self.history_win.transient(self.root)
         else:
             self.history_win.lift() 
     
+    def create_spike_filter(self):
+        # Lọc gai trước cảnh báo: "hampel" (mặc định), "median", "debounce" hoặc "off"
+        return SpikeFilter(mode=os.environ.get("SPIKE_FILTER", "hampel").strip().lower())
+
     def connect_to_arduino(self):
-        try:
-            ports = ['COM3', 'COM4', 'COM5', '/dev/ttyUSB0', '/dev/ttyACM0', '/dev/ttyS0']
-            for port in ports:
-                try:
-                    # Tăng thời gian chờ (sleep) sau khi kết nối
-                    self.serial_connection = serial.Serial(port=port, baudrate=9600, timeout=1, write_timeout=1)
-                    print(f"Opening port {port}...")
-                    time.sleep(2) # Cho Arduino thời gian khởi động lại
-                    # Xóa bộ đệm input với API mới; fallback tương thích nếu cần
-                    try:
-                        reset_fn = getattr(self.serial_connection, "reset_input_buffer", None)
-                        if callable(reset_fn):
-                            reset_fn()
-                        else:
-                            flush_fn = getattr(self.serial_connection, "flushInput", None)
-                            if callable(flush_fn):
-                                flush_fn()
-                    except Exception:
-                        pass
-                    print(f"Port {port} opened. Flushing input.")
-                    self.status_label.config(text=f"Đã kết nối trên {port}")
-                    print(f"Connected to Arduino on {port}")
-                    
-                    # Tự động bắt đầu giám sát sau khi kết nối thành công
-                    self.start_monitoring() 
-                    return True
-                except serial.SerialException as e:
-                    print(f"Failed to connect on {port}: {e}")
-                    continue
-            self.status_label.config(text="Kết nối thất bại - Kiểm tra Arduino")
-            print("Failed to connect to Arduino.")
-            return False
-        except Exception as e:
-            print(f"Serial connection error: {e}")
-            self.status_label.config(text="Lỗi Serial - Kiểm tra kết nối")
-            return False
+        # Mỗi thiết bị mở cổng trên luồng đọc riêng (song song, không chặn luồng Tk);
+        # kết quả báo về qua on_device_status
+        if self.hub is not None:
+            self.hub.stop()
+        self.hub = multi_sensor.SensorHub(
+            self.devices,
+            self.SERIAL_PROTOCOL,
+            on_line=self.on_serial_line,
+            on_reading=self.on_serial_reading,
+            on_status=self.on_device_status,
+        ).start()
+        self.status_label.config(text="Đang kết nối tới Arduino...")
+
+    def on_serial_line(self, device_id, line):
+        # Gọi từ luồng đọc của thiết bị; khi đã dừng giám sát thì bỏ dòng (cổng vẫn được đọc để không dồn bộ đệm)
+        if self.is_running:
+            # Phân tích, cảnh báo, ghi DB và gửi thông báo đều chạy trong pipeline
+            self.pipeline.submit(line, device_id)
+
+    def on_serial_reading(self, device_id, voltage, turbidity):
+        if self.is_running:
+            self.pipeline.submit_reading(voltage, turbidity, device_id)
+
+    def on_device_status(self, device_id, state, detail):
+        # Gọi từ luồng đọc: không đụng tới Tk (hub.stop() trên luồng Tk đang join luồng này)
+        self.device_events.put((device_id, state, detail))
+
+    def apply_device_status(self, device_id, state, detail):
+        if self.hub is None:
+            return
+        connected = self.hub.connected()
+        # Mất kết nối hay mở cổng thất bại: SensorReader tự thử lại, chỉ cần báo trạng thái
+        if len(self.device_ids) == 1:
+            text = {
+                "connected": f"Đã kết nối trên {detail}",
+                "retrying": f"Kết nối thất bại - Kiểm tra Arduino (thử lại sau {detail:g} s)" if detail else None,
+                "lost": "Mất kết nối cảm biến! Đang kết nối lại...",
+            }.get(state)
+        else:
+            text = f"Đã kết nối {len(connected)}/{len(self.device_ids)} thiết bị"
+            if state in ("retrying", "lost"):
+                text += f" — {device_id}: {'mất kết nối' if state == 'lost' else 'không mở được cổng'}, đang thử lại"
+        if text:
+            self.status_label.config(text=text)
+        if state == "connected":
+            print(f"[{device_id}] Connected to Arduino on {detail}")
+            # Tự động bắt đầu giám sát sau khi kết nối thành công
+            self.start_monitoring()
 
     def start_monitoring(self):
-        if self.serial_connection and self.serial_connection.is_open:
+        if self.hub is not None and self.hub.connected():
             if not self.is_running: # Chỉ bắt đầu nếu chưa chạy
                 self.is_running = True
                 self.start_button.config(state=tk.DISABLED)
                 self.stop_button.config(state=tk.NORMAL)
-                self.status_label.config(text="Đang giám sát... (Nguồn: Arduino)")
-                self.reading_thread = threading.Thread(target=self.read_serial_data, daemon=True)
-                self.reading_thread.start()
-                self.last_log_time = time.time() # Reset đồng hồ log
+                self.status_label.config(text=f"Đang giám sát... (Nguồn: {', '.join(self.hub.connected())})")
                 print("Monitoring started.")
         else:
             self.status_label.config(text="Không tìm thấy cảm biến! Hãy kết nối lại.")
@@ -320,236 +597,181 @@ class TurbiditySensorGUI:
         self.status_label.config(text="Đã dừng giám sát.")
         print("Monitoring stopped.")
 
-    def read_serial_data(self):
-        while self.is_running and self.serial_connection and self.serial_connection.is_open:
-            try:
-                if self.serial_connection.in_waiting > 0:
-                    line = self.serial_connection.readline().decode('utf-8', errors='ignore').strip()
-                    if not line: continue
-                    
-                    # === SỬA LỖI: ĐÃ TẮT THÔNG BÁO DEBUG ===
-                    # print(f"Raw serial data: {line}") 
-                    
-                    try:
-                        voltage_mV, turbidity = self.parse_serial_line(line)
-                        self.update_gui(voltage_mV, turbidity)
-                    except ValueError as e:
-                        # Bỏ qua các dòng không phân tích được (như các dòng setup của Arduino)
-                        
-                        # === SỬA LỖI: ĐÃ TẮT THÔNG BÁO DEBUG ===
-                        # print(f"Lỗi phân tích dữ liệu (bỏ qua): {e} -- line: {line}")
-                        pass
-            except serial.SerialException as e:
-                print(f"Lỗi đọc serial (Mất kết nối?): {e}")
-                self.status_label.config(text="Mất kết nối cảm biến!")
-                self.stop_monitoring()
-                self.connect_button.config(state=tk.NORMAL) # Cho phép kết nối lại
-                break # Thoát khỏi vòng lặp đọc
-            except Exception as e:
-                print(f"Lỗi không xác định khi đọc: {e}")
-                time.sleep(1)
-
     def parse_serial_line(self, line: str):
-        # Hàm này đã chuẩn, không cần thay đổi
-        line = line.replace("Vôn", "VOLTAGE").replace("Độ đục", "TURBIDITY")
-        
-        # Chỉ tìm dòng có cả VOLTAGE và TURBIDITY
-        if "VOLTAGE" not in line or "TURBIDITY" not in line:
-            raise ValueError("Dòng không chứa dữ liệu hợp lệ")
-            
-        turb_match = re.search(r"TURBIDITY\s*[:=]\s*([-+]?\d*\.?\d+)", line, re.IGNORECASE)
-        if not turb_match: raise ValueError("Không tìm thấy TURBIDITY")
-        
-        turbidity = float(turb_match.group(1))
-        
-        volt_match = re.search(r"VOLT(?:AGE)?\s*[:=]\s*([-+]?\d*\.?\d+)\s*(mV|v)?", line, re.IGNORECASE)
-        if not volt_match: raise ValueError("Không tìm thấy VOLTAGE")
-        
-        volt_val = float(volt_match.group(1))
-        volt_unit = volt_match.group(2)
-        
-        # Logic phát hiện đơn vị (mV hay V)
-        voltage_mV = volt_val
-        if volt_unit and volt_unit.lower() == 'v':
-            voltage_mV = volt_val * 1000.0
-        elif not volt_unit and abs(volt_val) < 100: # Giả định nếu số quá nhỏ (<100) thì đó là Volt
-            voltage_mV = volt_val * 1000.0
-        
-        return float(voltage_mV), float(turbidity)
-
-    def update_gui(self, voltage, turbidity):
-        def _update():
-            self.voltage_label.config(text=f"{(voltage / 1000.0):.3f} V")
-            
-            # Lấy trạng thái và bootstyle tương ứng
-            status, status_bootstyle = self.get_water_status_bootstyle(turbidity)
-            
-            # Cập nhật nhãn trạng thái với màu tương ứng
-            self.water_status_label.config(text=status, bootstyle=status_bootstyle)
-            
-            # Lấy màu hex từ bootstyle để cập nhật chỉ báo canvas
-            color_map = {
-                'success': '#00bc8c',
-                'info': '#3498db',
-                'warning': '#f39c12',
-                'danger': '#e74c3c'
-            }
-            indicator_color = color_map.get(status_bootstyle, '#6B7280')
-            
-            # Cập nhật màu chấm chỉ báo
-            self.status_indicator.itemconfig(self.status_indicator_circle, fill=indicator_color)
-            
-            # Cập nhật Meter với giá trị và màu tương ứng
-            self.turbidity_gauge.configure(amountused=turbidity, bootstyle=status_bootstyle)
-            
-            # Lưu mẫu cho phân tích xu hướng
-            self.recent_samples.append((time.time(), turbidity))
-
-            # Cảnh báo tốc độ thay đổi ngắn hạn (1 phút): dự báo vấn đề trước khi vượt ngưỡng cao
+        # Đường nhanh cho định dạng firmware, regex biên dịch sẵn làm dự phòng (serial_parser.py)
+        return serial_parser.parse_serial_line(line)
+
+    def update_gui(self, snapshot):
+        # Gọi từ luồng analytics: mọi mẫu vào bộ đệm biểu đồ ngay tại đây (không qua bộ gộp nên không mất điểm),
+        # phần hiển thị chỉ ghi đè trạng thái mới nhất, không xếp callback Tk cho từng mẫu
+        with self.chart_lock:
+            self.chart_data[snapshot["device_id"]].append(snapshot["ts"], snapshot["turbidity"])
+        self.ui_scheduler.push(snapshot["device_id"], snapshot)
+
+    def drain_ui(self):
+        while True:
             try:
-                now_ts = time.time()
-                cutoff_short = now_ts - self.RATE_WINDOW_SEC
-                short_window = [s for s in self.recent_samples if s[0] >= cutoff_short]
-                if len(short_window) >= max(2, self.RATE_MIN_POINTS):
-                    t0s = short_window[0][0]
-                    ts2 = [(w[0] - t0s) / 60.0 for w in short_window]  # phút
-                    ys2 = [w[1] for w in short_window]
-                    mean_t2 = sum(ts2) / len(ts2)
-                    mean_y2 = sum(ys2) / len(ys2)
-                    denom2 = sum((t - mean_t2) ** 2 for t in ts2) or 1e-9
-                    slope2 = sum((t - mean_t2) * (y - mean_y2) for t, y in zip(ts2, ys2)) / denom2
-                    delta2 = ys2[-1] - ys2[0]
-                    dur2 = max(1e-6, ts2[-1] - ts2[0])
-                    if slope2 >= self.RATE_ALERT_SLOPE and delta2 >= self.RATE_MIN_DELTA:
-                        if (now_ts - self.last_rate_alert_at) >= self.RATE_ALERT_COOLDOWN_SEC:
-                            self.last_rate_alert_at = now_ts
-                            try:
-                                self.send_notification(
-                                    f"📈 Cảnh báo xu hướng: Nước đang đục nhanh! ~{slope2:.0f} NTU/min (Δ{delta2:.1f} NTU/{dur2:.1f} min)",
-                                    skip_cooldown=True,
-                                )
-                            except Exception:
-                                pass
-            except Exception:
-                pass
-
-            # Gửi Telegram mỗi khi trạng thái thay đổi (không giới hạn tần suất)
-            if not hasattr(self, 'last_status_sent'):
-                self.last_status_sent = None
-            if status != self.last_status_sent:
-                try:
-                    self.send_notification(f"Trạng thái thay đổi: {status} — {turbidity:.2f} NTU", skip_cooldown=True)
-                except Exception:
-                    pass
-                self.last_status_sent = status
-
-            # Logic Cảnh báo Đa cấp
-            new_alert_level = 0
-            if turbidity > 100: new_alert_level = 3
-            elif turbidity > 50: new_alert_level = 2
-            elif turbidity > 10: new_alert_level = 1
-            
-            if new_alert_level > self.current_alert_level:
-                # Tắt tất cả popup: không hiện thông báo ở mọi mức cảnh báo
-                self.current_alert_level = new_alert_level
-                # Gửi lệnh tới Arduino khi vượt mức rất đục
-                if new_alert_level >= 3:
-                    self.send_serial_command('A')
-                    self.send_notification(f"Cảnh báo: Độ đục rất cao ({turbidity:.2f} NTU)")
-            elif new_alert_level == 0 and self.current_alert_level > 0:
-                self.current_alert_level = 0
-                print("Trạng thái cảnh báo đã reset (nước trong trở lại).")
-                # Có thể gửi lệnh tắt nếu muốn
-                self.send_serial_command('S')
-
-            # Cập nhật Biểu đồ
-            self.turbidity_data.append(turbidity)
-            self.timestamps.append(datetime.now().strftime("%H:%M:%S"))
-            if len(self.turbidity_data) > 50:
-                self.turbidity_data = self.turbidity_data[-50:]
-                self.timestamps = self.timestamps[-50:]
-            
-            self.line.set_data(range(len(self.turbidity_data)), self.turbidity_data)
-
-            # Vẽ overlay Xu hướng (gấp khúc) với hồi quy tuyến tính lăn (rolling)
+                self.apply_device_status(*self.device_events.get_nowait())
+            except queue.Empty:
+                break
+        # Nhịp vẽ cố định: mỗi thiết bị vẽ tối đa một lần với dữ liệu mới nhất
+        for snapshot in self.ui_scheduler.drain().values():
+            self.render_snapshot(snapshot)
+        if self.root.winfo_exists():
+            self.root.after(self.UI_TICK_MS, self.drain_ui)
+
+    def render_snapshot(self, snapshot):
+        # Điểm biểu đồ đã được ghi nối trên luồng analytics; chỉ vẽ khi đó là thiết bị đang chọn
+        device_id = snapshot["device_id"]
+        self.latest_snapshots[device_id] = snapshot
+        if device_id == self.selected_device:
+            self.draw_snapshot(snapshot)
+
+    def on_device_selected(self, _event=None):
+        self.selected_device = self.device_var.get()
+        self.backfill_chart(self.selected_device)
+        snapshot = self.latest_snapshots.get(self.selected_device)
+        if snapshot is not None:
+            self.draw_snapshot(snapshot)
+
+    def on_chart_window_selected(self, _event=None):
+        label = self.chart_window_var.get()
+        self.chart_window = self.CHART_WINDOWS[label]
+        recent = self.chart_window is None
+        # Ít điểm: có marker, chừa lề phải rộng; khoảng dài: đường liền, lề hẹp (ít phải dịch trục hơn so với độ rộng)
+        self.line.set_marker('o' if recent else 'None')
+        self.chart_renderer.x_margin = 0.25 if recent else 0.02
+        self.ax.set_title(f"Lịch sử Độ đục ({label})", color="#ffffff")
+        self.chart_renderer.invalidate()
+        self.backfill_chart(self.selected_device)
+        snapshot = self.latest_snapshots.get(self.selected_device)
+        if snapshot is not None:
+            self.draw_snapshot(snapshot)
+
+    def backfill_chart(self, device_id):
+        # Nạp bù từ DB phần lịch sử chưa có trong bộ đệm (vd. vừa mở ứng dụng mà chọn 24 giờ)
+        if self.chart_window is None:
+            return
+        start = time.time() - self.chart_window
+        series = self.chart_data[device_id]
+        with self.chart_lock:
+            first = series.first_ts()
+        if (first is not None and first <= start) or self.chart_backfilled.get(device_id, float("inf")) <= start:
+            return
+        self.chart_backfilled[device_id] = start
+        end_ms = int(first * 1000) - 1 if first is not None else None
+        # Một thiết bị: các dòng cũ có thể mang nguồn khác (trước khi có mã thiết bị) nên không lọc
+        source = device_id if len(self.device_ids) > 1 else None
+        try:
+            conn = turbidity_db.connect(self.DB_PATH)
             try:
-                cutoff = time.time() - self.TREND_LINE_WINDOW_SEC
-                window = [s for s in self.recent_samples if s[0] >= cutoff]
-                if len(window) >= 2:
-                    t0 = window[0][0]
-                    ts = [(w[0] - t0) / 60.0 for w in window]  # phút
-                    ys = [w[1] for w in window]
-                    roll_min = max(0.1, self.TREND_ROLLING_WINDOW_SEC / 60.0)  # phút
-                    y_fit_series = []
-                    for i in range(len(ts)):
-                        # Chọn đoạn con trong (ts[i] - roll_min, ts[i])
-                        left_t = ts[i] - roll_min
-                        sub_t = [t for t in ts[: i + 1] if t >= left_t]
-                        sub_y = ys[len(ts[: i + 1]) - len(sub_t) : i + 1]
-                        if len(sub_t) >= 2:
-                            mt = sum(sub_t) / len(sub_t)
-                            my = sum(sub_y) / len(sub_y)
-                            den = sum((t - mt) ** 2 for t in sub_t) or 1e-9
-                            sl = sum((t - mt) * (y - my) for t, y in zip(sub_t, sub_y)) / den
-                            itc = my - sl * mt
-                            y_fit_series.append(sl * ts[i] + itc)
-                        else:
-                            # Fallback: dùng giá trị thực hoặc bản sao giá trị trước đó để nối mượt
-                            y_fit_series.append(y_fit_series[-1] if y_fit_series else ys[i])
-
-                    tail_n = min(len(window), len(self.turbidity_data))
-                    x_start = max(0, len(self.turbidity_data) - tail_n)
-                    x_idx = list(range(x_start, len(self.turbidity_data)))
-                    self.trend_line.set_data(x_idx, y_fit_series[-tail_n:])
-                else:
-                    self.trend_line.set_data([], [])
-            except Exception:
-                self.trend_line.set_data([], [])
-            
-            if len(self.turbidity_data) > 1:
-                tick_skip = max(1, len(self.turbidity_data) // 5)
-                self.ax.set_xticks(range(0, len(self.turbidity_data), tick_skip))
-                self.ax.set_xticklabels(self.timestamps[::tick_skip], rotation=30, ha='right')
+                rows = turbidity_db.series(conn, int(start * 1000), end_ms, source=source)
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Không nạp được lịch sử biểu đồ: {e}")
+            return
+        if rows:
+            data = np.array(rows, dtype=np.float64)
+            with self.chart_lock:
+                series.prepend(data[:, 0] / 1000.0, data[:, 1])
+
+    def draw_snapshot(self, snapshot):
+        voltage = snapshot["voltage"]
+        turbidity = snapshot["turbidity"]
+        status = snapshot["status"]
+        status_bootstyle = snapshot["bootstyle"]
+
+        self.voltage_label.config(text=f"{(voltage / 1000.0):.3f} V")
+
+        # Cập nhật nhãn trạng thái với màu tương ứng
+        self.water_status_label.config(text=status, bootstyle=status_bootstyle)
+
+        # Lấy màu hex từ bootstyle để cập nhật chỉ báo canvas
+        color_map = {
+            'success': '#00bc8c',
+            'info': '#3498db',
+            'warning': '#f39c12',
+            'danger': '#e74c3c'
+        }
+        indicator_color = color_map.get(status_bootstyle, '#6B7280')
+
+        # Cập nhật màu chấm chỉ báo
+        self.status_indicator.itemconfig(self.status_indicator_circle, fill=indicator_color)
+
+        # Cập nhật Meter với giá trị và màu tương ứng
+        self.turbidity_gauge.configure(amountused=turbidity, bootstyle=status_bootstyle)
+
+        # Cập nhật Biểu đồ (trục x là timestamp, nhãn HH:MM:SS do renderer định dạng)
+        # tail()/since() là view vào bộ đệm mà luồng analytics đang ghi: lấy bản sao (đã rút gọn) trong khóa
+        series = self.chart_data[snapshot["device_id"]]
+        y_fit_series = snapshot["trend"]
+        width_px = max(int(self.ax.bbox.width), 100)
+        with self.chart_lock:
+            if self.chart_window is None:
+                xs, ys = series.tail(self.CHART_RECENT_POINTS)
+                xs, ys = xs.copy(), ys.copy()
             else:
-                self.ax.set_xticks([])
-                self.ax.set_xticklabels([])
-                
-            self.ax.relim()
-            self.ax.autoscale_view(True, True)
-            self.figure.tight_layout()
-            self.canvas_graph.draw()
-
-            # Ghi log mỗi lần cập nhật để đồng bộ thời gian thực với app mobile
-            current_time = time.time()
-            self.log_to_db(voltage, turbidity, status)
-            self.last_turbidity = turbidity
-            self.last_voltage = voltage
-            self.last_log_time = current_time
-
-            # Phát hiện xu hướng tăng nhanh
-            try:
-                if self.is_trend_rising():
-                    self.send_notification(f"Cảnh báo xu hướng: Độ đục đang tăng nhanh (>{self.TREND_ALERT_SLOPE:.0f} NTU/phút)")
-                    self.send_serial_command('A')
-            except Exception:
-                pass
-
-        # Đảm bảo GUI cập nhật trên luồng chính
-        if self.root.winfo_exists():
-            self.root.after(0, _update)
+                # ~1 bucket min-max mỗi 2 pixel; ranh giới bucket cố định theo thời gian nên đường không nhấp nháy
+                xs, ys = series.since(time.time() - self.chart_window)
+                xs, ys = downsample(xs, ys, width_px, bucket_width=self.chart_window / (width_px / 2))
+            # Overlay Xu hướng đã được tính sẵn trên luồng analytics, khớp với các điểm (chưa rút gọn) tính tới
+            # snapshot này — bộ đệm có thể đã có thêm điểm mới hơn
+            all_ts = series.ts
+            end = int(np.searchsorted(all_ts, snapshot["ts"], side="right"))
+            trend_xs = all_ts[max(0, end - len(y_fit_series)):end].copy()
+        tail_n = min(len(y_fit_series), len(trend_xs))
+        self.chart_renderer.update(xs, ys, trend_xs[len(trend_xs) - tail_n:], y_fit_series[len(y_fit_series) - tail_n:])
+
+    def persist_result(self, result):
+        # Ghi log mỗi mẫu để đồng bộ thời gian thực với app mobile (luồng persistence)
+        self.log_to_db(result["voltage"], result["turbidity"], result["status"], ts=result["ts"],
+                       raw_turbidity=result["raw_turbidity"], device_id=result["device_id"])
+        if self.live_feed is not None:
+            # Đẩy ngay cho dashboard (không chờ lô DB commit); làm tròn giống dòng ghi DB
+            raw = result["raw_turbidity"]
+            self.live_feed.publish({
+                "ts_ms": int(result["ts"] * 1000),
+                "voltage": round(result["voltage"], 0),
+                "turbidity": round(result["turbidity"], 2),
+                "status": result["status"],
+                "source": result["device_id"] or self.device_ids[0],
+                "raw_turbidity": round(raw, 2) if raw is not None else None,
+            })
+        self.last_readings[result["device_id"]] = (result["voltage"], result["turbidity"], time.time())
 
     def periodic_log(self):
-        if self.is_running and self.last_turbidity is not None:
+        if self.is_running:
             current_time = time.time()
-            if (current_time - self.last_log_time) >= self.log_interval:
-                # print(f"Logging (periodic) do đã qua 1 giờ: {self.last_turbidity:.2f} NTU") # Đã tắt debug
-                status, _ = self.get_water_status_bootstyle(self.last_turbidity)
-                self.log_to_db(self.last_voltage, self.last_turbidity, status)
-                self.last_log_time = current_time
+            for device_id, (voltage, turbidity, logged_at) in list(self.last_readings.items()):
+                if (current_time - logged_at) >= self.log_interval:
+                    status, _ = self.get_water_status_bootstyle(turbidity)
+                    self.log_to_db(voltage, turbidity, status, device_id=device_id)
+                    self.last_readings[device_id] = (voltage, turbidity, current_time)
 
         if self.root.winfo_exists():
             self.root.after(10000, self.periodic_log) # Kiểm tra mỗi 10 giây
 
+    def periodic_compaction(self):
+        # Dọn dữ liệu trong luồng nền; compact() dùng transaction nhỏ nên không chặn luồng ghi
+        if self.compaction_thread is None or not self.compaction_thread.is_alive():
+            def _run():
+                try:
+                    # Niêm phong các ngày trọn vẹn vào kho lưu trữ trước khi dữ liệu thô bị dọn
+                    sealed = columnar_archive.seal_pending(self.DB_PATH)
+                    if sealed:
+                        print(f"Đã lưu trữ các ngày: {sealed}")
+                    deleted = turbidity_db.compact(self.DB_PATH)
+                    if any(deleted.values()):
+                        print(f"Đã dọn dữ liệu quá hạn: {deleted}")
+                except Exception as e:
+                    print(f"Lỗi dọn dữ liệu: {e}")
+            self.compaction_thread = threading.Thread(target=_run, daemon=True)
+            self.compaction_thread.start()
+
+        if self.root.winfo_exists():
+            self.root.after(self.COMPACTION_INTERVAL_SEC * 1000, self.periodic_compaction)
+
     # ====== Cấu hình Telegram (.env) ======
     def load_env_settings(self):
         # Ưu tiên đọc từ .env; nếu không có thì dùng os.environ
@@ -584,120 +806,74 @@ class TurbiditySensorGUI:
 
     # Hàm tiện ích mới: trả về (status_text, bootstyle_name)
     def get_water_status_bootstyle(self, turbidity):
-        if turbidity < 1: return "Nước cất", "success"
-        elif turbidity <= 10: return "Nước trong", "info"
-        elif turbidity <= 50: return "Nước hơi đục", "warning"
-        elif turbidity <= 100: return "Nước đục", "danger"
-        else: return "Nước rất đục", "danger"
+        return get_water_status_bootstyle(turbidity)
 
     # Hàm get_water_status cũ (không còn dùng)
     # def get_water_status(self, turbidity): ...
         
     def init_db(self):
         try:
-            conn = sqlite3.connect(self.DB_PATH)
-            cur = conn.cursor()
-            cur.execute(
-                """
-                CREATE TABLE IF NOT EXISTS readings (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    ts TEXT NOT NULL,
-                    voltage REAL,
-                    turbidity REAL,
-                    status TEXT,
-                    source TEXT
-                )
-                """
-            )
-            conn.commit()
-            conn.close()
+            turbidity_db.init_db(self.DB_PATH)
+            # Luồng ghi giữ kết nối mở, WAL + gom commit theo số dòng/thời gian
+            self.db_writer = turbidity_db.BatchedDBWriter(
+                self.DB_PATH, on_flush=self.append_ndjson_log if self.NDJSON_LOG_PATH else None).start()
+            # CSDL schema v1 cũ: chuyển sang v2 trong nền, VIEW `readings` giữ tương thích trong lúc chuyển
+            if turbidity_db.needs_migration(self.DB_PATH):
+                threading.Thread(target=turbidity_db.migrate_to_v2, args=(self.DB_PATH,), daemon=True).start()
         except Exception as e:
             print(f"Lỗi khởi tạo DB: {e}")
 
-    def log_to_db(self, voltage, turbidity, status):
-        try:
-            ts = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            conn = sqlite3.connect(self.DB_PATH)
-            cur = conn.cursor()
-            cur.execute(
-                "INSERT INTO readings (ts, voltage, turbidity, status, source) VALUES (?, ?, ?, ?, ?)",
-                (ts, round(voltage, 0), round(turbidity, 2), status, "Arduino Uno")
-            )
-            conn.commit()
-            conn.close()
-        except Exception as e:
-            print(f"Lỗi ghi DB: {e}")
+    def log_to_db(self, voltage, turbidity, status, ts=None, raw_turbidity=None, device_id=None):
+        if self.db_writer is None:
+            return
+        ts_ms = int((ts if ts is not None else time.time()) * 1000)
+        raw = round(raw_turbidity, 2) if raw_turbidity is not None else None
+        # Nguồn của dòng = mã thiết bị (mặc định "Arduino Uno" như trước)
+        source = device_id or self.device_ids[0]
+        self.db_writer.write(ts_ms, round(voltage, 0), round(turbidity, 2), status, source, raw)
+
+    def append_ndjson_log(self, rows):
+        # Cả lô được ghi bằng một lần write sau khi DB đã commit (luồng ghi DB)
+        ndjson_log.append_records(self.NDJSON_LOG_PATH, [ndjson_log.to_record(row) for row in rows])
 
     def is_trend_rising(self):
-        # Compute slope over last TREND_WINDOW_SEC seconds
-        if len(self.recent_samples) < 2:
-            return False
-        cutoff = time.time() - self.TREND_WINDOW_SEC
-        window = [s for s in self.recent_samples if s[0] >= cutoff]
-        if len(window) < 2:
-            return False
-        ntu_start = window[0][1]
-        ntu_end = window[-1][1]
-        dt_min = max(1e-6, (window[-1][0] - window[0][0]) / 60.0)
-        slope = (ntu_end - ntu_start) / dt_min
-        return slope >= self.TREND_ALERT_SLOPE
-
-    def send_serial_command(self, cmd: str):
-        # Avoid spamming; send at most once per 10s per type
-        now = time.time()
-        if self.serial_connection and self.serial_connection.is_open:
-            if self.last_command_type != cmd or (now - self.last_command_sent_at) >= 10:
-                try:
-                    self.serial_connection.write(cmd.encode('utf-8'))
-                    self.last_command_type = cmd
-                    self.last_command_sent_at = now
-                except Exception as e:
-                    print(f"Lỗi gửi lệnh tới Arduino: {e}")
-
-    def send_notification(self, message: str, skip_cooldown: bool = False):
-        # Telegram via env vars TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID
-        token = os.environ.get("TELEGRAM_BOT_TOKEN")
-        chat_id = os.environ.get("TELEGRAM_CHAT_ID")
-        now = time.time()
-        if not token or not chat_id:
-            return
-        if (not skip_cooldown) and (now - self.last_notify_at) < self.TELEGRAM_MIN_INTERVAL_SEC:
-            return
-        try:
-            api_url = f"https://api.telegram.org/bot{token}/sendMessage"
-            params = urlencode({
-                "chat_id": chat_id,
-                "text": message
-            }).encode("utf-8")
-            req = urllib.request.Request(api_url, data=params)
-            # SSL context: dùng certifi nếu có; có thể bật bỏ qua verify qua env var (không khuyến nghị)
-            insecure_skip = os.environ.get("TELEGRAM_INSECURE_SKIP_VERIFY") == "1"
-            if insecure_skip:
-                print("[Cảnh báo] Đang bỏ qua xác thực SSL (TELEGRAM_INSECURE_SKIP_VERIFY=1). Chỉ sử dụng tạm thời để kiểm tra.")
-                context = ssl._create_unverified_context()
-            else:
-                context = ssl.create_default_context()
-                if HAS_CERTIFI:
-                    try:
-                        context.load_verify_locations(certifi.where())
-                    except Exception:
-                        pass
-
-            with urllib.request.urlopen(req, context=context, timeout=10) as resp:
-                _ = resp.read()
-            self.last_notify_at = now
-        except Exception as e:
-            err = str(e)
-            print(f"Gửi Telegram thất bại: {e}")
-            if "CERTIFICATE_VERIFY_FAILED" in err.upper():
-                print("\nGợi ý khắc phục SSL:\n- Nếu đang ở mạng công ty/proxy, hãy cài chứng chỉ CA nội bộ vào Windows Trusted Root.\n- Hoặc cài certifi: pip install certifi (ứng dụng sẽ tự dùng certifi nếu có).\n- Hoặc đặt biến môi trường SSL_CERT_FILE hoặc REQUESTS_CA_BUNDLE trỏ tới file CA bundle.\n- Chỉ để test tạm thời: set TELEGRAM_INSECURE_SKIP_VERIFY=1 (không khuyến nghị dùng lâu dài).\n")
+        return self.analytics.is_trend_rising()
+
+    def send_serial_command(self, cmd: str, device_id=None):
+        # Lệnh chỉ tới đúng thiết bị phát sinh cảnh báo; chống spam 10 s mỗi loại lệnh nằm trong SensorReader
+        if self.hub is not None:
+            self.hub.send_command(cmd, device_id or self.device_ids[0])
+
+    def send_notification(self, message: str, skip_cooldown: bool = False, device_id=None):
+        # Không chặn: tin được gộp/giới hạn tốc độ/thử lại trên luồng của NotificationDispatcher
+        self.notifier.submit(message, channel=device_id or self.device_ids[0], skip_cooldown=skip_cooldown)
+
+    def telegram_credentials(self):
+        # Telegram via env vars TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID (đọc lại mỗi lần gửi)
+        return os.environ.get("TELEGRAM_BOT_TOKEN"), os.environ.get("TELEGRAM_CHAT_ID")
 
     def on_closing(self):
         print("Closing application...")
         self.stop_monitoring()
-        if self.serial_connection and self.serial_connection.is_open:
-            self.serial_connection.close()
-            print("Serial connection closed.")
+        self.pipeline.stop()
+        print(f"Pipeline stats: {self.pipeline.stats()}")
+        # Gửi nốt các thông báo đang gộp trước khi thoát
+        self.notifier.stop()
+        print(f"Notifier stats: {self.notifier.stats()}")
+        if self.live_feed is not None:
+            self.live_feed.stop()
+            print(f"Live feed stats: {self.live_feed.stats()}")
+        print(f"UI stats: {self.ui_scheduler.stats()} (chart frames: {self.chart_renderer.frames}, "
+              f"full draws: {self.chart_renderer.full_draws})")
+        if self.hub is not None:
+            self.hub.stop()
+            # Mỗi thiết bị: cổng, số dòng, số lệnh đã gửi (và thống kê khung nếu dùng giao thức nhị phân)
+            print(f"Serial stats: {self.hub.stats()}")
+            print("Serial connections closed.")
+        if self.db_writer is not None:
+            # Ghi nốt các dòng còn trong bộ đệm trước khi thoát
+            self.db_writer.close()
+            print(f"DB writer flushed: {self.db_writer.stats()}")
         self.root.destroy()
 
 def main():
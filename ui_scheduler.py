@@ -0,0 +1,49 @@
+import threading
+
+
+class CoalescingScheduler:
+    """Gộp snapshot từ luồng analytics, luồng Tk lấy ra theo nhịp cố định.
+
+    `push(key, snapshot)` (luồng bất kỳ) chỉ ghi đè trạng thái mới nhất của `key`
+    (mỗi thiết bị một key) — không tạo callback Tk nào, nên hàng đợi sự kiện Tk không
+    phình ra khi mẫu đến nhanh hơn tốc độ vẽ. `drain()` (luồng Tk, mỗi `tick_ms`) trả về
+    {key: snapshot mới nhất}. Bỏ snapshot cũ không mất dữ liệu: điểm biểu đồ được ghi thẳng
+    vào bộ đệm của biểu đồ ở luồng analytics, bộ gộp chỉ lo phần chữ/trạng thái.
+
+    Bộ đếm:
+      - pushed:  số snapshot nhận vào
+      - drained: số snapshot được vẽ (một mỗi key mỗi nhịp)
+      - merged:  số snapshot bị thay bằng snapshot mới hơn trước khi kịp vẽ
+    """
+
+    def __init__(self, tick_ms=100):
+        self.tick_ms = tick_ms
+        self._lock = threading.Lock()
+        self._latest = {}
+        self.pushed = 0
+        self.drained = 0
+        self.merged = 0
+
+    def push(self, key, snapshot):
+        with self._lock:
+            self.pushed += 1
+            if key in self._latest:
+                self.merged += 1
+            self._latest[key] = snapshot
+
+    def drain(self):
+        with self._lock:
+            if not self._latest:
+                return {}
+            latest, self._latest = self._latest, {}
+            self.drained += len(latest)
+        return latest
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pushed": self.pushed,
+                "drained": self.drained,
+                "merged": self.merged,
+                "pending": len(self._latest),
+            }